@@ -0,0 +1,356 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Load test for served repos.
+#
+# Generates a synthetic directory repo (projects x versions), serves it on
+# localhost in a separate process, and drives concurrent simulated
+# `pip install`s against it: a project page request followed by a request
+# for one of the linked package files, from a pool of keep-alive clients.
+#
+#     python -m pyrene.benchmark --projects 100 --versions 10 --clients 32
+#
+# With --url, an already running index is load tested instead.
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+try:
+    from httplib import HTTPConnection, HTTPException
+    from urlparse import urljoin, urlsplit
+except ImportError:
+    from http.client import HTTPConnection, HTTPException
+    from urllib.parse import urljoin, urlsplit
+
+from .server import PackageServer, DEFAULT_WORKERS
+from . import simple
+
+
+def generate_repo(directory, projects, versions, file_size):
+    '''Fill directory with projects x versions sdists of file_size bytes'''
+    content = b'x' * file_size
+    for p in range(projects):
+        for v in range(versions):
+            filename = 'project{}-1.{}.tar.gz'.format(p, v)
+            with open(os.path.join(directory, filename), 'wb') as f:
+                f.write(content)
+
+
+def _serve(directory, workers, ports):
+    server = PackageServer()
+    server.directory = directory
+    server.interface = '127.0.0.1'
+    server.port = '0'
+    server.workers = workers
+    httpd = server.make_httpd()
+    # the access log would dominate the measurements
+    sys.stderr = open(os.devnull, 'w')
+    ports.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+def serve_in_background(directory, workers):
+    '''
+    Serve directory on localhost from a separate process.
+
+    Returns (process, index url).
+    '''
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_serve, args=(directory, workers, ports)
+    )
+    process.daemon = True
+    process.start()
+    port = ports.get(timeout=30)
+    return process, 'http://127.0.0.1:{}/simple/'.format(port)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    position = int(round(q * (len(sorted_values) - 1)))
+    return sorted_values[position]
+
+
+class Results(object):
+
+    def __init__(self):
+        # kind -> latencies of successful requests
+        self.latencies = {}
+        # kind -> error count
+        self.errors = {}
+        self.bytes_received = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, kind, latency, size):
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(latency)
+            self.bytes_received += size
+
+    def add_error(self, kind):
+        with self._lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+    @property
+    def request_count(self):
+        return (
+            sum(len(latencies) for latencies in self.latencies.values())
+            + sum(self.errors.values())
+        )
+
+    def report(self):
+        lines = []
+        duration = self.duration or 1e-9
+        lines.append(
+            '{} requests in {:.2f}s: {:.1f} requests/s, {:.2f} MB/s'
+            .format(
+                self.request_count, self.duration,
+                self.request_count / duration,
+                self.bytes_received / duration / 1024 / 1024,
+            )
+        )
+        for kind in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies.get(kind, ()))
+            errors = self.errors.get(kind, 0)
+            count = len(latencies) + errors
+            lines.append(
+                '{}: {} requests, p50 {:.1f}ms, p99 {:.1f}ms,'
+                ' {} errors ({:.2%})'
+                .format(
+                    kind, count,
+                    percentile(latencies, 0.5) * 1000,
+                    percentile(latencies, 0.99) * 1000,
+                    errors, float(errors) / count,
+                )
+            )
+        return lines
+
+
+class Client(object):
+
+    '''A keep-alive connection, reopened after errors'''
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connection = None
+
+    def get(self, path):
+        '''(status, body) - raises IOError or HTTPException on errors'''
+        if self.connection is None:
+            self.connection = HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        try:
+            self.connection.request('GET', path)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class LoadTest(object):
+
+    '''
+    `requests` simulated installs by `clients` concurrent clients.
+
+    An install requests a random project page, then a random package file
+    linked from it; index_ratio of the installs start with the index page.
+    '''
+
+    def __init__(
+            self, index_url, clients=8, requests=1000, index_ratio=0.0,
+            timeout=30, seed=None):
+        self.index_url = index_url
+        self.clients = clients
+        self.requests = requests
+        self.index_ratio = index_ratio
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        split = urlsplit(index_url)
+        self.host = split.hostname
+        self.port = split.port or 80
+        self.index_path = split.path
+        self.projects = []
+        self._remaining = requests
+        self._lock = threading.Lock()
+
+    def get_projects(self):
+        client = Client(self.host, self.port, self.timeout)
+        try:
+            status, body = client.get(self.index_path)
+        finally:
+            client.close()
+        if status != 200:
+            raise IOError('{}: HTTP {}'.format(self.index_url, status))
+        return simple.parse_project_names(
+            body.decode('utf8'), self.index_url
+        )
+
+    def run(self):
+        self.projects = self.get_projects()
+        if not self.projects:
+            raise IOError('{}: no projects'.format(self.index_url))
+        results = Results()
+        threads = [
+            threading.Thread(target=self._run_client, args=(results,))
+            for _ in range(self.clients)
+        ]
+        results.started = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results.finished = time.time()
+        return results
+
+    def _take(self):
+        with self._lock:
+            if self._remaining <= 0:
+                return None
+            self._remaining -= 1
+            return (
+                self.random.random() < self.index_ratio,
+                self.random.choice(self.projects),
+                self.random.random(),
+            )
+
+    def _run_client(self, results):
+        client = Client(self.host, self.port, self.timeout)
+        try:
+            while True:
+                work = self._take()
+                if work is None:
+                    break
+                self._install(client, results, *work)
+        finally:
+            client.close()
+
+    def _request(self, client, results, kind, path):
+        started = time.time()
+        try:
+            status, body = client.get(path)
+        except (IOError, socket.error, HTTPException):
+            results.add_error(kind)
+            return None
+        if status != 200:
+            results.add_error(kind)
+            return None
+        results.add(kind, time.time() - started, len(body))
+        return body
+
+    def _install(self, client, results, with_index, project, choice):
+        if with_index:
+            self._request(client, results, 'index', self.index_path)
+        project_url = simple.project_url(self.index_url, project)
+        body = self._request(
+            client, results, 'project', urlsplit(project_url).path
+        )
+        if body is None:
+            return
+        links = simple.parse_links(body.decode('utf8'), project_url)
+        if not links:
+            return
+        link = links[int(choice * len(links))]
+        self._request(
+            client, results, 'file',
+            urlsplit(urljoin(project_url, link.url)).path
+        )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m pyrene.benchmark',
+        description='Load test the built-in package index server',
+    )
+    parser.add_argument(
+        '--url',
+        help='index to load test (default: serve a generated repo)'
+    )
+    parser.add_argument('--projects', type=int, default=100)
+    parser.add_argument('--versions', type=int, default=10)
+    parser.add_argument(
+        '--file-size', type=int, default=64 * 1024,
+        help='size of generated package files in bytes'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=DEFAULT_WORKERS,
+        help='server worker threads'
+    )
+    parser.add_argument(
+        '--clients', type=int, default=8, help='concurrent clients'
+    )
+    parser.add_argument(
+        '--requests', type=int, default=1000, help='simulated installs'
+    )
+    parser.add_argument(
+        '--index-ratio', type=float, default=0.0,
+        help='fraction of installs also requesting the index page'
+    )
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    directory = process = None
+    index_url = args.url
+    try:
+        if index_url is None:
+            directory = tempfile.mkdtemp(suffix='.pyrene-benchmark')
+            generate_repo(
+                directory, args.projects, args.versions, args.file_size
+            )
+            process, index_url = serve_in_background(directory, args.workers)
+            print(
+                'Serving {} projects x {} versions ({} bytes each)'
+                ' with {} workers at {}'
+                .format(
+                    args.projects, args.versions, args.file_size,
+                    args.workers, index_url
+                )
+            )
+
+        load_test = LoadTest(
+            index_url, args.clients, args.requests, args.index_ratio,
+            args.timeout, args.seed
+        )
+        print(
+            '{} installs by {} clients'.format(args.requests, args.clients)
+        )
+        results = load_test.run()
+        for line in results.report():
+            print(line)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+        if directory is not None:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
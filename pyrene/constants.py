@@ -6,6 +6,7 @@ class REPO:
     VOLATILE = 'volatile'
     SERVE_INTERFACE = 'interface'
     SERVE_PORT = 'port'
+    SERVE_WORKERS = 'workers'
     SERVE_USERNAME = 'username'
     SERVE_PASSWORD = 'password'
 
@@ -16,11 +17,34 @@ class REPO:
     DOWNLOAD_URL = 'download_url'
     UPLOAD_URL = 'upload_url'
 
+    # size budget of directory repos (e.g. 10G) and what to remove first
+    CACHE_SIZE = 'cache_size'
+    CACHE_POLICY = 'cache_policy'
+
+    # members of union repos, in order of precedence
+    REPOS = 'repos'
+
+    # serving http repos through a directory repo as pull-through cache
+    CACHE_REPO = 'cache_repo'
+    CACHE_TTL = 'cache_ttl'
+
+    # copies download wheels (with sdists as fallback) instead of sdists
+    PREFER_WHEELS = 'prefer_wheels'
+
+    # directory repos build wheels of uploaded sdists, keeping both
+    BUILD_WHEELS = 'build_wheels'
+
+    # what copies into a repo are for, e.g. 3.9, manylinux2014_x86_64, cp39
+    TARGET_PYTHON_VERSION = 'target_python_version'
+    TARGET_PLATFORM = 'target_platform'
+    TARGET_ABI = 'target_abi'
+
 
 class REPOTYPE:
     '''Values for REPO.TYPE'''
     DIRECTORY = 'directory'
     HTTP = 'http'
+    UNION = 'union'
 
 
 MAX_HISTORY_SIZE = 100
@@ -0,0 +1,310 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Dependency graph of the package files in a directory repo.
+#
+# Requirements are read from the package files themselves (wheel METADATA,
+# sdist requires.txt/PKG-INFO) once, and kept with the file's size and
+# mtime next to the metadata files (so the repo directory itself does not
+# change), so later uses only read new or changed files.
+# Closures of requirements are then computed in-process, without pip, and
+# the files depending on a project are looked up in a reverse index.
+
+import json
+import os
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
+
+import pkg_resources
+
+from .packages import is_package_file, parse_filename, normalize_name
+from .packages import read_dependency_metadata, select_file
+from .packages import METADATA_DIRECTORY
+
+
+def iter_required_projects(requirements):
+    '''(normalized project name, requirement) of requirements'''
+    for text in requirements or ():
+        try:
+            requirement = pkg_resources.Requirement.parse(text)
+        except ValueError:
+            continue
+        yield normalize_name(requirement.project_name), text
+
+
+class DependencyGraph(object):
+
+    '''
+    Requirements of the package files in directory.
+
+    Files whose requirements are not known from their metadata have None,
+    their Requires-Python is kept too.
+    '''
+
+    STATE_FILE = 'dependencies.json'
+
+    def __init__(self, directory, workers=4):
+        self.directory = directory
+        self.workers = workers
+        # filename -> [size, mtime, requirements or None,
+        #              Requires-Python or None]
+        self.files = {}
+        # project -> filenames, recomputed after changes
+        self._projects = None
+        # project -> {filename: requirement}, kept up to date once built
+        self._dependents = None
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def state_directory(self):
+        return os.path.join(self.directory, METADATA_DIRECTORY)
+
+    @property
+    def state_path(self):
+        return os.path.join(self.state_directory, self.STATE_FILE)
+
+    def load(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            return
+        with self._lock:
+            for filename, entry in state.items():
+                self.files.setdefault(filename, list(entry))
+            self._projects = None
+            self._dependents = None
+
+    def save(self):
+        with self._lock:
+            state = dict(self.files)
+        try:
+            os.makedirs(self.state_directory)
+        except OSError:
+            # exists, or fails below
+            pass
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.state_directory, prefix=self.STATE_FILE
+        )
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.rename(temp_path, self.state_path)
+        except (IOError, OSError):
+            os.remove(temp_path)
+            raise
+
+    def _stat(self, filename):
+        try:
+            stat = os.stat(os.path.join(self.directory, filename))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def _read(self, filename):
+        return read_dependency_metadata(
+            os.path.join(self.directory, filename)
+        )
+
+    def update(self, filenames):
+        '''
+        Read the requirements of new or changed filenames, forget the
+        removed ones.
+
+        Returns True if anything changed.
+        '''
+        changed = []
+        removed = []
+        for filename in filenames:
+            stat = self._stat(filename)
+            entry = self.files.get(filename)
+            if stat is None:
+                if entry is not None:
+                    removed.append(filename)
+            # entries without Requires-Python are from older versions
+            elif (entry is None or len(entry) < 4
+                    or tuple(entry[:2]) != stat):
+                changed.append((filename, stat))
+        if not changed and not removed:
+            return False
+
+        metadata = []
+        if changed:
+            pool = ThreadPool(min(self.workers, len(changed)))
+            try:
+                metadata = pool.map(
+                    self._read, [filename for filename, _ in changed]
+                )
+            finally:
+                pool.close()
+                pool.join()
+        with self._lock:
+            for filename in removed:
+                self._unindex(filename)
+                del self.files[filename]
+            for (filename, stat), (requires, requires_python) in zip(
+                    changed, metadata):
+                self._unindex(filename)
+                self.files[filename] = [
+                    stat[0], stat[1], requires, requires_python
+                ]
+                self._index(filename)
+            self._projects = None
+        return True
+
+    def refresh(self):
+        '''Bring the graph up to date with the directory, persisting it'''
+        try:
+            filenames = [
+                filename for filename in os.listdir(self.directory)
+                if is_package_file(filename)
+            ]
+        except OSError:
+            filenames = []
+        gone = set(self.files) - set(filenames)
+        if self.update(filenames + sorted(gone)):
+            try:
+                self.save()
+            except (IOError, OSError):
+                # it is only a cache
+                pass
+
+    def remove(self, filename):
+        with self._lock:
+            self._unindex(filename)
+            self.files.pop(filename, None)
+            self._projects = None
+
+    def _index(self, filename):
+        if self._dependents is None:
+            return
+        for project, requirement in iter_required_projects(
+                self.get_requirements(filename)):
+            self._dependents.setdefault(project, {})[filename] = requirement
+
+    def _unindex(self, filename):
+        if self._dependents is None:
+            return
+        for project, _ in iter_required_projects(
+                self.get_requirements(filename)):
+            dependents = self._dependents.get(project, {})
+            dependents.pop(filename, None)
+            if not dependents:
+                self._dependents.pop(project, None)
+
+    def get_dependents(self, project):
+        '''
+        Sorted (filename, requirement) of the files requiring project.
+
+        Requirements with environment markers are included whatever the
+        environment.
+        '''
+        with self._lock:
+            if self._dependents is None:
+                self._dependents = {}
+                for filename in self.files:
+                    self._index(filename)
+            dependents = self._dependents.get(normalize_name(project), {})
+            return sorted(dependents.items())
+
+    def get_requirements(self, filename):
+        entry = self.files.get(filename)
+        return None if entry is None else entry[2]
+
+    def get_requires_python(self, filename):
+        entry = self.files.get(filename)
+        return None if entry is None or len(entry) < 4 else entry[3]
+
+    def get_filenames(self, project):
+        projects = self._projects
+        if projects is None:
+            projects = {}
+            for filename in list(self.files):
+                parsed = parse_filename(filename)
+                if parsed:
+                    projects.setdefault(
+                        normalize_name(parsed[0]), []
+                    ).append(filename)
+            self._projects = projects
+        return sorted(projects.get(normalize_name(project), ()))
+
+    def closure(
+            self, requirements, select=select_file, environment=None,
+            target=None):
+        '''
+        Package files satisfying requirements and their dependencies.
+
+        The highest version satisfying a requirement is taken, and
+        select(filenames, name, version) chooses the file of it, among
+        those whose Requires-Python allows target (a packages.Target).
+        Markers are evaluated in environment (PEP 508 values overriding
+        those of the running python).
+        Returns (filenames, requirements left for pip): those with extras,
+        conflicting with an already chosen version, not satisfiable here or
+        depending on a file with unknown requirements.
+        '''
+        chosen = {}
+        filenames = []
+        left = []
+        pending = list(requirements)
+        while pending:
+            text = pending.pop(0)
+            try:
+                requirement = pkg_resources.Requirement.parse(text)
+                marker = requirement.marker
+                if marker and not marker.evaluate(environment):
+                    continue
+            except ValueError:
+                left.append(text)
+                continue
+            project = normalize_name(requirement.project_name)
+            if project in chosen:
+                if chosen[project] not in requirement:
+                    left.append(text)
+                continue
+            if requirement.extras:
+                left.append(text)
+                continue
+
+            filename = self._choose(requirement, select, target)
+            if filename is None:
+                left.append(text)
+                continue
+            chosen[project] = parse_filename(filename)[1]
+            requires = self.get_requirements(filename)
+            if requires is None:
+                # pip can find out, from the same file
+                left.append(text)
+                continue
+            filenames.append(filename)
+            pending.extend(requires)
+        return filenames, left
+
+    def _choose(self, requirement, select, target=None):
+        versions = {}
+        for filename in self.get_filenames(requirement.project_name):
+            if target and not target.allows_python(
+                    self.get_requires_python(filename)):
+                continue
+            version = parse_filename(filename)[1]
+            try:
+                # like pip: no pre-releases unless the specifier names one
+                if not requirement.specifier.contains(version):
+                    continue
+                parsed_version = pkg_resources.parse_version(version)
+            except ValueError:
+                # not a valid version
+                continue
+            versions.setdefault(parsed_version, []).append(filename)
+        for version in sorted(versions, reverse=True):
+            candidates = versions[version]
+            filename = select(
+                candidates, requirement.project_name,
+                parse_filename(candidates[0])[1]
+            )
+            if filename:
+                return filename
+        return None
@@ -0,0 +1,246 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from .packages import is_package_file, METADATA_DIRECTORY
+
+
+SIZE_UNITS = {
+    '': 1,
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+    'T': 1024 ** 4,
+}
+
+
+def parse_size(text):
+    '''
+    Parse sizes like 500M, 10G, 1.5T or 12345 (bytes) into bytes.
+
+    Raises ValueError on invalid input.
+    '''
+    match = re.match(
+        r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*$', text, re.IGNORECASE
+    )
+    if not match:
+        raise ValueError('Invalid size: {!r}'.format(text))
+    number, unit = match.groups()
+    return int(float(number) * SIZE_UNITS[unit.upper()])
+
+
+class POLICY:
+    LRU = 'lru'
+    LFU = 'lfu'
+
+
+def lru_key(access):
+    last_access, hits = access
+    return last_access, hits
+
+
+def lfu_key(access):
+    last_access, hits = access
+    return hits, last_access
+
+
+EVICTION_ORDER = {
+    POLICY.LRU: lru_key,
+    POLICY.LFU: lfu_key,
+}
+
+
+class Evictor(object):
+
+    '''
+    Keeps the package files in a directory within a size budget.
+
+    Accesses (last access time and hit count) are tracked in memory and
+    persisted in its METADATA_DIRECTORY (so that saving does not change the
+    directory listing), files are removed least recently (LRU) or least
+    frequently (LFU) used first.
+    When started, it works in the background in small batches, so that
+    serving is not blocked.
+    '''
+
+    STATE_FILE = 'access.json'
+
+    def __init__(
+            self, directory, budget, policy=POLICY.LRU,
+            interval=60.0, batch_size=100):
+        self.directory = directory
+        self.budget = budget
+        self.eviction_order = EVICTION_ORDER[policy]
+        self.interval = interval
+        self.batch_size = batch_size
+        # filename -> [last access time, hits]
+        self.access = {}
+        # accesses changed since the last save
+        self._changed = False
+        # called with the filename of every removed file
+        self.on_evict = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.load()
+
+    @property
+    def state_directory(self):
+        return os.path.join(self.directory, METADATA_DIRECTORY)
+
+    @property
+    def state_path(self):
+        return os.path.join(self.state_directory, self.STATE_FILE)
+
+    def load(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            return
+        with self._lock:
+            for filename, access in state.items():
+                self.access.setdefault(filename, list(access))
+
+    def save(self):
+        '''Persist the accesses, if changed since the last save'''
+        with self._lock:
+            if not self._changed:
+                return
+            state = dict(self.access)
+            self._changed = False
+        try:
+            os.makedirs(self.state_directory)
+        except OSError:
+            # exists, or fails below
+            pass
+        try:
+            fd, temp_path = tempfile.mkstemp(
+                dir=self.state_directory, prefix=self.STATE_FILE
+            )
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(state, f)
+                os.rename(temp_path, self.state_path)
+            except (IOError, OSError):
+                os.remove(temp_path)
+                raise
+        except (IOError, OSError):
+            with self._lock:
+                self._changed = True
+            raise
+
+    def take_over(self, evictor):
+        '''
+        Share the accesses of evictor, a stopped one of the same directory.
+
+        Accesses recorded by either are kept, e.g. those of requests still
+        served by a replaced site.
+        '''
+        with evictor._lock:
+            self.access = evictor.access
+            self._lock = evictor._lock
+
+    def touch(self, filename):
+        with self._lock:
+            access = self.access.setdefault(filename, [0, 0])
+            access[0] = time.time()
+            access[1] += 1
+            self._changed = True
+
+    def wake(self):
+        '''Check the budget soon (e.g. after a file was added)'''
+        self._wakeup.set()
+
+    def get_files(self):
+        '''(filename, size, mtime) of package files in the directory'''
+        files = []
+        for filename in os.listdir(self.directory):
+            if not is_package_file(filename):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+            files.append((filename, stat.st_size, stat.st_mtime))
+        return files
+
+    def evict_some(self, keep=()):
+        '''
+        Remove at most batch_size files if over budget.
+
+        Files named in keep are not removed.
+        Returns True if the directory is still over budget and has files
+        to remove.
+        '''
+        files = self.get_files()
+        total = sum(size for _, size, _ in files)
+        if total <= self.budget:
+            return False
+        keep = set(keep)
+        files = [file for file in files if file[0] not in keep]
+        if not files:
+            return False
+
+        with self._lock:
+            # files never accessed count as accessed when they arrived
+            def eviction_key(file):
+                filename, size, mtime = file
+                return self.eviction_order(
+                    self.access.get(filename, (mtime, 0))
+                )
+            candidates = sorted(files, key=eviction_key)
+
+        for filename, size, _ in candidates[:self.batch_size]:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.access.pop(filename, None)
+                self._changed = True
+            if self.on_evict:
+                self.on_evict(filename)
+        return total > self.budget
+
+    def evict(self, keep=()):
+        '''Remove files, except those named in keep, until within budget'''
+        while self.evict_some(keep):
+            pass
+        self.save()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                while self.evict_some() and not self._stopped.is_set():
+                    # let the serving threads breathe between batches
+                    time.sleep(0.01)
+                self.save()
+            except (IOError, OSError):
+                pass
@@ -0,0 +1,220 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Copying exactly pinned requirements (foo==1.0) without pip.
+#
+# The package file of a pinned release is looked up in the source repo's
+# index and transferred directly; its dependencies are read from the file
+# itself and followed as long as they are pinned too. Only what needs real
+# resolution (version ranges, markers, unknown metadata) is left for pip.
+
+import hashlib
+import os
+import shutil
+from multiprocessing.pool import ThreadPool
+
+from .packages import parse_pinned_requirement, select_file
+from .packages import read_requirements, normalize_name
+from .util import red
+from . import simple
+
+
+DEFAULT_WORKERS = 8
+
+
+class LocalFile(object):
+
+    '''A package file in a directory repo'''
+
+    requires_python = None
+
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.basename(path)
+
+    def get_hashes(self, names):
+        '''{name: hex digest} of the file'''
+        hashers = {name: hashlib.new(name) for name in names}
+        with open(self.path, 'rb') as f:
+            for chunk in simple.iter_chunks(f):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+        return {name: hasher.hexdigest() for name, hasher in hashers.items()}
+
+    def fetch(self, directory, allowed_hashes=None):
+        if not allowed_hashes:
+            shutil.copy2(self.path, directory)
+            return
+        with open(self.path, 'rb') as f:
+            simple.write_verified(
+                simple.iter_chunks(f),
+                os.path.join(directory, self.filename),
+                simple.HashChecker(allowed=allowed_hashes),
+                self.path
+            )
+
+
+class RemoteFile(object):
+
+    '''
+    A package file linked from an index page.
+
+    It is opened with open_stream (e.g. a MirrorSet's, for failing over).
+    '''
+
+    def __init__(self, link, open_stream=simple.open_stream):
+        self.link = link
+        self.filename = link.filename
+        self.requires_python = link.requires_python
+        self.open_stream = open_stream
+
+    def fetch(self, directory, allowed_hashes=None):
+        simple.download(
+            self.link, os.path.join(directory, self.filename),
+            open_stream=self.open_stream, allowed_hashes=allowed_hashes
+        )
+
+
+def fetch_files(package_files, directory, workers=DEFAULT_WORKERS):
+    '''
+    Fetch package_files into directory in parallel.
+
+    Returns the package files that failed.
+    '''
+    def fetch(package_file):
+        try:
+            package_file.fetch(directory)
+        except (IOError, OSError) as e:
+            print(red('{}: {}'.format(package_file.filename, e)))
+            return False
+        print('  {}'.format(package_file.filename))
+        return True
+
+    package_files = list(package_files)
+    if not package_files:
+        return []
+    pool = ThreadPool(min(workers, len(package_files)))
+    try:
+        fetched = pool.map(fetch, package_files)
+    finally:
+        pool.close()
+        pool.join()
+    return [
+        package_file
+        for package_file, ok in zip(package_files, fetched) if not ok
+    ]
+
+
+class PinnedDownload(object):
+
+    '''
+    Download pinned requirements and their pinned dependencies.
+
+    get_files(project) returns the {filename: LocalFile or RemoteFile} of a
+    project (None if unknown) and raises NotImplementedError if the repo can
+    not provide them; files of a round of requirements are fetched in
+    parallel. Wheels are preferred if tags (see select_file) are given,
+    files whose Requires-Python excludes target are ignored.
+    '''
+
+    def __init__(
+            self, get_files, workers=DEFAULT_WORKERS, tags=None, target=None):
+        self.get_files = get_files
+        self.workers = workers
+        self.tags = tags
+        self.target = target
+
+    def find(self, requirement):
+        '''Package file to fetch for requirement, None if not pinned/found'''
+        pinned = parse_pinned_requirement(requirement)
+        if pinned is None:
+            return None
+        name, version = pinned
+        try:
+            files = self.get_files(name)
+        except (IOError, ValueError) as e:
+            print(red('{}: {}'.format(requirement, e)))
+            return None
+        if files and self.target:
+            files = {
+                filename: package_file
+                for filename, package_file in files.items()
+                if self.target.allows_python(package_file.requires_python)
+            }
+        if not files:
+            return None
+        filename = select_file(files, name, version, self.tags)
+        return files[filename] if filename else None
+
+    def fetch(self, package_file, directory):
+        '''Requirements of package_file once fetched, None if failed'''
+        try:
+            package_file.fetch(directory)
+        except (IOError, OSError) as e:
+            print(red('{}: {}'.format(package_file.filename, e)))
+            return None
+        print('  {}'.format(package_file.filename))
+        return read_requirements(
+            os.path.join(directory, package_file.filename)
+        )
+
+    def run(self, requirements, directory):
+        '''
+        Download what is possible without pip into directory.
+
+        Returns the requirements left for pip.
+        '''
+        left = []
+        seen = set()
+        while requirements:
+            to_fetch = []
+            for requirement in requirements:
+                key = requirement.strip().lower()
+                pinned = parse_pinned_requirement(requirement)
+                if pinned:
+                    key = normalize_name(pinned[0])
+                if key in seen:
+                    continue
+                seen.add(key)
+                package_file = self.find(requirement)
+                if package_file is None:
+                    left.append(requirement)
+                else:
+                    to_fetch.append((requirement, package_file))
+            if not to_fetch:
+                break
+
+            pool = ThreadPool(min(self.workers, len(to_fetch)))
+            try:
+                results = pool.map(
+                    lambda item: self.fetch(item[1], directory), to_fetch
+                )
+            finally:
+                pool.close()
+                pool.join()
+
+            requirements = []
+            for (requirement, _), dependencies in zip(to_fetch, results):
+                if dependencies is None:
+                    # pip finds out itself
+                    left.append(requirement)
+                else:
+                    requirements.extend(dependencies)
+        return left
+
+
+def download_pinned(
+        get_files, requirements, directory, tags=None, target=None):
+    '''
+    Requirements left for pip after downloading the pinned ones natively.
+
+    All of them are left if the repo does not support it.
+    '''
+    if not any(map(parse_pinned_requirement, requirements)):
+        return list(requirements)
+    try:
+        download = PinnedDownload(get_files, tags=tags, target=target)
+        return download.run(list(requirements), directory)
+    except NotImplementedError:
+        return list(requirements)
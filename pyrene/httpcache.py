@@ -0,0 +1,222 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# On-disk cache of simple index pages fetched from http repos.
+#
+# Entries are single files named by a digest of (url, Accept), holding a
+# JSON header line (status, validators) and the body. They are written while
+# the response is read and replaced atomically once it is complete, and
+# their mtime is when they were last known fresh, so any number of pyrene
+# processes can share the cache without locking.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from .metrics import CacheCounter
+from . import simple
+
+
+DEFAULT_TTL = 600
+
+# response headers kept with the body
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+# responses worth remembering: pages and missing projects
+CACHED_STATUSES = (200, 404)
+
+
+def default_cache_directory():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(
+        '~/.cache'
+    )
+    return os.path.join(cache_home, 'pyrene', 'pages')
+
+
+class Entry(object):
+
+    '''A cached response, open for reading its body'''
+
+    def __init__(self, status, headers, f):
+        self.status = status
+        self.headers = headers
+        self.f = f
+        self.checked_at = os.fstat(f.fileno()).st_mtime
+
+    @classmethod
+    def open(cls, path):
+        '''Entry at path, None if missing or damaged'''
+        try:
+            f = open(path, 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            header = json.loads(f.readline().decode('utf8'))
+            return cls(header['status'], header['headers'], f)
+        except (ValueError, KeyError, TypeError):
+            # damaged by something else than pyrene
+            f.close()
+            return None
+
+    def get_response(self):
+        return simple.StreamingResponse(
+            self.status, dict(self.headers), self.f
+        )
+
+    def close(self):
+        self.f.close()
+
+
+class CachingReader(object):
+
+    '''
+    Reads from fp, writing the data to temp_file along the way.
+
+    When fp is read to its end, the temporary file is installed at path,
+    a response closed before that is not cached.
+    '''
+
+    def __init__(self, fp, temp_file, temp_path, path):
+        self.fp = fp
+        self.temp_file = temp_file
+        self.temp_path = temp_path
+        self.path = path
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        if self.temp_file is not None:
+            try:
+                self.temp_file.write(data)
+            except (IOError, OSError):
+                # e.g. disk full: the response is still good
+                self.close_temp_file()
+                return data
+            if not data or size < 0:
+                self._install()
+        return data
+
+    def _install(self):
+        self.temp_file.close()
+        self.temp_file = None
+        try:
+            os.rename(self.temp_path, self.path)
+        except OSError:
+            self._discard()
+
+    def _discard(self):
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def close_temp_file(self):
+        if self.temp_file is not None:
+            self.temp_file.close()
+            self.temp_file = None
+            self._discard()
+
+    def close(self):
+        self.fp.close()
+        self.close_temp_file()
+
+
+class PageCache(object):
+
+    '''
+    HTTP GET with responses kept in directory.
+
+    Responses younger than `ttl` seconds are returned without asking the
+    server, older ones are revalidated with If-None-Match/If-Modified-Since.
+    When the server can not be reached, the cached response is returned.
+    Responses are streamed, new ones are cached while they are read.
+    '''
+
+    def __init__(
+            self, directory=None, ttl=DEFAULT_TTL,
+            open_page=simple.open_response):
+        self.directory = directory or default_cache_directory()
+        self.ttl = ttl
+        self.open_page = open_page
+        self.cache = CacheCounter()
+
+    def get_path(self, url, headers):
+        key = '{}\n{}'.format(url, headers.get('Accept', ''))
+        return os.path.join(
+            self.directory, hashlib.sha256(key.encode('utf8')).hexdigest()
+        )
+
+    def get(self, url, headers=None):
+        '''Response of url - network errors are raised only if not cached'''
+        return simple.read_response(self.open(url, headers))
+
+    def open(self, url, headers=None):
+        '''StreamingResponse of url, like get'''
+        headers = dict(headers or {})
+        path = self.get_path(url, headers)
+        entry = Entry.open(path)
+        if entry and time.time() - entry.checked_at < self.ttl:
+            self.cache.count('page', 'hit')
+            return entry.get_response()
+
+        if entry:
+            if entry.headers.get('ETag'):
+                headers['If-None-Match'] = entry.headers['ETag']
+            if entry.headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = entry.headers['Last-Modified']
+        try:
+            response = self.open_page(url, headers)
+        except IOError:
+            if entry is None:
+                raise
+            self.cache.count('page', 'stale')
+            return entry.get_response()
+
+        if response.status == 304 and entry:
+            response.close()
+            self.cache.count('page', 'revalidated')
+            self._touch(path)
+            return entry.get_response()
+        if entry:
+            entry.close()
+        self.cache.count('page', 'miss')
+        if response.status in CACHED_STATUSES:
+            return self._caching(path, response)
+        return response
+
+    def _caching(self, path, response):
+        '''response, cached as it is read'''
+        header = {
+            'status': response.status,
+            'headers': {
+                name: response.headers.get(name)
+                for name in KEPT_HEADERS
+                if response.headers.get(name)
+            },
+        }
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            # exists, or fails below
+            pass
+        try:
+            fd, temp_path = tempfile.mkstemp(
+                dir=self.directory, prefix='.', suffix='.part'
+            )
+            temp_file = os.fdopen(fd, 'wb')
+            temp_file.write(json.dumps(header).encode('utf8') + b'\n')
+        except (IOError, OSError):
+            # caching is an optimization only
+            return response
+        return simple.StreamingResponse(
+            response.status, response.headers,
+            CachingReader(response.fp, temp_file, temp_path, path)
+        )
+
+    def _touch(self, path):
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
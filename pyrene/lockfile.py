@@ -0,0 +1,242 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Requirements files, and copying the exact files of a hash-pinned one
+# (lockfile).
+#
+# Every requirement of a lockfile is `name==version --hash=ALG:DIGEST...`,
+# like in pip's hash-checking mode, so nothing needs resolving: the files are
+# looked up in the source repo, fetched in parallel and verified while they
+# are streamed.
+
+import os
+import re
+
+import pkg_resources
+
+from .fetch import fetch_files, DEFAULT_WORKERS
+from .packages import parse_pinned_requirement, select_file
+from .packages import parse_filename, normalize_name, versions_equal
+from .simple import HASH_ALGORITHMS
+from .util import red
+
+
+HASH_OPTION = re.compile(r'--hash[=\s]\s*(\w+):(\w+)')
+
+
+class LockedRequirement(object):
+
+    '''A name==version requirement with the hashes of its allowed files'''
+
+    def __init__(self, name, version, hashes, marker=None, line=None):
+        self.name = name
+        self.version = version
+        # algorithm -> set of hex digests
+        self.hashes = hashes
+        self.marker = marker
+        self.line = line
+
+    def __str__(self):
+        return '{}=={}'.format(self.name, self.version)
+
+    def applies(self, environment=None):
+        return self.marker is None or self.marker.evaluate(environment)
+
+    def allows(self, hashes):
+        '''
+        Whether known hashes ({algorithm: digest}) of a file do not exclude
+        it - files without comparable hashes are verified when fetched.
+        '''
+        for name, digest in hashes.items():
+            if name in self.hashes:
+                return digest.lower() in self.hashes[name]
+        return True
+
+
+def iter_logical_lines(text):
+    '''(line number, line) with comments removed, continuations joined'''
+    logical = ''
+    start = None
+    for number, line in enumerate(text.splitlines(), 1):
+        line = re.sub(r'(^|\s)#.*$', '', line)
+        if start is None:
+            start = number
+        if line.endswith('\\'):
+            logical += line[:-1] + ' '
+            continue
+        logical += line
+        if logical.strip():
+            yield start, logical.strip()
+        logical = ''
+        start = None
+    if logical.strip():
+        yield start, logical.strip()
+
+
+REQUIREMENT_FILE_OPTION = re.compile(r'^(-r|--requirement)[=\s]\s*(\S+)$')
+
+
+def read_requirements_file(path, seen=None):
+    '''
+    Requirements listed in the requirements file at path.
+
+    Included files (-r) are read too, other options and hashes are ignored.
+    Raises IOError.
+    '''
+    seen = set() if seen is None else seen
+    seen.add(os.path.abspath(path))
+    with open(path) as f:
+        text = f.read()
+    requirements = []
+    for _, line in iter_logical_lines(text):
+        included = REQUIREMENT_FILE_OPTION.match(line)
+        if included:
+            included_path = os.path.join(
+                os.path.dirname(path), included.group(2)
+            )
+            if os.path.abspath(included_path) not in seen:
+                requirements.extend(
+                    read_requirements_file(included_path, seen)
+                )
+        elif not line.startswith('-'):
+            requirements.append(HASH_OPTION.sub('', line).strip())
+    return requirements
+
+
+def parse_lockfile(text):
+    '''
+    LockedRequirements of a requirements file in pip's hash-checking mode.
+
+    Global options (-i, --index-url, ...) are ignored.
+    Raises ValueError for requirements not pinned or without hashes.
+    '''
+    requirements = []
+    for number, line in iter_logical_lines(text):
+        if line.startswith('-'):
+            continue
+        hashes = {}
+        for name, digest in HASH_OPTION.findall(line):
+            if name not in HASH_ALGORITHMS:
+                raise ValueError(
+                    'line {}: unknown hash algorithm {}'.format(number, name)
+                )
+            hashes.setdefault(name, set()).add(digest.lower())
+        spec = HASH_OPTION.sub('', line).strip()
+        try:
+            requirement = pkg_resources.Requirement.parse(spec)
+        except ValueError:
+            raise ValueError('line {}: invalid requirement'.format(number))
+        pinned = parse_pinned_requirement(
+            '{}{}'.format(
+                requirement.project_name,
+                ','.join(op + version for op, version in requirement.specs)
+            )
+        )
+        if pinned is None:
+            raise ValueError(
+                'line {}: {} is not pinned with =='.format(number, spec)
+            )
+        if not hashes:
+            raise ValueError(
+                'line {}: {} has no --hash'.format(number, spec)
+            )
+        requirements.append(
+            LockedRequirement(
+                pinned[0], pinned[1], hashes, requirement.marker, number
+            )
+        )
+    return requirements
+
+
+def is_release_file(filename, requirement):
+    parsed = parse_filename(filename)
+    return (
+        parsed is not None
+        and normalize_name(parsed[0]) == normalize_name(requirement.name)
+        and versions_equal(parsed[1], requirement.version)
+    )
+
+
+class VerifiedFile(object):
+
+    '''A package file fetched only if its hash is allowed'''
+
+    def __init__(self, package_file, allowed_hashes):
+        self.package_file = package_file
+        self.filename = package_file.filename
+        self.allowed_hashes = allowed_hashes
+
+    def fetch(self, directory):
+        self.package_file.fetch(directory, self.allowed_hashes)
+
+
+def get_known_hashes(package_file, names):
+    '''
+    Hashes of package_file known without fetching it: those on the index
+    page for links, of the requested algorithms for local files.
+    '''
+    link = getattr(package_file, 'link', None)
+    if link is not None:
+        return link.hashes
+    try:
+        return package_file.get_hashes(names)
+    except (AttributeError, IOError):
+        return {}
+
+
+def download_locked(
+        get_files, requirements, directory, tags=None, target=None,
+        workers=DEFAULT_WORKERS):
+    '''
+    Fetch the files of LockedRequirements into directory.
+
+    Files are chosen like for other copies (tags, target), among those whose
+    hash is allowed, wheels for the target being the fallback if there is no
+    such sdist. Returns the requirements that failed.
+    '''
+    environment = target.environment if target else None
+    to_fetch = []
+    failed = []
+    for requirement in requirements:
+        if not requirement.applies(environment):
+            continue
+        try:
+            files = get_files(requirement.name) or {}
+        except (IOError, ValueError) as e:
+            print(red('{}: {}'.format(requirement, e)))
+            failed.append(requirement)
+            continue
+        files = {
+            filename: package_file
+            for filename, package_file in files.items()
+            if is_release_file(filename, requirement)
+            and requirement.allows(
+                get_known_hashes(package_file, requirement.hashes)
+            )
+            and (target is None
+                 or target.allows_python(package_file.requires_python))
+        }
+        filename = select_file(
+            files, requirement.name, requirement.version, tags
+        )
+        if filename is None and tags is None and target is not None:
+            filename = select_file(
+                files, requirement.name, requirement.version, target.tags
+            )
+        if filename is None:
+            print(red('{}: no allowed file found'.format(requirement)))
+            failed.append(requirement)
+            continue
+        to_fetch.append(
+            (requirement, VerifiedFile(files[filename], requirement.hashes))
+        )
+
+    fetch_failed = fetch_files(
+        [package_file for _, package_file in to_fetch], directory, workers
+    )
+    failed.extend(
+        requirement for requirement, package_file in to_fetch
+        if package_file in fetch_failed
+    )
+    return failed
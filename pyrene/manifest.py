@@ -0,0 +1,177 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Incremental mirroring of all the package files of a repo into another.
+#
+# The file manifests of the repos are read from their indexes (no pip),
+# and only the files missing from the destination are transferred, a batch
+# at a time, several files in parallel. The files known to be in the
+# destination are kept in a checkpoint, saved during the transfer, so an
+# interrupted run is resumed, and later runs only read the source manifest.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from .fetch import fetch_files, DEFAULT_WORKERS
+from .repos import UploadError
+from .util import red, green, bold
+from .constants import REPO
+
+
+# files fetched, then uploaded at a time
+BATCH_SIZE = 200
+
+# seconds between checkpoint saves during a transfer
+CHECKPOINT_INTERVAL = 10
+
+
+def default_checkpoint_directory():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(
+        '~/.cache'
+    )
+    return os.path.join(cache_home, 'pyrene', 'mirror')
+
+
+def get_location(repo):
+    '''What identifies repo's packages, beyond its name'''
+    return [
+        repo.attributes.get(attribute)
+        for attribute in (REPO.DIRECTORY, REPO.DOWNLOAD_URL, REPO.UPLOAD_URL)
+    ]
+
+
+class Checkpoint(object):
+
+    '''
+    Filenames known to be in the destination of a mirror.
+
+    present is None until known.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.present = None
+
+    @classmethod
+    def of(cls, source, destination, directory=None):
+        '''The checkpoint of mirroring source into destination'''
+        key = json.dumps([
+            source.name, get_location(source),
+            destination.name, get_location(destination),
+        ])
+        filename = '{}.json'.format(
+            hashlib.sha256(key.encode('utf8')).hexdigest()
+        )
+        checkpoint = cls(
+            os.path.join(directory or default_checkpoint_directory(), filename)
+        )
+        checkpoint.load()
+        return checkpoint
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.present = set(json.load(f)['present'])
+        except (IOError, ValueError, KeyError, TypeError):
+            self.present = None
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # exists, or fails below
+            pass
+        fd, temp_path = tempfile.mkstemp(
+            dir=directory, prefix='.', suffix='.part'
+        )
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'present': sorted(self.present or ())}, f)
+            os.rename(temp_path, self.path)
+        except (IOError, OSError):
+            os.remove(temp_path)
+            raise
+
+    def reset(self, filenames):
+        self.present = set(filenames)
+
+    def add(self, filenames):
+        self.present.update(filenames)
+
+
+def upload_files(repo, paths):
+    '''Filenames of paths uploaded to repo, failures are printed'''
+    uploaded = []
+    with repo.get_uploader() as upload:
+        for path in paths:
+            try:
+                upload(path)
+            except UploadError as e:
+                print(bold(red(' * {}'.format(e))))
+                continue
+            uploaded.append(os.path.basename(path))
+    return uploaded
+
+
+def mirror(
+        source, destination, directory, checkpoint, rescan=False,
+        workers=DEFAULT_WORKERS, batch_size=BATCH_SIZE, clock=time.time):
+    '''
+    Copy the package files of source missing from destination.
+
+    Files are fetched into directory (a util.Directory), which is cleared
+    after every batch. The destination manifest is read only if the
+    checkpoint does not know it yet or rescan is requested.
+    Returns (number of files copied, number of failures).
+    Raises NotImplementedError if a repo can not list its files, and
+    ValueError if destination can not be uploaded to.
+    '''
+    if not destination.accepts_uploads:
+        raise ValueError(
+            '{} can not be uploaded to'.format(destination.name)
+        )
+    source_files = source.get_manifest()
+    if rescan or checkpoint.present is None:
+        checkpoint.reset(destination.get_manifest())
+        checkpoint.save()
+    missing = sorted(set(source_files) - checkpoint.present)
+    print(
+        '{}: {} files, {} to copy to {}'
+        .format(source.name, len(source_files), len(missing), destination.name)
+    )
+
+    copied = 0
+    saved_at = clock()
+    try:
+        for start in range(0, len(missing), batch_size):
+            batch = [
+                source_files[filename]
+                for filename in missing[start:start + batch_size]
+            ]
+            failed = set(
+                package_file.filename
+                for package_file in fetch_files(batch, directory.path, workers)
+            )
+            uploaded = upload_files(destination, [
+                os.path.join(directory.path, package_file.filename)
+                for package_file in batch
+                if package_file.filename not in failed
+            ])
+            directory.clear()
+            checkpoint.add(uploaded)
+            copied += len(uploaded)
+            print(green(
+                ' * {}/{} copied'.format(copied, len(missing))
+            ))
+            if clock() - saved_at >= CHECKPOINT_INTERVAL:
+                checkpoint.save()
+                saved_at = clock()
+    finally:
+        directory.clear()
+        checkpoint.save()
+    return copied, len(missing) - copied
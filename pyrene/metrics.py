@@ -0,0 +1,278 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+
+
+# upper bounds in seconds
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, float('inf'),
+)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        '''Upper bound of the bucket containing the q-quantile'''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative_counts():
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class CacheCounter(object):
+
+    '''Cache lookup results of a site, e.g. (page, hit), (file, miss)'''
+
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, cache, result):
+        with self._lock:
+            key = cache, result
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def get_counts(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+def sum_counts(counters):
+    counts = {}
+    for counter in counters:
+        for key, count in counter.get_counts().items():
+            counts[key] = counts.get(key, 0) + count
+    return sorted(counts.items())
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def format_labels(labels):
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            value.replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in labels
+    ) + '}'
+
+
+def format_duration(seconds):
+    if seconds == float('inf'):
+        return 'slow'
+    if seconds < 1:
+        return '{:g}ms'.format(seconds * 1000)
+    return '{:g}s'.format(seconds)
+
+
+class Metrics(object):
+
+    '''
+    Request metrics of a server.
+
+    Exposed in Prometheus' text format (render) and summarized on shutdown.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (repo, endpoint, status) -> count
+        self.requests = {}
+        # (repo, endpoint) -> Histogram
+        self.latencies = {}
+        # (repo, endpoint) -> bytes
+        self.bytes_sent = {}
+        # time requests waited for a worker
+        self.queue_wait = Histogram()
+        self.busy_workers = 0
+        self.max_busy_workers = 0
+        # repo name -> CacheCounters of the repo's site(s)
+        self.cache_counters = {}
+
+    def observe_request(self, repo, endpoint, status, seconds, bytes_sent):
+        with self._lock:
+            key = repo, endpoint, status
+            self.requests[key] = self.requests.get(key, 0) + 1
+            key = repo, endpoint
+            if key not in self.latencies:
+                self.latencies[key] = Histogram()
+            self.latencies[key].observe(seconds)
+            self.bytes_sent[key] = self.bytes_sent.get(key, 0) + bytes_sent
+
+    def worker_started(self, queue_wait):
+        with self._lock:
+            self.queue_wait.observe(queue_wait)
+            self.busy_workers += 1
+            self.max_busy_workers = max(
+                self.max_busy_workers, self.busy_workers
+            )
+
+    def worker_finished(self):
+        with self._lock:
+            self.busy_workers -= 1
+
+    def add_cache_counters(self, repo, counters):
+        '''
+        Count counters in the totals of repo.
+
+        Counters added before (e.g. of sites replaced by a reload) keep
+        counting.
+        '''
+        with self._lock:
+            self.cache_counters.setdefault(repo, []).extend(counters)
+
+    def _get_cache_counters(self):
+        with self._lock:
+            return sorted(
+                (repo, list(counters))
+                for repo, counters in self.cache_counters.items()
+            )
+
+    def render(self):
+        lines = []
+
+        def add(name, labels, value):
+            lines.append(
+                '{}{} {}'.format(name, format_labels(labels), value)
+            )
+
+        with self._lock:
+            lines.append('# TYPE pyrene_requests_total counter')
+            for (repo, endpoint, status), count in sorted(
+                    self.requests.items()):
+                add(
+                    'pyrene_requests_total',
+                    (
+                        ('repo', repo),
+                        ('endpoint', endpoint),
+                        ('status', str(status)),
+                    ),
+                    count
+                )
+
+            lines.append('# TYPE pyrene_request_duration_seconds histogram')
+            for (repo, endpoint), histogram in sorted(self.latencies.items()):
+                labels = (('repo', repo), ('endpoint', endpoint))
+                self._add_histogram(
+                    add, 'pyrene_request_duration_seconds', labels, histogram
+                )
+
+            lines.append('# TYPE pyrene_response_bytes_total counter')
+            for (repo, endpoint), count in sorted(self.bytes_sent.items()):
+                add(
+                    'pyrene_response_bytes_total',
+                    (('repo', repo), ('endpoint', endpoint)),
+                    count
+                )
+
+            lines.append('# TYPE pyrene_queue_wait_seconds histogram')
+            self._add_histogram(
+                add, 'pyrene_queue_wait_seconds', (), self.queue_wait
+            )
+            lines.append('# TYPE pyrene_busy_workers gauge')
+            add('pyrene_busy_workers', (), self.busy_workers)
+            lines.append('# TYPE pyrene_busy_workers_max gauge')
+            add('pyrene_busy_workers_max', (), self.max_busy_workers)
+
+        lines.append('# TYPE pyrene_cache_total counter')
+        for repo, counters in self._get_cache_counters():
+            for (cache, result), count in sum_counts(counters):
+                add(
+                    'pyrene_cache_total',
+                    (('repo', repo), ('cache', cache), ('result', result)),
+                    count
+                )
+
+        return '\n'.join(lines) + '\n'
+
+    def _add_histogram(self, add, name, labels, histogram):
+        for bound, total in histogram.cumulative_counts():
+            add(
+                name + '_bucket',
+                labels + (('le', format_bound(bound)),),
+                total
+            )
+        add(name + '_sum', labels, repr(histogram.sum))
+        add(name + '_count', labels, histogram.count)
+
+    def summary(self):
+        '''Human readable summary lines'''
+        lines = []
+        with self._lock:
+            for (repo, endpoint), histogram in sorted(self.latencies.items()):
+                statuses = dict(
+                    (status, count)
+                    for (r, e, status), count in self.requests.items()
+                    if (r, e) == (repo, endpoint)
+                )
+                not_found = statuses.get(404, 0)
+                errors = sum(
+                    count for status, count in statuses.items()
+                    if status >= 500
+                )
+                lines.append(
+                    '{repo}{endpoint}: {count} requests,'
+                    ' {not_found} not found, {errors} errors,'
+                    ' p50 <= {p50}, p99 <= {p99},'
+                    ' {bytes} bytes sent'
+                    .format(
+                        repo=repo + ' ' if repo else '',
+                        endpoint=endpoint,
+                        count=histogram.count,
+                        not_found=not_found,
+                        errors=errors,
+                        p50=format_duration(histogram.quantile(0.5)),
+                        p99=format_duration(histogram.quantile(0.99)),
+                        bytes=self.bytes_sent.get((repo, endpoint), 0),
+                    )
+                )
+            if self.queue_wait.count:
+                lines.append(
+                    'workers: at most {} busy, waited for a worker:'
+                    ' p50 <= {}, p99 <= {}'
+                    .format(
+                        self.max_busy_workers,
+                        format_duration(self.queue_wait.quantile(0.5)),
+                        format_duration(self.queue_wait.quantile(0.99)),
+                    )
+                )
+        for repo, counters in self._get_cache_counters():
+            counts = sum_counts(counters)
+            if counts:
+                lines.append(
+                    '{}cache: {}'.format(
+                        repo + ' ' if repo else '',
+                        ', '.join(
+                            '{} {} {}'.format(cache, result, count)
+                            for (cache, result), count in counts
+                        )
+                    )
+                )
+        return lines
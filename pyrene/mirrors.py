@@ -0,0 +1,211 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Mirrors of an http repo: several index urls serving the same packages.
+#
+# Mirrors are ranked by their latency - probed once, in parallel, then
+# updated from every response. Pages are requested from the best mirror
+# first; when it errs or does not have the page (yet) the next one is asked
+# at once, when it is slow the next one is asked too (a hedged request), and
+# the first good response wins. Package files are not raced, only failed
+# over, as they are big.
+
+import threading
+import time
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from . import simple
+
+
+# seconds to wait for a mirror before asking the next one too
+HEDGE_DELAY = 2.0
+
+
+def split_urls(value):
+    '''The urls in a whitespace or comma separated attribute value'''
+    return value.replace(',', ' ').split()
+
+
+def is_good(response):
+    '''Whether response is final: not an error nor a possibly missing page'''
+    return response.status < 500 and response.status != 404
+
+
+def with_slash(url):
+    return url if url.endswith('/') else url + '/'
+
+
+class MirrorSet(object):
+
+    '''
+    Equivalent index urls, the first of them being the canonical one.
+
+    Latencies are in seconds, None for unreachable mirrors.
+    '''
+
+    def __init__(
+            self, urls, open_page=simple.open_response,
+            open_stream=simple.open_stream, hedge_delay=HEDGE_DELAY,
+            clock=time.time):
+        self.urls = [with_slash(url) for url in urls]
+        self.open_page = open_page
+        self._open_stream = open_stream
+        self.hedge_delay = hedge_delay
+        self.clock = clock
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return self.urls[0]
+
+    def probe(self, url):
+        '''Seconds until url responds, None if it fails'''
+        start = self.clock()
+        try:
+            response = self.open_page(url, {'Accept': simple.ACCEPT})
+        except IOError:
+            return None
+        # only the time to the headers counts, not reading a huge index
+        response.close()
+        if response.status >= 500:
+            return None
+        return self.clock() - start
+
+    def _record(self, url, latency):
+        with self._lock:
+            self.latencies[url] = latency
+
+    def ranked(self):
+        '''The mirror urls, fastest first, unreachable ones last'''
+        unknown = [url for url in self.urls if url not in self.latencies]
+        if unknown and len(self.urls) > 1:
+            threads = [
+                threading.Thread(
+                    target=lambda url=url: self._record(url, self.probe(url))
+                )
+                for url in unknown
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        def key(url):
+            latency = self.latencies.get(url)
+            return (latency is None, latency or 0, self.urls.index(url))
+        with self._lock:
+            return sorted(self.urls, key=key)
+
+    def alternatives(self, url):
+        '''url on every mirror, best first; just url if not on a mirror'''
+        for mirror_url in self.urls:
+            if url.startswith(mirror_url):
+                path = url[len(mirror_url):]
+                return [mirror + path for mirror in self.ranked()]
+        return [url]
+
+    def open(self, url, headers=None):
+        '''
+        StreamingResponse of url from the mirror responding first.
+
+        Responses with status 404 or 5xx and network errors count as
+        failures (a mirror may lag behind the others), the last one is
+        returned/raised when all mirrors fail.
+        '''
+        candidates = self.alternatives(url)
+        if len(candidates) == 1:
+            return self.open_page(url, headers)
+
+        results = Queue()
+
+        def request(candidate):
+            start = self.clock()
+            try:
+                response = self.open_page(candidate, headers)
+            except IOError as e:
+                self._record(self._mirror_of(candidate), None)
+                results.put((None, e))
+                return
+            if response.status >= 500:
+                self._record(self._mirror_of(candidate), None)
+            else:
+                self._record(
+                    self._mirror_of(candidate), self.clock() - start
+                )
+            results.put((response, None))
+
+        def start_next():
+            thread = threading.Thread(target=request, args=(pending.pop(0),))
+            thread.daemon = True
+            thread.start()
+
+        pending = list(candidates)
+        start_next()
+        running = 1
+        failure = None
+        while running:
+            try:
+                response, error = results.get(
+                    timeout=self.hedge_delay if pending else None
+                )
+            except Empty:
+                # slow: hedge with the next mirror
+                start_next()
+                running += 1
+                continue
+            running -= 1
+            if error is None and is_good(response):
+                self._close_late(results, running)
+                if failure is not None and failure[0] is not None:
+                    failure[0].close()
+                return response
+            if failure is not None and failure[0] is not None:
+                failure[0].close()
+            failure = (response, error)
+            if pending:
+                # failed: fail over at once
+                start_next()
+                running += 1
+        response, error = failure
+        if error is not None:
+            raise error
+        return response
+
+    def _close_late(self, results, running):
+        '''Close the responses of the requests still running when done'''
+        def close():
+            for _ in range(running):
+                response, _ = results.get()
+                if response is not None:
+                    response.close()
+        if running:
+            thread = threading.Thread(target=close)
+            thread.daemon = True
+            thread.start()
+
+    def _mirror_of(self, url):
+        for mirror_url in self.urls:
+            if url.startswith(mirror_url):
+                return mirror_url
+        return url
+
+    def open_stream(self, url, headers=None):
+        '''
+        Open url for streaming, failing over to the other mirrors.
+
+        Raises the last error if all of them fail.
+        '''
+        error = None
+        for candidate in self.alternatives(url):
+            try:
+                return self._open_stream(candidate, headers)
+            except IOError as e:
+                self._record(self._mirror_of(candidate), None)
+                error = e
+        raise error
@@ -0,0 +1,164 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Streaming multipart/form-data parser for uploads: file fields are written
+# to their destination chunk by chunk, memory use does not depend on the
+# size of the upload.
+
+import io
+
+
+CHUNK_SIZE = 64 * 1024
+MAX_FIELD_SIZE = 64 * 1024
+MAX_HEADER_LINE = 8 * 1024
+MAX_HEADERS = 32
+
+
+class MultipartError(ValueError):
+    '''Malformed or truncated multipart body'''
+
+
+def parse_header_params(value):
+    '''
+    Split a header like 'form-data; name="a"; filename="b"'.
+
+    Returns (value, params dict).
+    '''
+    parts = value.split(';')
+    params = {}
+    for part in parts[1:]:
+        key, eq, param = part.strip().partition('=')
+        if not eq:
+            continue
+        param = param.strip()
+        if len(param) >= 2 and param[0] == param[-1] == '"':
+            param = param[1:-1].replace('\\\\', '\\').replace('\\"', '"')
+        params[key.strip().lower()] = param
+    return parts[0].strip().lower(), params
+
+
+def get_boundary(content_type):
+    kind, params = parse_header_params(content_type)
+    boundary = params.get('boundary')
+    if kind != 'multipart/form-data' or not boundary:
+        raise MultipartError('Not multipart/form-data: ' + content_type)
+    return boundary.encode('latin-1')
+
+
+class BodyReader(object):
+
+    '''Buffered reading of a request body of known length'''
+
+    def __init__(self, fp, length, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.buffer = b''
+
+    def _fill(self):
+        if self.remaining <= 0:
+            return False
+        data = self.fp.read(min(self.chunk_size, self.remaining))
+        if not data:
+            raise MultipartError('Request body is truncated')
+        self.remaining -= len(data)
+        self.buffer += data
+        return True
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            if not self._fill():
+                raise MultipartError('Request body is truncated')
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def read_line(self, max_size=MAX_HEADER_LINE):
+        '''A CRLF terminated line, without the CRLF'''
+        while True:
+            end = self.buffer.find(b'\r\n')
+            if end >= 0:
+                line, self.buffer = self.buffer[:end], self.buffer[end + 2:]
+                return line
+            if len(self.buffer) > max_size:
+                raise MultipartError('Header line too long')
+            if not self._fill():
+                raise MultipartError('Request body is truncated')
+
+    def read_until(self, delimiter, write):
+        '''Pass data to write until delimiter, which is consumed'''
+        keep = len(delimiter) - 1
+        while True:
+            index = self.buffer.find(delimiter)
+            if index >= 0:
+                write(self.buffer[:index])
+                self.buffer = self.buffer[index + len(delimiter):]
+                return
+            if len(self.buffer) > keep:
+                write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            if not self._fill():
+                raise MultipartError('Request body is truncated')
+
+
+class LimitedBuffer(io.BytesIO):
+
+    def write(self, data):
+        if self.tell() + len(data) > MAX_FIELD_SIZE:
+            raise MultipartError('Form field too large')
+        return io.BytesIO.write(self, data)
+
+
+def parse_form(fp, content_type, length, open_file, chunk_size=CHUNK_SIZE):
+    '''
+    Parse a multipart/form-data request body from fp.
+
+    Form fields are returned as name -> list of text values.
+    File fields are written to open_file(name, filename), a file like object
+    with a write method, or skipped if it returns None.
+    '''
+    reader = BodyReader(fp, length, chunk_size)
+    delimiter = b'\r\n--' + get_boundary(content_type)
+    # the first delimiter may be the very start of the body
+    reader.buffer = b'\r\n'
+    reader.read_until(delimiter, lambda data: None)
+
+    fields = {}
+    while True:
+        after_delimiter = reader.read(2)
+        if after_delimiter == b'--':
+            break
+        if after_delimiter != b'\r\n':
+            raise MultipartError('Malformed delimiter')
+
+        headers = {}
+        while True:
+            line = reader.read_line()
+            if not line:
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise MultipartError('Too many part headers')
+            name, _, value = line.decode('utf8').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        _, params = parse_header_params(
+            headers.get('content-disposition', '')
+        )
+        name = params.get('name')
+        filename = params.get('filename')
+        if filename is not None:
+            f = open_file(name, filename)
+            reader.read_until(
+                delimiter, f.write if f is not None else lambda data: None
+            )
+        else:
+            value = LimitedBuffer()
+            reader.read_until(delimiter, value.write)
+            fields.setdefault(name, []).append(
+                value.getvalue().decode('utf8')
+            )
+
+    # skip the epilogue, the connection may be reused
+    while reader._fill():
+        reader.buffer = b''
+    return fields
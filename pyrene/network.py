@@ -10,7 +10,7 @@ except ImportError:
         import configparser
         return configparser.ConfigParser(interpolation=None)
 
-from .repos import BadRepo, DirectoryRepo, HttpRepo
+from .repos import BadRepo, DirectoryRepo, HttpRepo, UnionRepo
 from .constants import REPO, REPOTYPE
 
 
@@ -23,12 +23,15 @@ class Network(object):
     REPO_TYPES = {
         REPOTYPE.DIRECTORY,
         REPOTYPE.HTTP,
+        REPOTYPE.UNION,
     }
 
     REPO_ATTRIBUTES = set(
         DirectoryRepo.ATTRIBUTES
     ).union(
         set(HttpRepo.ATTRIBUTES)
+    ).union(
+        set(UnionRepo.ATTRIBUTES)
     )
 
     REPO_SECTION_PREFIX = 'repo:'
@@ -36,6 +39,7 @@ class Network(object):
     TYPE_TO_CLASS = {
         REPOTYPE.DIRECTORY: DirectoryRepo,
         REPOTYPE.HTTP: HttpRepo,
+        REPOTYPE.UNION: UnionRepo,
     }
 
     # name of active/default/ repo
@@ -47,6 +51,10 @@ class Network(object):
         self.active_repo = None
         self.reload()
 
+    @property
+    def filename(self):
+        return self._repo_store_filename
+
     def reload(self):
         self._config = RawConfigParser()
         if os.path.exists(self._repo_store_filename):
@@ -69,7 +77,9 @@ class Network(object):
         repo_type = attributes.get(REPO.TYPE)
 
         repo_class = self.TYPE_TO_CLASS.get(repo_type, BadRepo)
-        return repo_class(repo_name, attributes)
+        repo = repo_class(repo_name, attributes)
+        repo.network = self
+        return repo
 
     def define(self, repo_name):
         repokey = self.REPO_SECTION_PREFIX + repo_name
@@ -120,6 +130,10 @@ class Network(object):
         self.define(repo)
         self.set(repo, REPO.TYPE, REPOTYPE.DIRECTORY)
 
+    def define_union_repo(self, repo):
+        self.define(repo)
+        self.set(repo, REPO.TYPE, REPOTYPE.UNION)
+
     def setup_for_pypi_python_org(self, repo):
         self.set(repo, REPO.TYPE, REPOTYPE.HTTP)
         self.set(repo, REPO.DOWNLOAD_URL, 'https://pypi.python.org/simple/')
@@ -0,0 +1,810 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import contextlib
+import email.parser
+import hashlib
+import os
+import re
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+import pkg_resources
+try:
+    from packaging.tags import sys_tags
+except ImportError:
+    # only pure python wheels are known to be installable
+    sys_tags = None
+
+
+WHEEL_EXTENSION = '.whl'
+SDIST_EXTENSIONS = ('.tar.gz', '.tar.bz2', '.tar.xz', '.tgz', '.zip', '.tar')
+OTHER_EXTENSIONS = ('.egg', '.exe', '.msi', '.rpm', '.dmg')
+PACKAGE_EXTENSIONS = (WHEEL_EXTENSION,) + SDIST_EXTENSIONS + OTHER_EXTENSIONS
+
+
+def normalize_name(name):
+    '''Project name as in PEP 503 (e.g. Foo.Bar_baz -> foo-bar-baz)'''
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def is_package_file(filename):
+    return filename.lower().endswith(PACKAGE_EXTENSIONS)
+
+
+def _strip_extension(filename):
+    lower = filename.lower()
+    for extension in PACKAGE_EXTENSIONS:
+        if lower.endswith(extension):
+            return filename[:-len(extension)]
+    return None
+
+
+def parse_filename(filename):
+    '''
+    Guess (project name, version) from a package file name.
+
+    Returns None for files that do not look like package files.
+    '''
+    basename = _strip_extension(filename)
+    if not basename:
+        return None
+
+    if filename.lower().endswith((WHEEL_EXTENSION, '.egg')):
+        # name and version never contain '-' in binary distributions
+        parts = basename.split('-')
+        if len(parts) < 2:
+            return None
+        return parts[0], parts[1]
+
+    # sdist: the version starts with the first '-' followed by a digit
+    match = re.match(r'^(.+?)-(\d.*)$', basename)
+    if not match:
+        return None
+    name, version = match.groups()
+    return name, version
+
+
+class DirectoryIndex(object):
+
+    '''
+    Package files in a directory, grouped by normalized project name.
+
+    The directory is rescanned by `refresh` only when its modification
+    time changed, so it is cheap to call before every lookup.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.projects = {}
+        # incremented on every change, usable as a cache key
+        self.generation = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self.directory).st_mtime
+        except OSError:
+            return None
+
+    def refresh(self):
+        mtime = self._get_mtime()
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            projects = {}
+            filenames = os.listdir(self.directory) if mtime else []
+            for filename in filenames:
+                self._add(projects, filename)
+            self.projects = projects
+            self._mtime = mtime
+            self.generation += 1
+
+    @contextlib.contextmanager
+    def changing(self):
+        '''
+        Wrap own changes of the directory, registered with add/remove.
+
+        If the index was up to date before, the changed directory
+        modification time does not trigger a rescan.
+        '''
+        before = self._get_mtime()
+        yield
+        after = self._get_mtime()
+        with self._lock:
+            if self._mtime is not None and self._mtime == before:
+                self._mtime = after
+
+    def add(self, filename):
+        '''Register a new file without rescanning the directory'''
+        with self._lock:
+            projects = dict(self.projects)
+            parsed = parse_filename(filename)
+            if parsed:
+                project = normalize_name(parsed[0])
+                projects[project] = set(projects.get(project, ()))
+            self._add(projects, filename)
+            self.projects = projects
+            self.generation += 1
+
+    def remove(self, filename):
+        with self._lock:
+            parsed = parse_filename(filename)
+            if not parsed:
+                return
+            project = normalize_name(parsed[0])
+            projects = dict(self.projects)
+            filenames = projects.get(project, set()) - {filename}
+            if filenames:
+                projects[project] = filenames
+            else:
+                projects.pop(project, None)
+            self.projects = projects
+            self.generation += 1
+
+    def _add(self, projects, filename):
+        parsed = parse_filename(filename)
+        if not parsed:
+            return
+        path = os.path.join(self.directory, filename)
+        if not os.path.isfile(path):
+            return
+        project = normalize_name(parsed[0])
+        projects.setdefault(project, set()).add(filename)
+
+    @property
+    def project_names(self):
+        return sorted(self.projects)
+
+    def get_filenames(self, project):
+        return sorted(self.projects.get(normalize_name(project), ()))
+
+    def get_path(self, filename):
+        '''Path of filename if it is a known package file or None'''
+        if filename != os.path.basename(filename):
+            return None
+        parsed = parse_filename(filename)
+        if not parsed:
+            return None
+        if filename not in self.projects.get(normalize_name(parsed[0]), ()):
+            return None
+        return os.path.join(self.directory, filename)
+
+
+class MergedIndex(object):
+
+    '''
+    Ordered union of indexes (DirectoryIndex or alike).
+
+    Each project is taken from the first index having it, with all its
+    files there: projects in later indexes are shadowed, not mixed in.
+    The merged mapping is precomputed, and recomputed only when one of the
+    indexes changed.
+    '''
+
+    def __init__(self, indexes):
+        self.indexes = list(indexes)
+        self.projects = {}
+        # project -> position of index providing it
+        self.owners = {}
+        self.generation = 0
+        self._generations = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        for index in self.indexes:
+            index.refresh()
+        generations = tuple(index.generation for index in self.indexes)
+        if generations == self._generations:
+            return
+
+        with self._lock:
+            projects = {}
+            owners = {}
+            for position, index in enumerate(self.indexes):
+                for project, filenames in index.projects.items():
+                    if project not in projects:
+                        projects[project] = filenames
+                        owners[project] = position
+            self.projects = projects
+            self.owners = owners
+            self._generations = generations
+            self.generation += 1
+
+    @property
+    def project_names(self):
+        return sorted(self.projects)
+
+    def get_filenames(self, project):
+        return sorted(self.projects.get(normalize_name(project), ()))
+
+    def get_path(self, filename):
+        parsed = parse_filename(filename)
+        if not parsed:
+            return None
+        owner = self.owners.get(normalize_name(parsed[0]))
+        if owner is None:
+            return None
+        return self.indexes[owner].get_path(filename)
+
+
+METADATA_SUFFIX = '.metadata'
+METADATA_DIRECTORY = '.pyrene-metadata'
+
+
+def read_wheel_metadata(path):
+    '''Content of the METADATA file in a wheel, None if unreadable'''
+    try:
+        with zipfile.ZipFile(path) as wheel:
+            names = [
+                name for name in wheel.namelist()
+                if name.count('/') == 1
+                and name.endswith('.dist-info/METADATA')
+            ]
+            if len(names) != 1:
+                return None
+            return wheel.read(names[0])
+    except (IOError, OSError, zipfile.BadZipfile, KeyError):
+        return None
+
+
+class MetadataStore(object):
+
+    '''
+    Core metadata files (PEP 658) of the wheels in a directory.
+
+    They are extracted from the wheels once, into METADATA_DIRECTORY (so the
+    directory itself does not change), and remade only when the wheel is
+    newer than its metadata file.
+    '''
+
+    def __init__(self, directory, workers=4):
+        self.directory = directory
+        self.metadata_directory = os.path.join(directory, METADATA_DIRECTORY)
+        self.workers = workers
+        # wheel filename -> (wheel mtime, sha256 of metadata or None)
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get_path(self, filename):
+        return os.path.join(
+            self.metadata_directory, filename + METADATA_SUFFIX
+        )
+
+    def get_hash(self, filename):
+        '''
+        sha256 hex digest of the wheel's metadata file, made if needed.
+
+        None for other files and wheels without readable metadata.
+        '''
+        if not filename.lower().endswith(WHEEL_EXTENSION):
+            return None
+        try:
+            wheel_mtime = os.stat(
+                os.path.join(self.directory, filename)
+            ).st_mtime
+        except OSError:
+            return None
+        cached = self._hashes.get(filename)
+        if cached and cached[0] == wheel_mtime:
+            return cached[1]
+
+        digest = self._read_hash(filename, wheel_mtime)
+        if digest is None:
+            digest = self._make(filename)
+        with self._lock:
+            self._hashes[filename] = wheel_mtime, digest
+        return digest
+
+    def _read_hash(self, filename, wheel_mtime):
+        path = self.get_path(filename)
+        try:
+            if os.stat(path).st_mtime < wheel_mtime:
+                return None
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except (IOError, OSError):
+            return None
+
+    def _make(self, filename):
+        metadata = read_wheel_metadata(os.path.join(self.directory, filename))
+        if metadata is None:
+            return None
+        try:
+            os.makedirs(self.metadata_directory)
+        except OSError:
+            pass
+        try:
+            fd, temp_path = tempfile.mkstemp(
+                dir=self.metadata_directory, prefix='.' + filename
+            )
+        except OSError:
+            return None
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(metadata)
+            os.rename(temp_path, self.get_path(filename))
+        except (IOError, OSError):
+            os.remove(temp_path)
+            return None
+        return hashlib.sha256(metadata).hexdigest()
+
+    def update(self, filenames):
+        '''Make the missing or outdated metadata files, in parallel'''
+        wheels = [
+            filename for filename in filenames
+            if filename.lower().endswith(WHEEL_EXTENSION)
+        ]
+        if not wheels:
+            return
+        pool = ThreadPool(min(self.workers, len(wheels)))
+        try:
+            pool.map(self.get_hash, wheels)
+        finally:
+            pool.close()
+            pool.join()
+
+    def remove(self, filename):
+        with self._lock:
+            self._hashes.pop(filename, None)
+        try:
+            os.remove(self.get_path(filename))
+        except OSError:
+            pass
+
+
+# foo==1.0 (also ===), without extras, markers or wildcards
+PINNED_REQUIREMENT = re.compile(
+    r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*===?\s*([A-Za-z0-9][A-Za-z0-9.+!_-]*)'
+    r'\s*$'
+)
+
+
+def parse_pinned_requirement(requirement):
+    '''(name, version) of an exactly pinned requirement, None for others'''
+    match = PINNED_REQUIREMENT.match(requirement)
+    if not match:
+        return None
+    return match.groups()
+
+
+def _version_key(version):
+    '''Comparable form of a version, 1.0 and 1.0.0 being the same'''
+    match = re.match(r'^v?(\d+(?:\.\d+)*)(.*)$', version.lower())
+    if not match:
+        return (), version.lower()
+    release, rest = match.groups()
+    numbers = [int(number) for number in release.split('.')]
+    while len(numbers) > 1 and numbers[-1] == 0:
+        numbers.pop()
+    return tuple(numbers), rest
+
+
+def versions_equal(version1, version2):
+    return _version_key(version1) == _version_key(version2)
+
+
+def parse_wheel_tags(filename):
+    '''Set of (python, abi, platform) tags of a wheel, None if not one'''
+    if not filename.lower().endswith(WHEEL_EXTENSION):
+        return None
+    parts = filename[:-len(WHEEL_EXTENSION)].lower().split('-')
+    if len(parts) not in (5, 6):
+        return None
+    pythons, abis, platforms = parts[-3:]
+    return {
+        (python, abi, platform)
+        for python in pythons.split('.')
+        for abi in abis.split('.')
+        for platform in platforms.split('.')
+    }
+
+
+_supported_tags = []
+
+
+def get_supported_tags():
+    '''
+    Wheel tags installable by the running python, most preferred first.
+
+    Without the packaging library, only those of pure python wheels.
+    '''
+    if not _supported_tags:
+        if sys_tags is not None:
+            tags = [
+                (tag.interpreter, tag.abi, tag.platform)
+                for tag in sys_tags()
+            ]
+        else:
+            major, minor = sys.version_info[:2]
+            pythons = (
+                ['py{}{}'.format(major, minor), 'py{}'.format(major)]
+                + ['py{}{}'.format(major, m) for m in range(minor - 1, -1, -1)]
+            )
+            tags = [(python, 'none', 'any') for python in pythons]
+        _supported_tags[:] = tags
+    return list(_supported_tags)
+
+
+# platform tag prefix -> (sys_platform, platform_system) of markers
+PLATFORM_SYSTEMS = (
+    ('linux', ('linux', 'Linux')),
+    ('manylinux', ('linux', 'Linux')),
+    ('musllinux', ('linux', 'Linux')),
+    ('win', ('win32', 'Windows')),
+    ('macosx', ('darwin', 'Darwin')),
+)
+
+# platform tag suffix -> platform_machine of markers
+PLATFORM_MACHINES = (
+    ('win32', 'x86'),
+    ('amd64', 'AMD64'),
+    ('arm64', 'ARM64'),
+    ('x86_64', 'x86_64'),
+    ('aarch64', 'aarch64'),
+    ('i686', 'i686'),
+)
+
+
+# legacy manylinux platform tags -> glibc minor version (PEP 600)
+MANYLINUX_ALIASES = {'manylinux1': 5, 'manylinux2010': 12, 'manylinux2014': 17}
+
+
+def expand_platform(platform):
+    '''
+    Platform tags installable where platform is, most preferred first.
+
+    For manylinux, those of older glibc versions too (PEP 600).
+    '''
+    match = re.match(
+        r'^(manylinux\w+?)_(x86_64|i686|aarch64|armv7l|ppc64le|ppc64|s390x)$',
+        platform
+    )
+    if not match:
+        return [platform]
+    name, arch = match.groups()
+    if name in MANYLINUX_ALIASES:
+        glibc_minor = MANYLINUX_ALIASES[name]
+    else:
+        glibc = re.match(r'^manylinux_2_(\d+)$', name)
+        if not glibc:
+            return [platform]
+        glibc_minor = int(glibc.group(1))
+    platforms = [platform]
+    for minor in range(glibc_minor, 4, -1):
+        platforms.append('manylinux_2_{}_{}'.format(minor, arch))
+        for alias, alias_minor in sorted(MANYLINUX_ALIASES.items()):
+            if alias_minor == minor:
+                platforms.append('{}_{}'.format(alias, arch))
+    return list(unique(platforms))
+
+
+class Target(object):
+
+    '''
+    What copied package files are for: a python version ('3.9'), platform
+    tags ('manylinux2014_x86_64') and ABI tags ('cp39'), those not given
+    being the running python's.
+    '''
+
+    def __init__(self, python_version=None, platforms=(), abis=()):
+        self.python_version = python_version
+        self.platforms = [platform.lower() for platform in platforms]
+        self.abis = [abi.lower() for abi in abis]
+        if python_version is None:
+            self.major, self.minor = sys.version_info[:2]
+        else:
+            try:
+                major, _, minor = python_version.partition('.')
+                if not minor and len(major) > 1:
+                    # 39
+                    major, minor = major[0], major[1:]
+                self.major, self.minor = int(major), int(minor)
+            except ValueError:
+                raise ValueError(
+                    'Invalid python version {}'.format(python_version)
+                )
+
+    def __repr__(self):
+        return 'Target({!r}, {!r}, {!r})'.format(
+            self.python_version, self.platforms, self.abis
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Target) and repr(self) == repr(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    @property
+    def is_specific(self):
+        '''Whether it is not simply the running python'''
+        return bool(self.python_version or self.platforms or self.abis)
+
+    @property
+    def tags(self):
+        '''Wheel tags installable on the target, most preferred first'''
+        if not self.is_specific:
+            return get_supported_tags()
+        supported = get_supported_tags()
+        platforms = list(unique(
+            expanded
+            for platform in self.platforms
+            for expanded in expand_platform(platform)
+        )) or list(unique(
+            platform for _, _, platform in supported if platform != 'any'
+        ))
+        cpython = 'cp{}{}'.format(self.major, self.minor)
+        abis = self.abis or [cpython, 'abi3']
+        pythons = (
+            [
+                'py{}{}'.format(self.major, self.minor),
+                'py{}'.format(self.major),
+            ] + [
+                'py{}{}'.format(self.major, minor)
+                for minor in range(self.minor - 1, -1, -1)
+            ]
+        )
+        tags = []
+        for abi in abis:
+            if abi == 'abi3':
+                tags.extend(
+                    ('cp{}{}'.format(self.major, minor), abi, platform)
+                    for minor in range(self.minor, 1, -1)
+                    for platform in platforms
+                )
+            elif abi != 'none':
+                tags.extend((cpython, abi, platform) for platform in platforms)
+        tags.extend((cpython, 'none', platform) for platform in platforms)
+        tags.extend(
+            (python, 'none', platform)
+            for python in pythons for platform in platforms
+        )
+        tags.append((cpython, 'none', 'any'))
+        tags.extend((python, 'none', 'any') for python in pythons)
+        return tags
+
+    @property
+    def environment(self):
+        '''Marker environment (PEP 508) values known of the target'''
+        environment = {}
+        if self.python_version:
+            environment['python_version'] = '{}.{}'.format(
+                self.major, self.minor
+            )
+            environment['python_full_version'] = '{}.{}.0'.format(
+                self.major, self.minor
+            )
+        if self.platforms:
+            platform = self.platforms[0]
+            for prefix, (sys_platform, system) in PLATFORM_SYSTEMS:
+                if platform.startswith(prefix):
+                    environment['sys_platform'] = sys_platform
+                    environment['platform_system'] = system
+                    break
+            for suffix, machine in PLATFORM_MACHINES:
+                if platform.endswith(suffix):
+                    environment['platform_machine'] = machine
+                    break
+        return environment
+
+    def allows_python(self, requires_python):
+        '''Whether the Requires-Python of a package file allows the target'''
+        if not requires_python:
+            return True
+        version = '{}.{}'.format(self.major, self.minor)
+        try:
+            requirement = pkg_resources.Requirement.parse(
+                'python' + requires_python.strip()
+            )
+            return version in requirement
+        except ValueError:
+            # pip ignores invalid Requires-Python
+            return True
+
+    def get_pip_options(self):
+        '''pip options for downloading for the target (wheels only)'''
+        options = []
+        for platform in self.platforms:
+            options.extend(['--platform', platform])
+        if self.python_version:
+            options.extend(
+                ['--python-version', '{}.{}'.format(self.major, self.minor)]
+            )
+        for abi in self.abis:
+            options.extend(['--abi', abi])
+        if options:
+            options.append('--only-binary=:all:')
+        return options
+
+
+def unique(items):
+    seen = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            yield item
+
+
+def select_file(filenames, name, version, tags=None):
+    '''
+    The package file pip would download for name==version, or None.
+
+    Like `pip --no-use-wheel` by default: an sdist, .tar.gz preferred.
+    Given the wheel tags to install for (most preferred first), the wheel
+    with the most preferred tag is taken if there is one.
+    '''
+    ranks = {}
+    for rank, tag in enumerate(tags or ()):
+        ranks.setdefault(tag, rank)
+    candidates = []
+    for filename in filenames:
+        parsed = parse_filename(filename)
+        if not parsed:
+            continue
+        if normalize_name(parsed[0]) != normalize_name(name):
+            continue
+        if not versions_equal(parsed[1], version):
+            continue
+        lower = filename.lower()
+        if tags is not None and lower.endswith(WHEEL_EXTENSION):
+            wheel_ranks = [
+                ranks[tag]
+                for tag in parse_wheel_tags(lower) or ()
+                if tag in ranks
+            ]
+            if wheel_ranks:
+                candidates.append(((0, min(wheel_ranks)), filename))
+            continue
+        for preference, extension in enumerate(SDIST_EXTENSIONS):
+            if lower.endswith(extension):
+                candidates.append(((1, preference), filename))
+                break
+    if not candidates:
+        return None
+    return min(candidates)[1]
+
+
+def parse_requires_dist(values):
+    '''Requires-Dist values without those only for extras'''
+    return [
+        value.strip() for value in values
+        if not re.search(r'\bextra\s*==', value.partition(';')[2])
+    ]
+
+
+def parse_requires_txt(text):
+    '''
+    Requirements of a setuptools requires.txt, without those of extras.
+
+    Requirements of [:marker] sections get their marker appended.
+    '''
+    requirements = []
+    section = ''
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            section = line[1:-1]
+            continue
+        extra, colon, marker = section.partition(':')
+        if extra:
+            continue
+        requirements.append(line + ('; ' + marker if colon else ''))
+    return requirements
+
+
+def parse_metadata_requirements(metadata):
+    '''
+    Requirements from core metadata (PKG-INFO, METADATA) text.
+
+    None if they are not known from it.
+    '''
+    message = email.parser.Parser().parsestr(metadata, headersonly=True)
+    requires_dist = message.get_all('Requires-Dist') or []
+    version = message.get('Metadata-Version', '')
+    dynamic = [value.lower() for value in message.get_all('Dynamic') or []]
+    if requires_dist or (
+            _version_key(version) >= _version_key('2.2')
+            and 'requires-dist' not in dynamic):
+        return parse_requires_dist(requires_dist)
+    return None
+
+
+def _read_sdist_members(path):
+    '''{member name: content} of PKG-INFO and requires.txt files'''
+    wanted = re.compile(
+        r'^[^/]+/(?:[^/]+/)?'
+        r'(?:PKG-INFO|[^/]+\.egg-info/(?:PKG-INFO|requires\.txt))$'
+    )
+    members = {}
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if wanted.match(name):
+                    members[name] = archive.read(name)
+    else:
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.isfile() and wanted.match(member.name):
+                    members[member.name] = archive.extractfile(member).read()
+    return members
+
+
+def read_requirements(path):
+    '''
+    Requirements of the distribution in package file path.
+
+    Requirements of extras are left out; None when they are not known
+    (not readable, no or incomplete metadata).
+    '''
+    return read_dependency_metadata(path)[0]
+
+
+def get_requires_python(metadata):
+    '''Requires-Python of core metadata text, None if not given'''
+    message = email.parser.Parser().parsestr(metadata, headersonly=True)
+    return message.get('Requires-Python') or None
+
+
+def read_dependency_metadata(path):
+    '''
+    (requirements, Requires-Python) of the distribution in package file
+    path.
+
+    requirements are like for read_requirements, Requires-Python is None
+    when not known.
+    '''
+    filename = os.path.basename(path).lower()
+    if filename.endswith(WHEEL_EXTENSION):
+        metadata = read_wheel_metadata(path)
+        if metadata is None:
+            return None, None
+        message = email.parser.Parser().parsestr(
+            metadata.decode('utf8', 'replace'), headersonly=True
+        )
+        return (
+            parse_requires_dist(message.get_all('Requires-Dist') or []),
+            message.get('Requires-Python') or None
+        )
+    if not filename.endswith(SDIST_EXTENSIONS):
+        return None, None
+
+    try:
+        members = _read_sdist_members(path)
+    except (IOError, OSError, EOFError, tarfile.TarError, zipfile.BadZipfile):
+        return None, None
+    pkg_info = sorted(
+        (name for name in members if name.endswith('PKG-INFO')), key=len
+    )
+    requires_python = None
+    if pkg_info:
+        requires_python = get_requires_python(
+            members[pkg_info[0]].decode('utf8', 'replace')
+        )
+    egg_info = [name for name in members if '.egg-info/' in name]
+    for name in sorted(egg_info, key=len):
+        if name.endswith('requires.txt'):
+            return (
+                parse_requires_txt(members[name].decode('utf8', 'replace')),
+                requires_python
+            )
+    if egg_info:
+        # setuptools writes requires.txt only if there are requirements
+        return [], requires_python
+    if pkg_info:
+        return (
+            parse_metadata_requirements(
+                members[pkg_info[0]].decode('utf8', 'replace')
+            ),
+            requires_python
+        )
+    return None, requires_python
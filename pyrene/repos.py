@@ -3,14 +3,55 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import abc
+import functools
 import os
 import sys
 import shutil
 import subprocess
 import tempfile
-from .util import set_env, write_file, print_command
-from .util import pip_install, PyPI, red, green, yellow, bold
-from .constants import REPO
+import threading
+from multiprocessing.pool import ThreadPool
+from .util import write_file, print_command
+from .util import pip_install, red, green, yellow, bold, HTPASSWD_FILE
+from .server import PackageServer, ProxyServer, MultiServer, UnionServer
+from .eviction import Evictor, EVICTION_ORDER, parse_size
+from .packages import MetadataStore
+from .httpcache import PageCache, DEFAULT_TTL
+from .mirrors import MirrorSet, split_urls
+from .simple import IndexReader
+from .fetch import download_pinned, fetch_files, LocalFile, RemoteFile
+from .fetch import DEFAULT_WORKERS
+from .depgraph import DependencyGraph
+from .lockfile import download_locked
+from .wheelhouse import WheelBuilder
+from .packages import DirectoryIndex, Target, select_file
+from .packages import parse_filename, normalize_name
+from .constants import REPO, REPOTYPE
+
+
+def is_true(value):
+    '''Boolean attribute value'''
+    return value.lower() in {'y', 'yes', 't', 'true'}
+
+
+def unique_requirements(requirements):
+    '''requirements without repetitions, in order'''
+    seen = set()
+    unique = []
+    for requirement in requirements:
+        key = ' '.join(requirement.split())
+        if key not in seen:
+            seen.add(key)
+            unique.append(key)
+    return unique
+
+
+def pip_format_options(wheels, target=None):
+    '''pip install options for downloading wheels or only sdists'''
+    if not wheels:
+        return ['--no-use-wheel']
+    # pip takes wheels when there are
+    return target.get_pip_options() if target else []
 
 
 class UploadError(Exception):
@@ -47,7 +88,11 @@ class Repo(object):
     ATTRIBUTES = (REPO.TYPE,)
     DEFAULTS = {}
     UPLOADER = BaseUploader
+    # False if the uploader does not store anything
+    accepts_uploads = True
     attributes = dict
+    # set by Network, needed by repos referring to other repos
+    network = None
 
     def __init__(self, name, attributes):
         super(Repo, self).__init__()
@@ -67,13 +112,147 @@ class Repo(object):
     def get_as_pip_conf(self):
         pass
 
+    def download_packages(
+            self, package_spec, directory, wheels=None, target=None):
+        '''
+        Download package_spec and its dependencies into directory.
+
+        Pinned requirements (foo==1.0) are copied directly from the repo,
+        pip is used for what needs resolving.
+        Only package files for target (a Target, the running python by
+        default) are taken, wheels preferred as decided by prefers_wheels.
+        '''
+        self.download_requirements([package_spec], directory, wheels, target)
+
+    def download_requirements(
+            self, requirements, directory, wheels=None, target=None):
+        '''
+        Download requirements and their dependencies into directory, like
+        download_packages, resolving them together.
+        '''
+        target = target or Target()
+        wheels = self.prefers_wheels(wheels, target)
+        requirements = download_pinned(
+            self.get_package_files, unique_requirements(requirements),
+            directory.path, target.tags if wheels else None, target
+        )
+        self.download_with_pip(requirements, directory, wheels, target)
+
+    def download_locked(
+            self, requirements, directory, wheels=None, target=None):
+        '''
+        Fetch the files of LockedRequirements (see lockfile) into directory,
+        verifying their hashes, without resolving anything.
+
+        Returns the requirements that failed.
+        '''
+        target = target or Target()
+        wheels = self.prefers_wheels(wheels, target)
+        print(bold(' * Copying {} locked files'.format(len(requirements))))
+        try:
+            return download_locked(
+                self.get_package_files, requirements, directory.path,
+                target.tags if wheels else None, target
+            )
+        except NotImplementedError:
+            print(red(
+                '{}: files can not be copied from it directly'
+                .format(self.name)
+            ))
+            return list(requirements)
+
+    def prefers_wheels(self, wheels=None, target=None):
+        '''
+        Whether copies take wheels (sdists are the fallback).
+
+        Unless told by wheels, if the repo's prefer_wheels attribute says
+        so or the copy is for a specific target.
+        '''
+        if wheels is not None:
+            return wheels
+        return (
+            is_true(getattr(self, REPO.PREFER_WHEELS, 'no'))
+            or bool(target and target.is_specific)
+        )
+
+    def get_copy_target(self, python_version=None, platforms=(), abis=()):
+        '''
+        Target of copies into the repo: the given values, defaulting to the
+        target_* attributes.
+
+        Raises ValueError for invalid values.
+        '''
+        def attribute_list(attribute):
+            return getattr(self, attribute, '').replace(',', ' ').split()
+        return Target(
+            python_version or getattr(self, REPO.TARGET_PYTHON_VERSION, None),
+            platforms or attribute_list(REPO.TARGET_PLATFORM),
+            abis or attribute_list(REPO.TARGET_ABI),
+        )
+
+    def download_with_pip(self, requirements, directory, wheels, target):
+        if requirements:
+            msg = (
+                ' * Downloading {} and its dependencies'
+                .format(' '.join(requirements))
+            )
+            print(bold(msg))
+            self.pip_download(requirements, directory, wheels, target)
+
+    def get_package_files(self, project):
+        '''
+        {filename: LocalFile or RemoteFile} of project, None if unknown.
+
+        Raises NotImplementedError if files can not be copied directly.
+        '''
+        raise NotImplementedError
+
+    def get_manifest(self):
+        '''
+        {filename: LocalFile or RemoteFile} of all package files.
+
+        Raises NotImplementedError if the repo can not list them.
+        '''
+        raise NotImplementedError
+
+    def get_dependents(self, project):
+        '''
+        Sorted (filename, requirement) of package files requiring project.
+
+        Raises NotImplementedError if the repo does not know them.
+        '''
+        raise NotImplementedError
+
     @abc.abstractmethod
-    def download_packages(self, package_spec, directory):
+    def pip_download(
+            self, requirements, directory, wheels=False, target=None):
         pass
 
     def get_uploader(self):
         return self.UPLOADER(self)
 
+    def get_referred_repo(self, attribute, repo_class, repo_name=None):
+        '''
+        Repo named by attribute, or None (with error message) if unusable.
+
+        repo_name is for attributes listing several repos.
+        '''
+        repo_name = repo_name or getattr(self, attribute)
+        if self.network is None or repo_name not in self.network.repo_names:
+            print(red(
+                '{}: {} refers to unknown repo {}'
+                .format(self.name, attribute, repo_name)
+            ))
+            return None
+        repo = self.network.get_repo(repo_name)
+        if not isinstance(repo, repo_class):
+            print(red(
+                '{}: {} refers to {}, which is not a {} repo'
+                .format(self.name, attribute, repo_name, repo_class.TYPE)
+            ))
+            return None
+        return repo
+
     def upload_packages(self, package_files):
         with self.get_uploader() as upload:
             for package_file in package_files:
@@ -88,9 +267,31 @@ class Repo(object):
                 except UploadError as e:
                     print(bold(red(' * {}'.format(e))))
 
-    @abc.abstractmethod
+    def make_server(self):
+        '''
+        Configured server for the repo, None if not served by Pyrene.
+        '''
+        return None
+
     def serve(self):
-        pass
+        server = self.make_server()
+        if server is not None:
+            self.serve_reloading(server)
+
+    def serve_reloading(self, server):
+        '''Run server, picking up changes of the repo's configuration'''
+        reload_from_config(
+            server, [self], lambda repos: repos[0].make_server()
+        )
+        server.serve()
+
+    def make_member_server(self, seen):
+        '''
+        Server for serving the repo as part of a union.
+
+        seen: names of the unions containing this repo.
+        '''
+        return self.make_server()
 
     def print_attributes(self):
         def comment(text, color):
@@ -134,6 +335,7 @@ class BadRepo(Repo):
 
     ATTRIBUTES = {}
     DEFAULTS = {}
+    accepts_uploads = False
 
     def get_as_pip_conf(self):
         return PIPCONF_BADREPO
@@ -142,12 +344,27 @@ class BadRepo(Repo):
     def printable_name(self):
         return red('{} (a misconfigured repo!)'.format(self.name))
 
-    def download_packages(self, package_spec, directory):
+    def download_packages(
+            self, package_spec, directory, wheels=None, target=None):
         print(
             '{}: pretended to provide package "{}"'
             .format(self.printable_name, package_spec)
         )
 
+    def download_requirements(
+            self, requirements, directory, wheels=None, target=None):
+        print(
+            '{}: pretended to provide packages "{}"'
+            .format(self.printable_name, ' '.join(requirements))
+        )
+
+    def pip_download(
+            self, requirements, directory, wheels=False, target=None):
+        print(
+            '{}: pretended to download packages "{}"'
+            .format(self.printable_name, ' '.join(requirements))
+        )
+
     def upload_packages(self, package_files):
         if package_files:
             print(
@@ -159,7 +376,7 @@ class BadRepo(Repo):
         else:
             print('{}: nothing to upload'.format(self.printable_name))
 
-    def serve(self):
+    def make_server(self):
         print('{}: is not served'.format(self.printable_name))
 
 
@@ -184,12 +401,64 @@ class DirectoryUploader(BaseUploader):
 
         repository.ensure_repo_directory()
         self.directory = repository.directory
+        self.uploaded = []
+        self.metadata = MetadataStore(self.directory)
+        self.dependencies = DependencyGraph(self.directory)
+        try:
+            self.evictor = repository.make_evictor()
+        except ValueError as e:
+            print(red('{}: {}'.format(repository.name, e)))
+            self.evictor = None
+        if self.evictor:
+            self.evictor.on_evict = self.on_evict
+        self.wheels = repository.make_wheel_builder()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.wheels:
+            self.add_built_wheels()
+        # keep the repo within its budget, just uploaded files are kept
+        if self.evictor:
+            self.evictor.evict(keep=self.uploaded)
+        # metadata files for serving (PEP 658)
+        self.metadata.update(
+            filename for filename in self.uploaded
+            if os.path.exists(os.path.join(self.directory, filename))
+        )
+        if self.dependencies.update(self.uploaded):
+            try:
+                self.dependencies.save()
+            except (IOError, OSError) as e:
+                print(red('{}: {}'.format(self.repository, e)))
+
+    def add_built_wheels(self):
+        wheels, errors = self.wheels.wait()
+        for error in errors:
+            print(bold(red(' * {}'.format(error))))
+        for filename in wheels:
+            if filename in self.uploaded:
+                # also uploaded: the repo has the uploaded one
+                continue
+            print(green(' * Built {}'.format(filename)))
+            self.uploaded.append(filename)
+            if self.evictor:
+                self.evictor.touch(filename)
+
+    def on_evict(self, filename):
+        self.metadata.remove(filename)
+        self.dependencies.remove(filename)
 
     def upload(self, package_file):
         try:
             shutil.copy2(package_file, self.directory)
         except IOError as e:
             raise DirectoryUploadError(e, package_file)
+        filename = os.path.basename(package_file)
+        self.uploaded.append(filename)
+        if self.evictor:
+            self.evictor.touch(filename)
+        if self.wheels:
+            # built while the rest is uploaded
+            self.wheels.add(os.path.join(self.directory, filename))
 
 
 PIPCONF_DIRECTORYREPO = '''\
@@ -201,20 +470,34 @@ find-links = {directory}
 
 class DirectoryRepo(Repo):
 
+    TYPE = REPOTYPE.DIRECTORY
+
     ATTRIBUTES = (
         REPO.TYPE,
         REPO.DIRECTORY,
         REPO.VOLATILE,
         REPO.SERVE_INTERFACE,
         REPO.SERVE_PORT,
+        REPO.SERVE_WORKERS,
         REPO.SERVE_USERNAME,
         REPO.SERVE_PASSWORD,
+        REPO.CACHE_SIZE,
+        REPO.CACHE_POLICY,
+        REPO.PREFER_WHEELS,
+        REPO.BUILD_WHEELS,
+        REPO.TARGET_PYTHON_VERSION,
+        REPO.TARGET_PLATFORM,
+        REPO.TARGET_ABI,
     )
 
     DEFAULTS = {
         REPO.SERVE_INTERFACE: '0.0.0.0',
         REPO.SERVE_PORT: '8080',
+        REPO.SERVE_WORKERS: '16',
         REPO.VOLATILE: 'no',
+        REPO.CACHE_POLICY: 'lru',
+        REPO.PREFER_WHEELS: 'no',
+        REPO.BUILD_WHEELS: 'no',
     }
 
     UPLOADER = DirectoryUploader
@@ -222,32 +505,146 @@ class DirectoryRepo(Repo):
     def get_as_pip_conf(self):
         return PIPCONF_DIRECTORYREPO.format(directory=self.directory)
 
-    def download_packages(self, package_spec, directory):
-        self.ensure_repo_directory()
+    def download_requirements(
+            self, requirements, directory, wheels=None, target=None):
+        '''
+        Copy requirements and their dependencies to directory.
 
-        msg = ' * Downloading {} and its dependencies'.format(package_spec)
-        print(bold(msg))
-        pip_install(
-            '--no-use-wheel',
-            '--find-links', self.directory,
-            '--no-index',
-            '--download', directory.path,
-            package_spec,
+        The dependency closure is computed from the repo's dependency
+        graph, pip only resolves what is left.
+        '''
+        self.ensure_repo_directory()
+        target = target or Target()
+        wheels = self.prefers_wheels(wheels, target)
+        requirements = unique_requirements(requirements)
+        filenames, left = self.get_dependency_graph().closure(
+            requirements,
+            select=functools.partial(
+                select_file, tags=target.tags if wheels else None
+            ),
+            environment=target.environment,
+            target=target
         )
+        if filenames:
+            msg = (
+                ' * Copying {} and its dependencies'
+                .format(' '.join(requirements))
+            )
+            print(bold(msg))
+            failed = fetch_files(
+                (
+                    LocalFile(os.path.join(self.directory, filename))
+                    for filename in filenames
+                ),
+                directory.path
+            )
+            if failed:
+                left = requirements
+        self.download_with_pip(left, directory, wheels, target)
+
+    def get_dependency_graph(self):
+        '''The repo's up to date DependencyGraph'''
+        graph = DependencyGraph(self.directory)
+        graph.refresh()
+        return graph
+
+    def get_dependents(self, project):
+        return self.get_dependency_graph().get_dependents(project)
+
+    def get_package_files(self, project):
+        index = DirectoryIndex(self.directory)
+        index.refresh()
+        return {
+            filename: LocalFile(index.get_path(filename))
+            for filename in index.get_filenames(project)
+        }
+
+    def get_manifest(self):
+        index = DirectoryIndex(self.directory)
+        index.refresh()
+        return {
+            filename: LocalFile(index.get_path(filename))
+            for project in index.project_names
+            for filename in index.get_filenames(project)
+        }
+
+    def pip_download(
+            self, requirements, directory, wheels=False, target=None):
+        pip_install(*(
+            pip_format_options(wheels, target) + [
+                '--find-links', self.directory,
+                '--no-index',
+                '--download', directory.path,
+            ] + list(requirements)
+        ))
 
     def ensure_repo_directory(self):
         if not os.path.isdir(self.directory):
             os.makedirs(self.directory)
 
-    def serve(self, pypi_server=PyPI):
+    def get_cache_size(self):
+        '''
+        Size budget in bytes, None if unbounded.
+
+        Raises ValueError for invalid values.
+        '''
+        if REPO.CACHE_SIZE not in self.attributes:
+            return None
+        return parse_size(self.attributes[REPO.CACHE_SIZE])
+
+    def get_cache_policy(self):
+        policy = getattr(self, REPO.CACHE_POLICY).lower()
+        if policy not in EVICTION_ORDER:
+            raise ValueError(
+                'Invalid {}: {!r}, expected one of {}'.format(
+                    REPO.CACHE_POLICY, policy,
+                    ', '.join(sorted(EVICTION_ORDER))
+                )
+            )
+        return policy
+
+    def make_wheel_builder(self):
+        '''WheelBuilder for uploaded sdists, None if not wanted'''
+        if not is_true(getattr(self, REPO.BUILD_WHEELS)):
+            return None
+        return WheelBuilder(self.directory)
+
+    def make_evictor(self):
+        cache_size = self.get_cache_size()
+        if cache_size is None:
+            return None
+        return Evictor(self.directory, cache_size, self.get_cache_policy())
+
+    def setup_server(self, server):
+        '''
+        Configure server to serve the repo directory.
+
+        Raises ValueError on invalid attribute values.
+        '''
         self.ensure_repo_directory()
 
-        server = pypi_server()
         server.directory = self.directory
         server.interface = getattr(self, REPO.SERVE_INTERFACE)
         server.port = getattr(self, REPO.SERVE_PORT)
-        true = {'y', 'yes', 't', 'true'}
-        server.volatile = getattr(self, REPO.VOLATILE).lower() in true
+        server.workers = int(getattr(self, REPO.SERVE_WORKERS))
+        server.cache_size = self.get_cache_size()
+        server.cache_policy = self.get_cache_policy()
+        server.htpasswd_path = os.path.join(self.directory, HTPASSWD_FILE)
+
+    def serve(self, pypi_server=PackageServer):
+        server = self.make_server(pypi_server)
+        if server is not None:
+            self.serve_reloading(server)
+
+    def make_server(self, pypi_server=PackageServer):
+        server = pypi_server()
+        try:
+            self.setup_server(server)
+        except ValueError as e:
+            print(red('{}: {}'.format(self.name, e)))
+            return None
+
+        server.volatile = is_true(getattr(self, REPO.VOLATILE))
 
         try:
             username = getattr(self, REPO.SERVE_USERNAME)
@@ -257,7 +654,7 @@ class DirectoryRepo(Repo):
         else:
             server.add_user(username, password)
 
-        server.serve()
+        return server
 
 
 PYPIRC = '''\
@@ -280,9 +677,11 @@ class TwineUploader(BaseUploader):
 
     '''Upload packages with `twine`
 
-    `twine` requires a ~/.pypirc, so HOME is changed to a temporary directory
-    that contains a single .pypirc file with content generated for
+    `twine` requires a ~/.pypirc, so it is run with HOME set to a temporary
+    directory that contains a single .pypirc file with content generated for
     the destination repository.
+    The process environment is left alone, so that uploads to several
+    repositories can run at the same time.
     '''
 
     TWINE_UPLOAD = os.path.join(
@@ -290,15 +689,20 @@ class TwineUploader(BaseUploader):
         'twine-upload'
     )
 
+    # read once: never the temporary HOME of a concurrent upload
+    HOME = os.path.expanduser('~')
+
     def __init__(self, repository):
         super(TwineUploader, self).__init__(repository)
 
         self.pypirc_dir = tempfile.mkdtemp(
-            dir=os.path.expanduser('~'),
+            dir=self.HOME,
             prefix='.pyrene.pypirc'
         )
         pypirc = PYPIRC.format(repository)
-        write_file(os.path.join(self.pypirc_dir, '.pypirc'), pypirc)
+        write_file(
+            os.path.join(self.pypirc_dir, '.pypirc'), pypirc.encode('utf8')
+        )
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         shutil.rmtree(self.pypirc_dir)
@@ -306,19 +710,19 @@ class TwineUploader(BaseUploader):
         self.repository = None
 
     def upload(self, package_file):
-        with set_env('HOME', self.pypirc_dir):
-            cmd = [
-                self.TWINE_UPLOAD,
-                '--repository', self.repository,
-                '--comment', 'Uploaded with Pyrene',
-                package_file
-            ]
-            print_command(cmd)
-            retcode = subprocess.call(
-                cmd,
-                stdout=sys.stdout,
-                stderr=sys.stderr
-            )
+        cmd = [
+            self.TWINE_UPLOAD,
+            '--repository', self.repository,
+            '--comment', 'Uploaded with Pyrene',
+            package_file
+        ]
+        print_command(cmd)
+        retcode = subprocess.call(
+            cmd,
+            stdout=sys.stdout,
+            stderr=sys.stderr,
+            env=dict(os.environ, HOME=self.pypirc_dir)
+        )
 
         if retcode:
             raise TwineUploadError(package_file)
@@ -333,30 +737,384 @@ extra-index-url =
 
 class HttpRepo(Repo):
 
+    TYPE = REPOTYPE.HTTP
+
     ATTRIBUTES = (
         REPO.TYPE,
         REPO.UPLOAD_URL,
         REPO.DOWNLOAD_URL,
         REPO.USERNAME,
         REPO.PASSWORD,
+        REPO.CACHE_REPO,
+        REPO.CACHE_TTL,
+        REPO.PREFER_WHEELS,
+        REPO.TARGET_PYTHON_VERSION,
+        REPO.TARGET_PLATFORM,
+        REPO.TARGET_ABI,
     )
 
-    DEFAULTS = {}
+    DEFAULTS = {
+        REPO.CACHE_TTL: '600',
+        REPO.PREFER_WHEELS: 'no',
+    }
 
     UPLOADER = TwineUploader
 
+    # MirrorSet of the download urls, once needed
+    _mirrors = None
+
+    @property
+    def download_urls(self):
+        '''
+        The urls of download_url - more than one for mirrors.
+
+        The first one is the canonical url of the repo.
+        '''
+        return split_urls(self.download_url)
+
+    @property
+    def primary_download_url(self):
+        urls = self.download_urls
+        return urls[0] if urls else self.download_url
+
+    def get_mirrors(self, mirror_set=MirrorSet):
+        '''MirrorSet of the download urls, None for a single url'''
+        if len(self.download_urls) < 2:
+            return None
+        if self._mirrors is None:
+            self._mirrors = mirror_set(self.download_urls)
+        return self._mirrors
+
     def get_as_pip_conf(self):
-        return PIPCONF_HTTPREPO.format(download_url=self.download_url)
-
-    def download_packages(self, package_spec, directory):
-        msg = ' * Downloading {} and its dependencies'.format(package_spec)
-        print(bold(msg))
-        pip_install(
-            '--no-use-wheel',
-            '--index-url', self.download_url,
-            '--download', directory.path,
-            package_spec,
+        return PIPCONF_HTTPREPO.format(download_url=self.primary_download_url)
+
+    def get_package_files(self, project):
+        links = self.get_index_reader().get_links(project)
+        if links is None:
+            return None
+        mirrors = self.get_mirrors()
+        if mirrors is None:
+            return {link.filename: RemoteFile(link) for link in links}
+        return {
+            link.filename: RemoteFile(link, mirrors.open_stream)
+            for link in links
+        }
+
+    def get_manifest(self, workers=DEFAULT_WORKERS):
+        '''
+        Files of all projects in the index, several pages read at a time.
+
+        Projects whose page can not be read are left out.
+        '''
+        def get_files(project):
+            try:
+                return self.get_package_files(project) or {}
+            except IOError as e:
+                print(red('{}: {}: {}'.format(self.name, project, e)))
+                return {}
+
+        projects = self.get_index_reader().get_project_names()
+        manifest = {}
+        if not projects:
+            return manifest
+        pool = ThreadPool(min(workers, len(projects)))
+        try:
+            for files in pool.imap(get_files, projects):
+                manifest.update(files)
+        finally:
+            pool.close()
+            pool.join()
+        return manifest
+
+    def pip_download(
+            self, requirements, directory, wheels=False, target=None):
+        mirrors = self.get_mirrors()
+        # pip has no failover: give it the fastest reachable mirror
+        index_url = mirrors.ranked()[0] if mirrors else self.download_url
+        pip_install(*(
+            pip_format_options(wheels, target) + [
+                '--index-url', index_url,
+                '--download', directory.path,
+            ] + list(requirements)
+        ))
+
+    def get_index_reader(self, page_cache=PageCache):
+        '''
+        Reader of the index at download_url.
+
+        Pages are cached on disk for cache_ttl seconds, shared by all
+        pyrene processes, then revalidated. With mirrors they are cached
+        under the first url, and requested from the fastest mirror,
+        failing over to the others.
+        '''
+        try:
+            ttl = int(getattr(self, REPO.CACHE_TTL))
+        except ValueError as e:
+            print(red('{}: {}'.format(self.name, e)))
+            ttl = DEFAULT_TTL
+        mirrors = self.get_mirrors()
+        if mirrors is None:
+            return IndexReader(self.download_url, page_cache(ttl=ttl).open)
+        return IndexReader(
+            mirrors.url, page_cache(ttl=ttl, open_page=mirrors.open).open
         )
 
-    def serve(self):
-        print('Externally served at url {}'.format(self.download_url))
+    def serve(self, proxy_server=ProxyServer):
+        server = self.make_server(proxy_server)
+        if server is not None:
+            self.serve_reloading(server)
+
+    def make_server(self, proxy_server=ProxyServer):
+        '''
+        Serve through the cache repo (a directory repo) if there is one.
+
+        The cache repo's interface and port are used for serving.
+        '''
+        if REPO.CACHE_REPO not in self.attributes:
+            print('Externally served at url {}'.format(self.download_url))
+            return None
+
+        cache_repo = self.get_referred_repo(REPO.CACHE_REPO, DirectoryRepo)
+        if cache_repo is None:
+            return None
+
+        server = proxy_server()
+        server.upstream_url = self.primary_download_url
+        try:
+            server.ttl = int(getattr(self, REPO.CACHE_TTL))
+            cache_repo.setup_server(server)
+        except ValueError as e:
+            print(red('{}: {}'.format(self.name, e)))
+            return None
+        return server
+
+    def make_member_server(self, seen, proxy_server=ProxyServer):
+        if REPO.CACHE_REPO in self.attributes:
+            return self.make_server(proxy_server)
+
+        # uncached: the union links to upstream files
+        server = proxy_server()
+        server.upstream_url = self.primary_download_url
+        server.directory = None
+        try:
+            server.ttl = int(getattr(self, REPO.CACHE_TTL))
+        except ValueError as e:
+            print(red('{}: {}'.format(self.name, e)))
+            return None
+        return server
+
+
+PIPCONF_UNIONREPO = '''\
+[global]
+# Pyrene union repo {name}, available while served (serve {name})
+index-url = {index_url}
+extra-index-url =
+'''
+
+
+class UnionRepo(Repo):
+
+    '''
+    Ordered union of other repos, served as one index.
+
+    A project is provided by the first member repo having it.
+    '''
+
+    TYPE = REPOTYPE.UNION
+
+    ATTRIBUTES = (
+        REPO.TYPE,
+        REPO.REPOS,
+        REPO.SERVE_INTERFACE,
+        REPO.SERVE_PORT,
+        REPO.SERVE_WORKERS,
+        REPO.PREFER_WHEELS,
+    )
+
+    DEFAULTS = {
+        REPO.SERVE_INTERFACE: '0.0.0.0',
+        REPO.SERVE_PORT: '8080',
+        REPO.SERVE_WORKERS: '16',
+        REPO.PREFER_WHEELS: 'no',
+    }
+
+    accepts_uploads = False
+
+    @property
+    def member_names(self):
+        return getattr(self, REPO.REPOS).replace(',', ' ').split()
+
+    def get_members(self, seen=frozenset()):
+        seen = seen | {self.name}
+        members = []
+        for repo_name in self.member_names:
+            if repo_name in seen:
+                print(red(
+                    '{}: {} would contain itself through {}'
+                    .format(self.name, REPO.REPOS, repo_name)
+                ))
+                continue
+            repo = self.get_referred_repo(REPO.REPOS, Repo, repo_name)
+            if repo is not None:
+                members.append(repo)
+        return members
+
+    @property
+    def index_url(self):
+        interface = getattr(self, REPO.SERVE_INTERFACE)
+        if interface in ('', '0.0.0.0', '::'):
+            interface = 'localhost'
+        return 'http://{}:{}/simple/'.format(
+            interface, getattr(self, REPO.SERVE_PORT)
+        )
+
+    def get_as_pip_conf(self):
+        return PIPCONF_UNIONREPO.format(
+            name=self.name, index_url=self.index_url
+        )
+
+    def make_server(self, union_server=UnionServer, seen=frozenset()):
+        server = union_server()
+        try:
+            server.interface = getattr(self, REPO.SERVE_INTERFACE)
+            server.port = getattr(self, REPO.SERVE_PORT)
+            server.workers = int(getattr(self, REPO.SERVE_WORKERS))
+        except ValueError as e:
+            print(red('{}: {}'.format(self.name, e)))
+            return None
+
+        seen = seen | {self.name}
+        for repo in self.get_members(seen):
+            member_server = repo.make_member_server(seen)
+            if member_server is not None:
+                server.members.append(member_server)
+        return server
+
+    def make_member_server(self, seen):
+        return self.make_server(seen=seen)
+
+    def get_dependents(self, project):
+        '''Of the members knowing them'''
+        dependents = set()
+        known = False
+        for repo in self.get_members():
+            try:
+                dependents.update(repo.get_dependents(project))
+            except NotImplementedError:
+                continue
+            known = True
+        if not known:
+            raise NotImplementedError
+        return sorted(dependents)
+
+    def get_package_files(self, project):
+        '''From the first member having project, like when served'''
+        for repo in self.get_members():
+            files = repo.get_package_files(project)
+            if files:
+                return files
+        return None
+
+    def get_manifest(self):
+        '''Each project from the first member having it, like when served'''
+        manifest = {}
+        seen = set()
+        for repo in self.get_members():
+            projects = {}
+            for filename, package_file in repo.get_manifest().items():
+                parsed = parse_filename(filename)
+                project = normalize_name(parsed[0]) if parsed else filename
+                projects.setdefault(project, {})[filename] = package_file
+            for project, files in projects.items():
+                if project not in seen:
+                    seen.add(project)
+                    manifest.update(files)
+        return manifest
+
+    def pip_download(
+            self, requirements, directory, wheels=False, target=None):
+        server = self.make_server()
+        if server is None:
+            return
+
+        # serve the union privately for pip
+        server.interface = '127.0.0.1'
+        server.port = '0'
+        httpd = server.make_httpd()
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            index_url = 'http://127.0.0.1:{}/simple/'.format(
+                httpd.server_address[1]
+            )
+            pip_install(*(
+                pip_format_options(wheels, target) + [
+                    '--index-url', index_url,
+                    '--download', directory.path,
+                ] + list(requirements)
+            ))
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def upload_packages(self, package_files):
+        print(red(
+            '{}: union repos can not be uploaded to, upload to a member'
+            .format(self.name)
+        ))
+
+
+def reload_from_config(server, repos, make_server):
+    '''
+    Make a running server pick up configuration changes of repos.
+
+    On reload the configuration is re-read and make_server(repos) makes
+    the server with the new configuration.
+    '''
+    network = repos[0].network
+    if network is None:
+        return
+    repo_names = [repo.name for repo in repos]
+
+    def reload_server():
+        network.reload()
+        return make_server([network.get_repo(name) for name in repo_names])
+    server.config_file = network.filename
+    server.reload_server = reload_server
+
+
+def make_multi_server(repos, multi_server=MultiServer):
+    '''
+    Server for repos under /<repo name>/simple/, None if nothing to serve.
+
+    The interface and port of the first served repo are used, the worker
+    pool is shared, as large as the largest of the repos' pool.
+    '''
+    server = multi_server()
+    repo_servers = []
+    for repo in repos:
+        repo_server = repo.make_server()
+        if repo_server is not None:
+            repo_servers.append(repo_server)
+            server.add(repo.name, repo_server)
+
+    if not repo_servers:
+        print(red('Nothing to serve'))
+        return None
+
+    server.interface = repo_servers[0].interface
+    server.port = repo_servers[0].port
+    server.workers = max(repo_server.workers for repo_server in repo_servers)
+    return server
+
+
+def serve_repos(repos, multi_server=MultiServer):
+    '''Serve repos from one process under /<repo name>/simple/'''
+    server = make_multi_server(repos, multi_server)
+    if server is None:
+        return
+    reload_from_config(
+        server, repos, lambda repos: make_multi_server(repos, multi_server)
+    )
+    server.serve()
@@ -0,0 +1,1951 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import base64
+import contextlib
+import errno
+import gzip
+import hashlib
+import io
+import json
+import os
+import select
+import signal
+import socket
+import tempfile
+import threading
+import time
+from email.utils import formatdate, parsedate_tz, mktime_tz
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from Queue import Queue
+    from urllib import unquote
+    from urlparse import parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from queue import Queue
+    from urllib.parse import unquote, parse_qs
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+from passlib.apache import HtpasswdFile
+
+from .packages import DirectoryIndex, MergedIndex, MetadataStore
+from .packages import normalize_name, parse_filename, METADATA_SUFFIX
+from .depgraph import DependencyGraph
+from .eviction import Evictor, POLICY
+from .metrics import Metrics, CacheCounter
+from .multipart import parse_form, parse_header_params
+from .util import make_htpasswd, red, yellow
+from . import simple
+
+
+# versioned package files never change, unless the repo is volatile
+CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_CONTROL_REVALIDATE = 'no-cache'
+
+CHUNK_SIZE = 64 * 1024
+
+# for files being uploaded or downloaded, within the repo directory
+TEMP_DIRECTORY = '.pyrene-tmp'
+
+DEFAULT_WORKERS = 16
+
+# seconds a verified Authorization header is accepted without rehashing
+CREDENTIAL_CACHE_TTL = 300
+
+METRICS_PATH = '/metrics'
+
+# simple repository API content types (PEP 691)
+SIMPLE_JSON = simple.SIMPLE_JSON
+SIMPLE_HTML = simple.SIMPLE_HTML
+TEXT_HTML = 'text/html'
+SIMPLE_API_VERSION = '1.0'
+# the latest version is the only one
+CONTENT_TYPE_ALIASES = {
+    'application/vnd.pypi.simple.latest+json': SIMPLE_JSON,
+    'application/vnd.pypi.simple.latest+html': SIMPLE_HTML,
+}
+
+
+INDEX_PAGE = '''\
+<!DOCTYPE html>
+<html>
+  <head>
+    <meta name="pypi:repository-version" content="{version}">
+    <title>Simple index</title>
+  </head>
+  <body>
+{links}
+  </body>
+</html>
+'''
+
+PROJECT_PAGE = '''\
+<!DOCTYPE html>
+<html>
+  <head>
+    <meta name="pypi:repository-version" content="{version}">
+    <title>Links for {project}</title>
+  </head>
+  <body>
+    <h1>Links for {project}</h1>
+{links}
+  </body>
+</html>
+'''
+
+LINK = '    <a href="{href}"{attributes}>{text}</a><br/>'
+
+
+def render_link(href, text, attributes=()):
+    return LINK.format(
+        href=escape(href),
+        text=escape(text),
+        attributes=''.join(
+            ' {}="{}"'.format(name, escape(value))
+            for name, value in attributes
+        ),
+    )
+
+
+def render_index_page(project_names):
+    links = '\n'.join(
+        render_link(name + '/', name) for name in project_names
+    )
+    return INDEX_PAGE.format(links=links, version=SIMPLE_API_VERSION)
+
+
+def render_index_json(project_names):
+    return render_json({
+        'meta': {'api-version': SIMPLE_API_VERSION},
+        'projects': [{'name': name} for name in project_names],
+    })
+
+
+def render_json(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+def metadata_attributes(digest):
+    '''Link attributes advertising a core metadata file (PEP 658, 714)'''
+    if digest is None:
+        return []
+    value = 'sha256=' + digest
+    return [
+        ('data-dist-info-metadata', value),
+        ('data-core-metadata', value),
+    ]
+
+
+def strip_metadata_suffix(filename):
+    '''Package filename of a metadata filename'''
+    if filename.endswith(METADATA_SUFFIX):
+        return filename[:-len(METADATA_SUFFIX)]
+    return filename
+
+
+def render_project_page(project, links):
+    '''links: (href, filename, attributes) triples'''
+    return PROJECT_PAGE.format(
+        project=escape(project),
+        links='\n'.join(render_link(*link) for link in links),
+        version=SIMPLE_API_VERSION,
+    )
+
+
+def parse_hash(value):
+    '''{name: value} of a 'name=value' hash, empty if malformed'''
+    name, eq, digest = value.partition('=')
+    if not (eq and name and digest):
+        return {}
+    return {name: digest}
+
+
+def render_project_json(project, links):
+    '''links: (href, filename, attributes) triples, as for the HTML page'''
+    files = []
+    for href, filename, attributes in links:
+        url, _, fragment = href.partition('#')
+        attributes = dict(attributes)
+        entry = {
+            'filename': filename,
+            'url': url,
+            'hashes': parse_hash(fragment),
+        }
+        if 'data-requires-python' in attributes:
+            entry['requires-python'] = attributes['data-requires-python']
+        if 'data-core-metadata' in attributes:
+            metadata = parse_hash(attributes['data-core-metadata']) or True
+            entry['core-metadata'] = metadata
+            entry['dist-info-metadata'] = metadata
+        files.append(entry)
+    return render_json({
+        'meta': {'api-version': SIMPLE_API_VERSION},
+        'name': project,
+        'files': files,
+    })
+
+
+def make_index_page(project_names, last_modified):
+    project_names = list(project_names)
+    return Page(
+        render_index_page(project_names).encode('utf8'),
+        render_index_json(project_names).encode('utf8'),
+        last_modified,
+    )
+
+
+def make_project_page(project, links, last_modified):
+    links = list(links)
+    return Page(
+        render_project_page(project, links).encode('utf8'),
+        render_project_json(project, links).encode('utf8'),
+        last_modified,
+    )
+
+
+def negotiate_content_type(accept):
+    '''
+    Content type of the simple API to respond with to Accept (PEP 691).
+
+    Of equally acceptable types JSON is preferred, but clients accepting
+    anything (*/*, no Accept) get the classic text/html.
+    None if no supported type is acceptable.
+    '''
+    if not accept.strip():
+        return TEXT_HTML
+    qualities = {}
+    for media_range in accept.split(','):
+        media_type, params = parse_header_params(media_range)
+        try:
+            quality = float(params.get('q', 1))
+        except ValueError:
+            quality = 0
+        media_type = CONTENT_TYPE_ALIASES.get(media_type, media_type)
+        qualities[media_type] = max(quality, qualities.get(media_type, 0))
+
+    candidates = []
+    for preference, content_type in enumerate(
+            (SIMPLE_JSON, SIMPLE_HTML, TEXT_HTML)):
+        type_range = content_type.split('/')[0] + '/*'
+        for media_type, specificity in (
+                (content_type, 2), (type_range, 1)):
+            if media_type in qualities:
+                candidates.append(
+                    (qualities[media_type], specificity, -preference,
+                     content_type)
+                )
+                break
+    candidates = [c for c in candidates if c[0] > 0]
+    if candidates:
+        return max(candidates)[-1]
+    if qualities.get('*/*', 0) > 0:
+        return TEXT_HTML
+    return None
+
+
+class Representation(object):
+
+    '''A page body with its precompressed variant'''
+
+    def __init__(self, body):
+        self.body = body
+        self.gzipped = gzip_compress(body)
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.etag = '"{}"'.format(digest)
+        self.gzipped_etag = '"{}-gzip"'.format(digest)
+
+
+class Page(object):
+
+    '''A rendered simple API page, both as HTML and as JSON'''
+
+    def __init__(self, html, json, last_modified):
+        self.html = Representation(html)
+        self.json = Representation(json)
+        self.last_modified = last_modified
+
+    def get_representation(self, content_type):
+        if content_type == SIMPLE_JSON:
+            return self.json
+        return self.html
+
+
+def gzip_compress(data):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+class IndexPages(object):
+
+    '''
+    Simple index pages of a DirectoryIndex.
+
+    Pages are rendered and compressed once, and kept until the index changes.
+    '''
+
+    def __init__(self, index, cache=None, get_link_attributes=None):
+        self.index = index
+        self.cache = cache or CacheCounter()
+        # filename -> extra link attributes
+        self.get_link_attributes = get_link_attributes or (lambda _: ())
+        self._generation = None
+        self._pages = {}
+
+    def _get_pages(self):
+        self.index.refresh()
+        if self._generation != self.index.generation:
+            self._pages = {}
+            self._generation = self.index.generation
+        return self._pages
+
+    def get_index_page(self):
+        return self._get_page(None, self._render_index)
+
+    def get_project_page(self, project):
+        return self._get_page(project, self._render_project)
+
+    def _get_page(self, key, render):
+        pages = self._get_pages()
+        page = pages.get(key)
+        if page is not None:
+            self.cache.count('page', 'hit')
+            return page
+        page = render(key)
+        if page is None:
+            return None
+        self.cache.count('page', 'miss')
+        pages[key] = page
+        return page
+
+    def _render_index(self, _key):
+        return make_index_page(self.index.project_names, time.time())
+
+    def _render_project(self, project):
+        filenames = self.index.get_filenames(project)
+        if not filenames:
+            return None
+        return make_project_page(
+            project,
+            (
+                (
+                    '../../packages/' + filename, filename,
+                    self.get_link_attributes(filename)
+                )
+                for filename in filenames
+            ),
+            time.time()
+        )
+
+
+def make_temp_file(directory, filename):
+    '''
+    Open a temporary file in directory's TEMP_DIRECTORY.
+
+    It is on the same file system, so can be renamed into directory
+    atomically, and creating it does not change directory.
+    Returns (file, path).
+    '''
+    temp_directory = os.path.join(directory, TEMP_DIRECTORY)
+    try:
+        os.mkdir(temp_directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    fd, path = tempfile.mkstemp(
+        dir=temp_directory, prefix=filename + '.', suffix='.part'
+    )
+    return os.fdopen(fd, 'wb'), path
+
+
+def sync_file(f):
+    '''Flush f to disk, so that a renamed file is complete after a crash'''
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def sync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # not supported on all platforms/file systems
+        pass
+    finally:
+        os.close(fd)
+
+
+replace_file = getattr(os, 'replace', os.rename)
+
+
+def install_file(temp_path, path, overwrite):
+    '''
+    Move temp_path to path atomically.
+
+    Without overwrite an existing path is kept and False is returned,
+    also when racing with another install of the same path.
+    '''
+    if overwrite:
+        replace_file(temp_path, path)
+        return True
+    try:
+        os.link(temp_path, path)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            return False
+        raise
+    os.remove(temp_path)
+    return True
+
+
+def parse_basic_authorization(authorization):
+    '''(username, password) from a Basic Authorization header or None'''
+    scheme, _, credentials = authorization.partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        decoded = base64.b64decode(credentials.strip()).decode('utf8')
+    except (TypeError, ValueError):
+        return None
+    username, _, password = decoded.partition(':')
+    return username, password
+
+
+class CredentialCache(object):
+
+    '''
+    Recently verified Authorization headers.
+
+    Headers are kept as digests only, for `ttl` seconds, so that clients
+    sending the same credentials with every request do not pay for a
+    password hash each time.
+    '''
+
+    def __init__(self, ttl=CREDENTIAL_CACHE_TTL, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        # digest -> expiry time
+        self._verified = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(authorization):
+        return hashlib.sha256(authorization.encode('utf8')).digest()
+
+    def __contains__(self, authorization):
+        expires = self._verified.get(self._key(authorization))
+        return expires is not None and time.time() < expires
+
+    def add(self, authorization):
+        with self._lock:
+            if len(self._verified) >= self.max_size:
+                now = time.time()
+                self._verified = {
+                    key: expires
+                    for key, expires in self._verified.items()
+                    if expires > now
+                }
+                if len(self._verified) >= self.max_size:
+                    self._verified = {}
+            self._verified[self._key(authorization)] = time.time() + self.ttl
+
+
+class RepoSite(object):
+
+    '''What is served: a package directory and its upload users'''
+
+    accepts_uploads = True
+
+    def __init__(
+            self, directory, volatile=False, users=None, evictor=None,
+            htpasswd_path=None):
+        self.directory = directory
+        self.volatile = volatile
+        self.index = DirectoryIndex(directory)
+        self.metadata = MetadataStore(directory)
+        self.dependencies = DependencyGraph(directory)
+        self.cache = CacheCounter()
+        self.pages = IndexPages(
+            self.index, self.cache, self.get_link_attributes
+        )
+        self.htpasswd = self.make_htpasswd(users or {}, htpasswd_path)
+        self.credentials = CredentialCache()
+        self.require_auth = bool(users)
+        self.evictor = evictor
+        if evictor:
+            evictor.on_evict = self.on_evict
+
+    def start(self):
+        if self.evictor:
+            self.evictor.start()
+        # metadata files are made on demand, but mostly in advance here
+        thread = threading.Thread(target=self.make_metadata)
+        thread.daemon = True
+        thread.start()
+
+    def make_metadata(self):
+        try:
+            self.index.refresh()
+            self.metadata.update(
+                filename
+                for filenames in self.index.projects.values()
+                for filename in filenames
+            )
+        except (IOError, OSError):
+            # the directory is gone, nothing to serve anyway
+            pass
+
+    def on_evict(self, filename):
+        self.index.remove(filename)
+        self.metadata.remove(filename)
+        self.dependencies.remove(filename)
+
+    def save_dependencies(self):
+        try:
+            self.dependencies.save()
+        except (IOError, OSError):
+            # rebuilt from the package files when used
+            pass
+
+    def get_link_attributes(self, filename):
+        return metadata_attributes(self.metadata.get_hash(filename))
+
+    def close(self):
+        if self.evictor:
+            self.evictor.stop()
+
+    def get_listing(self):
+        '''Index of all projects (see UnionSite)'''
+        return self.index
+
+    def get_cache_counters(self):
+        return [self.cache]
+
+    def get_evictors(self):
+        return [self.evictor] if self.evictor else []
+
+    @staticmethod
+    def make_htpasswd(users, path):
+        if users and path:
+            try:
+                return make_htpasswd(path, users)
+            except (IOError, OSError):
+                pass
+        htpasswd = HtpasswdFile()
+        for username, password in users.items():
+            htpasswd.set_password(username, password)
+        return htpasswd
+
+    def check_password(self, username, password):
+        return bool(self.htpasswd.check_password(username, password))
+
+    def check_authorization(self, authorization):
+        if authorization in self.credentials:
+            self.cache.count('auth', 'hit')
+            return True
+        self.cache.count('auth', 'miss')
+        credentials = parse_basic_authorization(authorization)
+        if credentials is None or not self.check_password(*credentials):
+            return False
+        self.credentials.add(authorization)
+        return True
+
+    def get_index_page(self):
+        return self.pages.get_index_page()
+
+    def get_project_page(self, project):
+        return self.pages.get_project_page(project)
+
+    def get_package_path(self, filename):
+        self.index.refresh()
+        if filename.endswith(METADATA_SUFFIX):
+            return self.get_metadata_path(strip_metadata_suffix(filename))
+        path = self.index.get_path(filename)
+        if path and self.evictor:
+            self.evictor.touch(filename)
+        return path
+
+    def get_metadata_path(self, filename):
+        if self.index.get_path(filename) is None:
+            return None
+        if self.metadata.get_hash(filename) is None:
+            return None
+        return self.metadata.get_path(filename)
+
+    def open_upload(self, filename):
+        '''(file, temporary path) to receive an upload into'''
+        return make_temp_file(self.directory, filename)
+
+    def store_upload(self, temp_path, filename):
+        '''
+        Move a received upload to its place and register it in the index.
+
+        Returns False if the file exists and the repo is not volatile.
+        '''
+        path = os.path.join(self.directory, filename)
+        try:
+            with self.index.changing():
+                stored = install_file(temp_path, path, self.volatile)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if stored:
+            sync_directory(self.directory)
+            self.index.add(filename)
+            self.metadata.remove(filename)
+            self.metadata.get_hash(filename)
+            # reverse dependencies are known right away (`dependents`)
+            if self.dependencies.update([filename]):
+                self.save_dependencies()
+            if self.evictor:
+                self.evictor.touch(filename)
+                self.evictor.wake()
+        return stored
+
+
+class Upload(object):
+
+    '''
+    A package file being received into a temporary file.
+
+    Digests are computed on the fly, to check against the digests sent
+    with the file (e.g. by twine).
+    '''
+
+    DIGESTS = ('md5', 'sha256', 'blake2_256')
+
+    def __init__(self, site):
+        self.site = site
+        self.filename = None
+        self.file = None
+        self.temp_path = None
+        self.hashers = {}
+        for name in self.DIGESTS:
+            try:
+                if name == 'blake2_256':
+                    hasher = hashlib.new('blake2b', digest_size=32)
+                else:
+                    hasher = hashlib.new(name)
+            except (ValueError, TypeError):
+                # not available (blake2 on Python 2, md5 in FIPS mode)
+                continue
+            self.hashers[name] = hasher
+
+    def open(self, name, filename):
+        '''Receive the first valid package file of the form'''
+        if name != 'content' or self.file is not None:
+            return None
+        filename = os.path.basename(filename.replace('\\', '/'))
+        if not parse_filename(filename):
+            return None
+        self.filename = filename
+        self.file, self.temp_path = self.site.open_upload(filename)
+        return self
+
+    def write(self, data):
+        self.file.write(data)
+        for hasher in self.hashers.values():
+            hasher.update(data)
+
+    def check_digests(self, fields):
+        for name, hasher in self.hashers.items():
+            expected = fields.get(name + '_digest', [''])[0].strip().lower()
+            if expected and expected != hasher.hexdigest():
+                return False
+        return True
+
+    def finish(self):
+        self.file.close()
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            os.remove(self.temp_path)
+            self.file = None
+
+
+class UpstreamError(Exception):
+    '''The upstream index of a proxy could not provide a resource'''
+
+
+class UpstreamPage(object):
+
+    def __init__(self, page, links, etag, last_modified):
+        self.page = page
+        self.links = links
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = time.time()
+
+
+class Download(object):
+
+    '''A package file being fetched from upstream, waited on by requests'''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.path = None
+        self.error = None
+
+
+class ProxySite(object):
+
+    '''
+    Pull-through cache of an upstream simple index in a local directory.
+
+    Index pages are kept for `ttl` seconds, then revalidated upstream
+    (with ETag/Last-Modified when available).
+    Package files are fetched once into the directory and served locally
+    from then on; concurrent requests for a missing file wait for a single
+    upstream fetch.
+
+    Without a directory nothing is cached, pages link to the upstream files.
+    '''
+
+    volatile = False
+    require_auth = False
+    accepts_uploads = False
+
+    def __init__(self, directory, upstream_url, ttl, evictor=None):
+        self.directory = directory
+        self.upstream_url = upstream_url
+        self.ttl = ttl
+        self.evictor = evictor
+        self.cache = CacheCounter()
+        if directory is None:
+            self.index = None
+            self.local_pages = None
+        else:
+            self.index = DirectoryIndex(directory)
+            if evictor:
+                evictor.on_evict = self.index.remove
+            # offline fallback: pages of what is already in the cache
+            self.local_pages = IndexPages(self.index, self.cache)
+        # project name (None for the index) -> UpstreamPage
+        self._pages = {}
+        # filename -> simple.Link
+        self._links = {}
+        # filename -> Download in progress
+        self._downloads = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.evictor:
+            self.evictor.start()
+
+    def close(self):
+        if self.evictor:
+            self.evictor.stop()
+
+    def get_listing(self):
+        # upstream projects are only known when asked for
+        return None
+
+    def get_link_attributes(self, filename):
+        return ()
+
+    def get_cache_counters(self):
+        return [self.cache]
+
+    def get_evictors(self):
+        return [self.evictor] if self.evictor else []
+
+    def get_index_page(self):
+        return self._get_page(None, self._get_local_index_page)
+
+    def get_project_page(self, project):
+        return self._get_page(
+            normalize_name(project),
+            lambda: self._get_local_project_page(project)
+        )
+
+    def _get_local_pages(self):
+        if self.local_pages is None:
+            raise UpstreamError(
+                '{} is not available'.format(self.upstream_url)
+            )
+        return self.local_pages
+
+    def _get_local_index_page(self):
+        return self._get_local_pages().get_index_page()
+
+    def _get_local_project_page(self, project):
+        return self._get_local_pages().get_project_page(project)
+
+    def _get_page(self, project, get_local_page):
+        cached = self._pages.get(project)
+        if cached and time.time() - cached.checked_at < self.ttl:
+            self.cache.count('upstream', 'hit')
+            return cached.page
+
+        try:
+            upstream_page = self._fetch_page(project, cached)
+        except UpstreamError:
+            if cached:
+                self.cache.count('upstream', 'stale')
+                return cached.page
+            return get_local_page()
+
+        if upstream_page is cached:
+            self.cache.count('upstream', 'revalidated')
+        else:
+            self.cache.count('upstream', 'miss')
+        if upstream_page is None:
+            self._pages.pop(project, None)
+            return None
+        self._pages[project] = upstream_page
+        return upstream_page.page
+
+    def _fetch_page(self, project, cached):
+        if project is None:
+            url = self.upstream_url
+        else:
+            url = simple.project_url(self.upstream_url, project)
+
+        headers = {'Accept': simple.ACCEPT}
+        if cached and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+        try:
+            response = simple.get(url, headers)
+        except IOError as e:
+            raise UpstreamError('{}: {}'.format(url, e))
+
+        if response.status == 304 and cached:
+            cached.checked_at = time.time()
+            return cached
+        if response.status == 404:
+            return None
+        if response.status != 200:
+            raise UpstreamError('{}: HTTP {}'.format(url, response.status))
+
+        try:
+            if project is None:
+                links = ()
+                page = make_index_page(
+                    simple.parse_index_page(response, url), time.time()
+                )
+            else:
+                links = simple.parse_project_page(response, url)
+                for link in links:
+                    self._links[link.filename] = link
+                page = make_project_page(
+                    project, (self._local_link(link) for link in links),
+                    time.time()
+                )
+        except ValueError as e:
+            raise UpstreamError('{}: {}'.format(url, e))
+
+        return UpstreamPage(
+            page,
+            links,
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+        )
+
+    def _local_link(self, link):
+        if self.directory is None:
+            href = link.url
+        else:
+            href = '../../packages/' + link.filename
+        for hash_name, hash_value in sorted(link.hashes.items()):
+            href += '#{}={}'.format(hash_name, hash_value)
+        attributes = []
+        if link.requires_python:
+            attributes.append(('data-requires-python', link.requires_python))
+        return href, link.filename, attributes
+
+    def get_package_path(self, filename):
+        if self.directory is None:
+            return None
+        self.index.refresh()
+        path = self.index.get_path(filename)
+        if path:
+            self.cache.count('file', 'hit')
+        else:
+            path = self._get_upstream_package(filename)
+        if path and self.evictor:
+            self.evictor.touch(filename)
+        return path
+
+    def _get_upstream_package(self, filename):
+        parsed = parse_filename(filename)
+        if filename != os.path.basename(filename) or not parsed:
+            return None
+        if filename not in self._links:
+            self.get_project_page(parsed[0])
+        link = self._links.get(filename)
+        if link is None:
+            return None
+        return self._download(link)
+
+    def _download(self, link):
+        with self._lock:
+            download = self._downloads.get(link.filename)
+            leader = download is None
+            if leader:
+                # a download may have finished since the index was checked
+                path = self.index.get_path(link.filename)
+                if path:
+                    self.cache.count('file', 'hit')
+                    return path
+                download = self._downloads[link.filename] = Download()
+        # requests waiting for another one's download do not reach upstream
+        self.cache.count('file', 'miss' if leader else 'coalesced')
+
+        if leader:
+            try:
+                download.path = self._fetch_file(link)
+                self.index.add(link.filename)
+                if self.evictor:
+                    self.evictor.wake()
+            except UpstreamError as e:
+                download.error = e
+            finally:
+                with self._lock:
+                    del self._downloads[link.filename]
+                download.done.set()
+        else:
+            download.done.wait()
+
+        if download.error:
+            raise download.error
+        return download.path
+
+    def _fetch_file(self, link):
+        path = os.path.join(self.directory, link.filename)
+        f, temp_path = make_temp_file(self.directory, link.filename)
+        try:
+            hashers = {
+                name: hashlib.new(name) for name in link.hashes
+                if name in hashlib_algorithms
+            }
+            with f:
+                stream = simple.open_stream(link.url)
+                try:
+                    while True:
+                        chunk = stream.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        for hasher in hashers.values():
+                            hasher.update(chunk)
+                finally:
+                    stream.close()
+                sync_file(f)
+            for name, hasher in hashers.items():
+                if hasher.hexdigest() != link.hashes[name].lower():
+                    raise UpstreamError(
+                        '{}: {} hash mismatch'.format(link.url, name)
+                    )
+            with self.index.changing():
+                replace_file(temp_path, path)
+        except IOError as e:
+            os.remove(temp_path)
+            raise UpstreamError('{}: {}'.format(link.url, e))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return path
+
+
+hashlib_algorithms = getattr(
+    hashlib, 'algorithms_guaranteed',
+    ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
+)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    '''
+    Parse a single byte range from a Range header.
+
+    Returns (first, last) byte positions (inclusive) or None when the header
+    is to be ignored (malformed or multiple ranges).
+    '''
+    unit, _, ranges = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    first, dash, last = ranges.strip().partition('-')
+    if not dash:
+        return None
+    try:
+        if not first:
+            # suffix range: last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        first = int(first)
+        last = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable()
+    if first > last:
+        return None
+    return first, min(last, size - 1)
+
+
+def parse_http_date(value):
+    try:
+        return mktime_tz(parsedate_tz(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def file_etag(stat):
+    return '"{:x}-{:x}"'.format(int(stat.st_mtime * 1000000), stat.st_size)
+
+
+class PackageRequestHandler(BaseHTTPRequestHandler):
+
+    '''Simple repository API (PEP 503) over a RepoSite, with uploads'''
+
+    server_version = 'Pyrene'
+    protocol_version = 'HTTP/1.1'
+    # for reading a request
+    timeout = 15
+    # idle keep-alive connections give back their worker after this, or
+    # as soon as other connections wait for a worker
+    idle_timeout = 15
+    # seconds between checks for waiting connections while idle
+    idle_poll_interval = 0.05
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # headers and body are separate writes: without this, small
+        # responses wait for the client's delayed ACK (~40ms)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # set by resolve_site
+    site = None
+    # path prefix of site, e.g. '/repo' ('' when serving a single repo)
+    prefix = None
+
+    # metrics of the current request
+    site_name = ''
+    endpoint = 'other'
+    status = None
+    bytes_sent = 0
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.wait_for_request():
+            self.handle_one_request()
+
+    def has_buffered_input(self):
+        '''True if a (pipelined) request was already read from the socket'''
+        rbuf = getattr(self.rfile, '_rbuf', None)
+        if rbuf is not None:
+            # python 2 socket._fileobject
+            return rbuf.tell() > 0
+        timeout = self.connection.gettimeout()
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except (IOError, OSError):
+            return False
+        finally:
+            self.connection.settimeout(timeout)
+
+    def wait_for_request(self):
+        '''
+        Wait for the next request on a keep-alive connection.
+
+        False if the connection should be closed: idle for idle_timeout, or
+        other connections are waiting for a worker.
+        '''
+        if self.has_buffered_input():
+            return True
+        is_busy = getattr(self.server, 'is_busy', lambda: False)
+        deadline = time.time() + self.idle_timeout
+        while True:
+            remaining = deadline - time.time()
+            readable, _, _ = select.select(
+                [self.connection], [], [],
+                max(0, min(remaining, self.idle_poll_interval))
+            )
+            if readable:
+                return True
+            if remaining <= 0 or is_busy():
+                return False
+
+    def handle_one_request(self):
+        self.site_name = ''
+        self.endpoint = 'other'
+        self.status = None
+        self.bytes_sent = 0
+        started = time.time()
+        BaseHTTPRequestHandler.handle_one_request(self)
+        # nothing is sent for idle keep-alive connections timing out
+        if self.status is not None:
+            self.server.metrics.observe_request(
+                self.site_name, self.endpoint, self.status,
+                time.time() - started, self.bytes_sent
+            )
+
+    def send_response(self, code, message=None):
+        self.status = code
+        BaseHTTPRequestHandler.send_response(self, code, message)
+
+    def write_body(self, data):
+        self.wfile.write(data)
+        self.bytes_sent += len(data)
+
+    def resolve_site(self):
+        '''
+        Find the site for the request.
+
+        Returns path within the site, or None if the request was answered.
+        '''
+        path = unquote(self.path.partition('?')[0])
+        sites = self.server.sites
+        if '' in sites:
+            self.prefix, self.site = '', sites['']
+            return path
+
+        name, slash, site_path = path.lstrip('/').partition('/')
+        if name not in sites:
+            if not name:
+                self.send_site_list()
+            else:
+                self.send_not_found()
+            return None
+        self.prefix, self.site = '/' + name, sites[name]
+        self.site_name = name
+        if not slash:
+            self.redirect('/simple/')
+            return None
+        return '/' + site_path
+
+    def send_site_list(self):
+        links = '\n'.join(
+            render_link('{}/simple/'.format(name), name)
+            for name in sorted(self.server.sites)
+        )
+        body = INDEX_PAGE.format(
+            links=links, version=SIMPLE_API_VERSION
+        ).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.write_body(body)
+
+    def send_metrics(self):
+        self.endpoint = 'metrics'
+        if not self.is_metrics_authorized():
+            return self.send_auth_required()
+        body = self.server.metrics.render().encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.write_body(body)
+
+    def do_GET(self):
+        self.route_upstream_errors(send_body=True)
+
+    def do_HEAD(self):
+        self.route_upstream_errors(send_body=False)
+
+    def route_upstream_errors(self, send_body):
+        if self.path.partition('?')[0] == METRICS_PATH:
+            return self.send_metrics()
+        path = self.resolve_site()
+        if path is None:
+            return
+        try:
+            self.route(path, send_body)
+        except UpstreamError as e:
+            self.send_error(502, str(e))
+
+    def route(self, path, send_body):
+        if path in ('', '/'):
+            return self.redirect('/simple/')
+        if path == '/simple':
+            return self.redirect('/simple/')
+        if path == '/simple/':
+            self.endpoint = 'index'
+            page = self.site.get_index_page()
+            return self.send_page(page, send_body)
+
+        if path.startswith('/simple/'):
+            self.endpoint = 'project'
+            project = path[len('/simple/'):]
+            if not project.endswith('/'):
+                return self.redirect('/simple/{}/'.format(project))
+            project = project[:-1]
+            if project != normalize_name(project):
+                return self.redirect(
+                    '/simple/{}/'.format(normalize_name(project))
+                )
+            page = self.site.get_project_page(project)
+            if page is None:
+                return self.send_not_found()
+            return self.send_page(page, send_body)
+
+        if path.startswith('/packages/'):
+            filename = path[len('/packages/'):]
+            if filename.endswith(METADATA_SUFFIX):
+                self.endpoint = 'metadata'
+            else:
+                self.endpoint = 'package'
+            package_path = self.site.get_package_path(filename)
+            if package_path is None:
+                return self.send_not_found()
+            return self.send_package_file(package_path, send_body)
+
+        self.send_not_found()
+
+    def redirect(self, location):
+        '''Redirect to location within the site'''
+        self.send_response(301)
+        self.send_header('Location', self.prefix + location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_not_found(self):
+        body = b'Not Found\n'
+        self.send_response(404)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.write_body(body)
+
+    def send_not_acceptable(self):
+        body = 'Supported: {}, {}, {}\n'.format(
+            SIMPLE_JSON, SIMPLE_HTML, TEXT_HTML
+        ).encode('utf8')
+        self.send_response(406)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.write_body(body)
+
+    def accepts_gzip(self):
+        accept_encoding = self.headers.get('Accept-Encoding', '')
+        encodings = [
+            encoding.split(';')[0].strip().lower()
+            for encoding in accept_encoding.split(',')
+        ]
+        return 'gzip' in encodings
+
+    def is_not_modified(self, etag, last_modified):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            etags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in etags or etag in etags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            since = parse_http_date(if_modified_since)
+            return since is not None and int(last_modified) <= since
+        return False
+
+    def send_not_modified(self, etag, cache_control):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+
+    def get_requested_content_type(self):
+        '''Simple API content type by ?format= or Accept (PEP 691)'''
+        _, _, query = self.path.partition('?')
+        requested = parse_qs(query).get('format')
+        if requested:
+            return negotiate_content_type(requested[0])
+        return negotiate_content_type(self.headers.get('Accept', ''))
+
+    def send_page(self, page, send_body):
+        content_type = self.get_requested_content_type()
+        if content_type is None:
+            return self.send_not_acceptable()
+        representation = page.get_representation(content_type)
+        if self.accepts_gzip():
+            body = representation.gzipped
+            etag = representation.gzipped_etag
+        else:
+            body, etag = representation.body, representation.etag
+
+        if self.is_not_modified(etag, page.last_modified):
+            return self.send_not_modified(etag, CACHE_CONTROL_REVALIDATE)
+
+        self.send_response(200)
+        if content_type == TEXT_HTML:
+            content_type += '; charset=utf-8'
+        self.send_header('Content-Type', content_type)
+        if body is representation.gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Vary', 'Accept, Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header(
+            'Last-Modified', formatdate(page.last_modified, usegmt=True)
+        )
+        self.send_header('Cache-Control', CACHE_CONTROL_REVALIDATE)
+        self.end_headers()
+        if send_body:
+            self.write_body(body)
+
+    def send_package_file(self, path, send_body):
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return self.send_not_found()
+
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = file_etag(stat)
+            last_modified = formatdate(stat.st_mtime, usegmt=True)
+            cache_control = (
+                CACHE_CONTROL_REVALIDATE if self.site.volatile
+                else CACHE_CONTROL_IMMUTABLE
+            )
+
+            if self.is_not_modified(etag, stat.st_mtime):
+                return self.send_not_modified(etag, cache_control)
+
+            try:
+                byte_range = self.get_byte_range(size, etag, stat.st_mtime)
+            except RangeNotSatisfiable:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(size))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            if byte_range:
+                first, last = byte_range
+                self.send_response(206)
+                self.send_header(
+                    'Content-Range',
+                    'bytes {}-{}/{}'.format(first, last, size)
+                )
+            else:
+                first, last = 0, size - 1
+                self.send_response(200)
+            count = last - first + 1
+
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(count))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+
+            if send_body and count > 0:
+                self.send_file_content(f, first, count)
+
+    def get_byte_range(self, size, etag, mtime):
+        range_header = self.headers.get('Range')
+        if not range_header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range:
+            if_range = if_range.strip()
+            if if_range.startswith(('"', 'W/')):
+                if if_range != etag:
+                    return None
+            elif parse_http_date(if_range) != int(mtime):
+                return None
+        return parse_range(range_header, size)
+
+    def send_file_content(self, f, offset, count):
+        self.wfile.flush()
+        sendfile = getattr(self.connection, 'sendfile', None)
+        if sendfile is not None:
+            # zero-copy where the platform supports it
+            self.bytes_sent += sendfile(f, offset, count)
+            return
+
+        f.seek(offset)
+        while count > 0:
+            chunk = f.read(min(CHUNK_SIZE, count))
+            if not chunk:
+                break
+            self.write_body(chunk)
+            count -= len(chunk)
+
+    # upload
+    def do_POST(self):
+        self.endpoint = 'upload'
+        if self.resolve_site() is None:
+            return
+        if not self.site.accepts_uploads:
+            return self.send_upload_error(405, 'Uploads are not accepted')
+        if self.site.require_auth and not self.is_authorized():
+            return self.send_auth_required()
+        try:
+            length = int(self.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return self.send_upload_error(411, 'Content-Length required')
+
+        # the body is streamed into a temporary file, then moved in place
+        upload = Upload(self.site)
+        try:
+            fields = parse_form(
+                self.rfile, self.headers.get('Content-Type', ''), length,
+                upload.open
+            )
+            if fields.get(':action') != ['file_upload']:
+                raise ValueError('Unsupported action')
+            if upload.filename is None:
+                raise ValueError('Bad package file')
+            if not upload.check_digests(fields):
+                raise ValueError('Digest mismatch')
+            sync_file(upload.file)
+            upload.finish()
+        except ValueError as e:
+            upload.discard()
+            return self.send_upload_error(400, str(e))
+        except BaseException:
+            upload.discard()
+            raise
+
+        if not self.site.store_upload(upload.temp_path, upload.filename):
+            return self.send_error(409, 'File already exists')
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_upload_error(self, code, message):
+        # the request body may be unread
+        self.close_connection = True
+        self.send_error(code, message)
+
+    def is_authorized(self):
+        return self.site.check_authorization(
+            self.headers.get('Authorization', '')
+        )
+
+    def is_metrics_authorized(self):
+        '''
+        Metrics cover every repo served: when some have upload users, any of
+        those users may read them, nobody else.
+        '''
+        sites = [
+            site for site in self.server.sites.values() if site.require_auth
+        ]
+        if not sites:
+            return True
+        authorization = self.headers.get('Authorization', '')
+        return any(site.check_authorization(authorization) for site in sites)
+
+    def send_auth_required(self):
+        self.close_connection = True
+        self.send_response(401)
+        self.send_header('WWW-Authenticate', 'Basic realm="pyrene"')
+        self.send_header('Content-Length', '0')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+
+class UnionSite(object):
+
+    '''
+    Ordered union of sites: each project is served from the first site
+    having it.
+
+    Projects of sites with a listing (directory repos) are looked up in a
+    precomputed MergedIndex, sites without one (http repos) are asked in
+    their turn, when a project is requested.
+    '''
+
+    volatile = False
+    require_auth = False
+    accepts_uploads = False
+    evictor = None
+
+    def __init__(self, sites):
+        self.sites = list(sites)
+        self.listings = [site.get_listing() for site in self.sites]
+        # listing position -> site position
+        self.listed_sites = [
+            position
+            for position, listing in enumerate(self.listings)
+            if listing is not None
+        ]
+        self.index = MergedIndex(
+            listing for listing in self.listings if listing is not None
+        )
+        self.cache = CacheCounter()
+        self.pages = IndexPages(
+            self.index, self.cache, self.get_link_attributes
+        )
+
+    def start(self):
+        for site in self.sites:
+            site.start()
+
+    def close(self):
+        for site in self.sites:
+            site.close()
+
+    def get_listing(self):
+        if len(self.listed_sites) == len(self.sites):
+            return self.index
+        return None
+
+    def get_cache_counters(self):
+        counters = [self.cache]
+        for site in self.sites:
+            counters.extend(site.get_cache_counters())
+        return counters
+
+    def get_evictors(self):
+        evictors = []
+        for site in self.sites:
+            evictors.extend(site.get_evictors())
+        return evictors
+
+    def _get_owner(self, project):
+        '''Position of the listed site providing project or None'''
+        self.index.refresh()
+        owner = self.index.owners.get(normalize_name(project))
+        if owner is None:
+            return None
+        return self.listed_sites[owner]
+
+    def _lookup(self, project, from_listed_site, from_unlisted_site):
+        owner = self._get_owner(project)
+        upstream_error = None
+        for position, site in enumerate(self.sites):
+            if position == owner:
+                return from_listed_site(site)
+            if self.listings[position] is None:
+                try:
+                    result = from_unlisted_site(site)
+                except UpstreamError as e:
+                    # an unavailable member does not hide the rest
+                    upstream_error = e
+                    continue
+                if result is not None:
+                    return result
+        if upstream_error:
+            raise upstream_error
+        return None
+
+    def get_link_attributes(self, filename):
+        parsed = parse_filename(filename)
+        owner = parsed and self._get_owner(parsed[0])
+        if owner is None:
+            return ()
+        return self.sites[owner].get_link_attributes(filename)
+
+    def get_index_page(self):
+        return self.pages.get_index_page()
+
+    def get_project_page(self, project):
+        return self._lookup(
+            project,
+            lambda site: self.pages.get_project_page(project),
+            lambda site: site.get_project_page(project),
+        )
+
+    def get_package_path(self, filename):
+        parsed = parse_filename(strip_metadata_suffix(filename))
+        if not parsed:
+            return None
+        return self._lookup(
+            parsed[0],
+            lambda site: site.get_package_path(filename),
+            lambda site: site.get_package_path(filename),
+        )
+
+
+class WorkerPoolMixIn(object):
+
+    '''
+    Handle requests with a fixed pool of worker threads.
+
+    Accepted connections are queued for the workers, so the number of
+    threads does not grow with the number of clients.
+    '''
+
+    workers = DEFAULT_WORKERS
+    metrics = None
+
+    def start_workers(self):
+        self._requests = Queue()
+        self._workers = []
+        for _ in range(self.workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def stop_workers(self):
+        for _ in self._workers:
+            self._requests.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address, time.time()))
+
+    def is_busy(self):
+        '''True if connections are waiting for a worker'''
+        return not self._requests.empty()
+
+    def _work(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            request, client_address, queued_at = item
+            if self.metrics:
+                self.metrics.worker_started(time.time() - queued_at)
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                if self.metrics:
+                    self.metrics.worker_finished()
+
+
+class PackageHTTPServer(WorkerPoolMixIn, HTTPServer):
+
+    '''
+    HTTP server for sites (RepoSite, ProxySite) mounted under path prefixes.
+
+    sites: name -> site, a site with empty name is served at the root.
+    Request metrics are served at /metrics, to the upload users of the sites
+    if they have any.
+    '''
+
+    allow_reuse_address = True
+
+    def __init__(self, address, sites, workers=DEFAULT_WORKERS):
+        HTTPServer.__init__(self, address, PackageRequestHandler)
+        self.sites = sites
+        self.workers = workers
+        self.metrics = Metrics()
+        for name, site in sites.items():
+            self.metrics.add_cache_counters(name, site.get_cache_counters())
+            site.start()
+        self.start_workers()
+
+    @property
+    def site(self):
+        return self.sites['']
+
+    def swap_sites(self, sites):
+        '''
+        Serve sites instead of the current ones.
+
+        Requests in progress finish with the site they started with.
+        Cache counts add up across swaps, and a directory is kept by one
+        evictor at a time, continuing the accesses of the replaced one.
+        '''
+        old_evictors = dict(
+            (os.path.abspath(evictor.directory), evictor)
+            for site in self.sites.values()
+            for evictor in site.get_evictors()
+        )
+        for name, site in sites.items():
+            self.metrics.add_cache_counters(name, site.get_cache_counters())
+            for evictor in site.get_evictors():
+                old_evictor = old_evictors.pop(
+                    os.path.abspath(evictor.directory), None
+                )
+                if old_evictor:
+                    old_evictor.stop()
+                    evictor.take_over(old_evictor)
+            site.start()
+        old_sites, self.sites = self.sites, sites
+        for site in old_sites.values():
+            site.close()
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.stop_workers()
+        for site in self.sites.values():
+            site.close()
+
+
+class Reloader(object):
+
+    '''
+    Rebuilds the sites of a running server in the background.
+
+    A reload is done when requested (on SIGHUP) or when the config file
+    changes. The new sites are made by server.reload_server(), which may
+    re-read the configuration, and replace the old ones at once.
+    '''
+
+    def __init__(self, server, httpd, base_url, interval=2.0):
+        self.server = server
+        self.httpd = httpd
+        self.base_url = base_url
+        self.interval = interval
+        self._config_mtime = self._get_config_mtime()
+        self._requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _get_config_mtime(self):
+        if not self.server.config_file:
+            return None
+        try:
+            return os.stat(self.server.config_file).st_mtime
+        except OSError:
+            return None
+
+    def request(self):
+        self._requested.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._requested.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._requested.wait(self.interval)
+            if self._stopped.is_set():
+                break
+            config_mtime = self._get_config_mtime()
+            if self._requested.is_set() or config_mtime != self._config_mtime:
+                self._requested.clear()
+                self._config_mtime = config_mtime
+                self.reload()
+
+    def reload(self):
+        '''Returns True if the new sites are being served'''
+        try:
+            server = self.server.reload_server()
+            if server is None:
+                print(red('Reload failed, serving the previous configuration'))
+                return False
+            sites = server.make_sites()
+        except Exception as e:
+            print(red(
+                'Reload failed ({}), serving the previous configuration'
+                .format(e)
+            ))
+            return False
+        if (server.interface, server.port, server.workers) != (
+                self.server.interface, self.server.port, self.server.workers):
+            print(yellow(
+                'Changes to interface, port or workers need a restart'
+            ))
+        self.httpd.swap_sites(sites)
+        print('Reloaded')
+        server.print_urls(self.base_url)
+        return True
+
+
+@contextlib.contextmanager
+def reload_on_sighup(reloader):
+    sighup = getattr(signal, 'SIGHUP', None)
+    try:
+        previous = signal.signal(
+            sighup, lambda signum, frame: reloader.request()
+        )
+    except (TypeError, ValueError):
+        # no SIGHUP on the platform or not in the main thread
+        yield
+        return
+    try:
+        yield
+    finally:
+        signal.signal(sighup, previous)
+
+
+class BaseServer(object):
+
+    def __init__(self):
+        self.interface = '0.0.0.0'
+        self.port = '8080'
+        self.workers = DEFAULT_WORKERS
+        # returns a server with the current configuration (or None) on
+        # reload, whose sites replace the served ones
+        self.reload_server = lambda: self
+        # reload when changed
+        self.config_file = None
+
+    def make_sites(self):
+        '''name -> site to serve'''
+        raise NotImplementedError
+
+    def make_httpd(self):
+        address = (self.interface, int(self.port))
+        return PackageHTTPServer(address, self.make_sites(), self.workers)
+
+    def print_urls(self, base_url):
+        raise NotImplementedError
+
+    def serve(self):
+        httpd = self.make_httpd()
+        interface, port = httpd.server_address[:2]
+        base_url = 'http://{}:{}'.format(interface, port)
+        self.print_urls(base_url)
+        reloader = Reloader(self, httpd, base_url)
+        reloader.start()
+        with reload_on_sighup(reloader):
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                reloader.stop()
+                httpd.server_close()
+        print()
+        for line in httpd.metrics.summary():
+            print(line)
+
+
+class PackageServer(BaseServer):
+
+    '''
+    Built-in package index server for a directory.
+
+    Has the same interface as PyPI (the pypi-server wrapper), but serves
+    in-process: package files are sent with sendfile(), with validators
+    (ETag, Last-Modified) and Range support, index pages are precompressed.
+    '''
+
+    def __init__(self):
+        super(PackageServer, self).__init__()
+        self.directory = '.'
+        self.volatile = False
+        self.users = {}
+        # bytes, None for unbounded
+        self.cache_size = None
+        self.cache_policy = POLICY.LRU
+        # persisted htpasswd file, users are hashed in memory if None
+        self.htpasswd_path = None
+
+    def add_user(self, username, password):
+        self.users[username] = password
+
+    def make_evictor(self):
+        if self.cache_size is None:
+            return None
+        return Evictor(self.directory, self.cache_size, self.cache_policy)
+
+    def make_site(self):
+        return RepoSite(
+            self.directory, self.volatile, self.users, self.make_evictor(),
+            self.htpasswd_path
+        )
+
+    def make_sites(self):
+        return {'': self.make_site()}
+
+    @property
+    def description(self):
+        return self.directory
+
+    def print_urls(self, base_url):
+        print('Serving {} at {}/simple/'.format(self.description, base_url))
+
+
+class ProxyServer(PackageServer):
+
+    '''
+    Caching proxy in front of an upstream index.
+
+    `directory` is the cache, files are served from there once fetched.
+    '''
+
+    def __init__(self):
+        super(ProxyServer, self).__init__()
+        self.upstream_url = None
+        self.ttl = 600
+
+    def make_site(self):
+        return ProxySite(
+            self.directory, self.upstream_url, self.ttl, self.make_evictor()
+        )
+
+    @property
+    def description(self):
+        return '{} (cached in {})'.format(self.upstream_url, self.directory)
+
+
+class MultiServer(BaseServer):
+
+    '''
+    Several repos served by one process on one port, under /<name>/simple/
+
+    The repos share the worker pool, uploads are authorized per repo.
+    '''
+
+    def __init__(self):
+        super(MultiServer, self).__init__()
+        # name -> PackageServer or ProxyServer (used as site factories)
+        self.servers = {}
+
+    def add(self, name, server):
+        self.servers[name] = server
+
+    def make_sites(self):
+        return {
+            name: server.make_site()
+            for name, server in self.servers.items()
+        }
+
+    def print_urls(self, base_url):
+        for name, server in sorted(self.servers.items()):
+            print(
+                'Serving {} at {}/{}/simple/'
+                .format(server.description, base_url, name)
+            )
+
+
+class UnionServer(BaseServer):
+
+    '''Serve the ordered union of repos (see UnionSite)'''
+
+    def __init__(self):
+        super(UnionServer, self).__init__()
+        # PackageServer or ProxyServer instances (used as site factories)
+        self.members = []
+
+    def make_site(self):
+        return UnionSite(member.make_site() for member in self.members)
+
+    def make_sites(self):
+        return {'': self.make_site()}
+
+    @property
+    def description(self):
+        return 'union of {}'.format(
+            ', '.join(member.description for member in self.members)
+        )
+
+    def print_urls(self, base_url):
+        print('Serving {} at {}/simple/'.format(self.description, base_url))
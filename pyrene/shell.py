@@ -5,9 +5,13 @@ from __future__ import unicode_literals
 import os
 from cmd import Cmd
 import traceback
+from multiprocessing.pool import ThreadPool
 import pkg_resources
 from .util import read_file, write_file, create_md5_backup, bold, red, green
 from .network import Network, DirectoryRepo, UnknownRepoError
+from .repos import serve_repos
+from .lockfile import parse_lockfile, read_requirements_file
+from .manifest import Checkpoint, mirror
 from .constants import REPO, REPOTYPE, MAX_HISTORY_SIZE
 
 
@@ -189,37 +193,316 @@ class PyreneCmd(BaseCmd):
         attributes = {'directory': word}
         return DirectoryRepo('directory:{}'.format(word), attributes)
 
+    COPY_OPTIONS = {
+        '--wheels': ('wheels', True),
+        '--sdists': ('wheels', False),
+    }
+
+    # options with values, for Repo.get_copy_target
+    COPY_TARGET_OPTIONS = {
+        '--python-version': 'python_version',
+        '--platform': 'platforms',
+        '--abi': 'abis',
+    }
+
+    # requirements files to copy (like pip's)
+    COPY_REQUIREMENT_OPTIONS = ('-r', '--requirement')
+
+    def parse_copy_options(self, words):
+        '''
+        (download_packages keyword arguments,
+         get_copy_target keyword arguments,
+         requirements files,
+         other words)
+        '''
+        options = {}
+        target_options = {}
+        requirement_files = []
+        rest = []
+        words = list(words)
+        while words:
+            word = words.pop(0)
+            option, equals, value = word.partition('=')
+            if option in self.COPY_REQUIREMENT_OPTIONS + tuple(
+                    self.COPY_TARGET_OPTIONS):
+                if not equals:
+                    if not words:
+                        raise ShellError(
+                            'Copy option {} requires a value'.format(option)
+                        )
+                    value = words.pop(0)
+            if not word.startswith('-'):
+                rest.append(word)
+            elif word in self.COPY_OPTIONS:
+                name, value = self.COPY_OPTIONS[word]
+                options[name] = value
+            elif option in self.COPY_REQUIREMENT_OPTIONS:
+                requirement_files.append(value)
+            elif option in self.COPY_TARGET_OPTIONS:
+                name = self.COPY_TARGET_OPTIONS[option]
+                if name == 'python_version':
+                    target_options[name] = value
+                else:
+                    target_options.setdefault(name, []).extend(
+                        value.replace(',', ' ').split()
+                    )
+            else:
+                raise ShellError('Unknown copy option {}'.format(word))
+        return options, target_options, requirement_files, rest
+
     def do_copy(self, line):
         '''
         Copy packages between repos
 
-          copy SOURCE DESTINATION
+          copy [--wheels | --sdists] [--python-version VERSION]
+               [--platform PLATFORM] [--abi ABI] [-r REQUIREMENTS-FILE]
+               SOURCE... [REPO:...] DESTINATION
 
-        Where SOURCE can be either LOCAL-FILE or REPO:PACKAGE-SPEC
+        Where SOURCE can be either LOCAL-FILE, REPO:PACKAGE-SPEC or
+        REPO:@LOCKFILE (a requirements file with pinned versions and hashes)
         DESTINATION can be either a REPO: or a directory.
+        Several REPO:PACKAGE-SPECs (of the same repo) and the requirements of
+        -r files (with REPO: as SOURCE) are resolved and copied together.
+        REPO:s before DESTINATION are destinations too: the packages are
+        downloaded once and uploaded to all of them at the same time.
+        --wheels copies wheels where there are (sdists otherwise),
+        --sdists only sdists, by default the source repo's prefer_wheels
+        attribute decides.
+        --python-version, --platform and --abi (default: the destination's
+        target_* attributes) copy only what is installable there.
         '''
-        words = line.split()
-        source, destination = words
-        destination_repo = self._get_destination_repo(destination)
-        local_file_source = ':' not in source
+        options, target_options, requirement_files, words = (
+            self.parse_copy_options(line.split())
+        )
+        if len(words) < 2:
+            raise ShellError(
+                'Command "copy" requires a SOURCE and a DESTINATION'
+            )
+        sources, destinations = self.split_copy_destinations(words)
+        destination_repos = [
+            (destination, self._get_destination_repo(destination))
+            for destination in destinations
+        ]
+        target = self.get_copy_target(
+            [repo for _, repo in destination_repos], target_options
+        )
+        if target.is_specific:
+            options['target'] = target
+
+        if not any(':' in source for source in sources):
+            self.upload_to_all(destination_repos, sources)
+            return
+
+        source_repo_names = {source.partition(':')[0] for source in sources}
+        if len(source_repo_names) > 1 or not all(':' in s for s in sources):
+            raise ShellError('All sources must be of the same repository')
+        source_repo_name = source_repo_names.pop()
+        package_specs = [
+            source.partition(':')[2] for source in sources
+            if source.partition(':')[2]
+        ]
+        try:
+            source_repo = self.network.get_repo(source_repo_name)
+        except UnknownRepoError:
+            raise ShellError(
+                'Unknown repository {}'.format(source_repo_name)
+            )
 
-        if local_file_source:
-            destination_repo.upload_packages([source])
-        else:
-            source_repo_name, _, package_spec = source.partition(':')
+        if any(spec.startswith('@') for spec in package_specs):
+            if len(package_specs) > 1 or requirement_files:
+                raise ShellError('A lockfile is copied on its own')
+            self.copy_locked(
+                source_repo, package_specs[0][1:], destination_repos, options
+            )
+            return
+
+        for requirement_file in requirement_files:
             try:
-                source_repo = self.network.get_repo(source_repo_name)
-            except UnknownRepoError:
+                package_specs.extend(read_requirements_file(requirement_file))
+            except IOError as e:
                 raise ShellError(
-                    'Unknown repository {}'.format(source_repo_name)
+                    'Can not read {}: {}'.format(requirement_file, e)
+                )
+        if not package_specs:
+            raise ShellError(
+                'Nothing to copy from {}'.format(source_repo_name)
+            )
+
+        # copy between repos with the help of temporary storage
+        try:
+            if len(package_specs) == 1:
+                source_repo.download_packages(
+                    package_specs[0], self.__temp_dir, **options
+                )
+            else:
+                # one resolution for all
+                source_repo.download_requirements(
+                    package_specs, self.__temp_dir, **options
                 )
+            self.upload_to_all(destination_repos, self.__temp_dir.files)
+        finally:
+            self.__temp_dir.clear()
+
+    def split_copy_destinations(self, words):
+        '''
+        (sources, destinations) of the copy words.
 
-            # copy between repos with the help of temporary storage
+        The last word is a destination, and so are the REPO:s before it,
+        as long as a source is left.
+        '''
+        split = len(words) - 1
+        while split > 1 and words[split - 1].endswith(':'):
+            split -= 1
+        return words[:split], words[split:]
+
+    def get_copy_target(self, destination_repos, target_options):
+        '''The Target shared by all destination_repos'''
+        targets = []
+        for destination_repo in destination_repos:
             try:
-                source_repo.download_packages(package_spec, self.__temp_dir)
-                destination_repo.upload_packages(self.__temp_dir.files)
-            finally:
-                self.__temp_dir.clear()
+                target = destination_repo.get_copy_target(**target_options)
+            except ValueError as e:
+                raise ShellError(str(e))
+            if target not in targets:
+                targets.append(target)
+        if len(targets) > 1:
+            raise ShellError(
+                'The destinations have different targets, copy to them'
+                ' separately or give --python-version/--platform/--abi'
+            )
+        return targets[0]
+
+    def upload_to_all(self, destination_repos, package_files):
+        '''
+        Upload package_files to every (destination, repo), concurrently.
+
+        A failing destination does not stop the others.
+        '''
+        if len(destination_repos) == 1:
+            destination_repos[0][1].upload_packages(package_files)
+            return
+
+        def upload(destination_repo):
+            destination, repo = destination_repo
+            try:
+                repo.upload_packages(package_files)
+            except Exception as e:
+                return '{} {}'.format(destination, e)
+            return None
+
+        pool = ThreadPool(len(destination_repos))
+        try:
+            errors = pool.map(upload, destination_repos)
+        finally:
+            pool.close()
+            pool.join()
+        for (destination, _), error in zip(destination_repos, errors):
+            if error:
+                print(red('ERROR: {}'.format(error)))
+            else:
+                print(green('{} done'.format(destination)))
+
+    def copy_locked(self, source_repo, lockfile, destination_repos, options):
+        try:
+            requirements = parse_lockfile(read_file(lockfile))
+        except IOError as e:
+            raise ShellError('Can not read {}: {}'.format(lockfile, e))
+        except ValueError as e:
+            raise ShellError('{}: {}'.format(lockfile, e))
+
+        try:
+            failed = source_repo.download_locked(
+                requirements, self.__temp_dir, **options
+            )
+            self.upload_to_all(destination_repos, self.__temp_dir.files)
+        finally:
+            self.__temp_dir.clear()
+        if failed:
+            print(red(
+                'ERROR: not copied: {}'.format(' '.join(map(str, failed)))
+            ))
+
+    def do_dependents(self, line):
+        '''
+        List the package files in a repo requiring a project
+
+          dependents REPO:PROJECT
+        '''
+        repo_name, colon, project = line.strip().partition(':')
+        if not colon or not project:
+            raise ShellError(
+                'Command "dependents" requires a REPO:PROJECT parameter'
+            )
+        try:
+            repo = self.network.get_repo(repo_name)
+        except UnknownRepoError:
+            raise ShellError('Unknown repository {}'.format(repo_name))
+
+        try:
+            dependents = repo.get_dependents(project)
+        except NotImplementedError:
+            raise ShellError(
+                'Dependents are known only for directory repos'
+                ' (and unions of them), not {}'.format(repo_name)
+            )
+        if not dependents:
+            print('Nothing in {} requires {}'.format(repo_name, project))
+            return
+        for filename, requirement in dependents:
+            print('{}: {}'.format(filename, requirement))
+
+    def complete_dependents(self, text, line, begidx, endidx):
+        if ':' in line[:begidx]:
+            return []
+        return self.complete_repo_name(
+            text, line, begidx, endidx, suffix=':'
+        )
+
+    def do_mirror(self, line):
+        '''
+        Copy all the package files of a repo missing from another
+
+          mirror [--rescan] SOURCE: DESTINATION:
+
+        Only files not yet in DESTINATION are transferred, the files there
+        are remembered from the previous mirror between the two repos.
+        --rescan lists DESTINATION's files again.
+        '''
+        words = line.split()
+        rescan = '--rescan' in words
+        words = [word for word in words if word != '--rescan']
+        if (len(words) != 2
+                or not all(word.endswith(':') for word in words)):
+            raise ShellError(
+                'Command "mirror" requires SOURCE: and DESTINATION: repos'
+            )
+        repos = []
+        for word in words:
+            try:
+                repos.append(self.network.get_repo(word[:-1]))
+            except UnknownRepoError:
+                raise ShellError('Unknown repository {}'.format(word[:-1]))
+        source_repo, destination_repo = repos
+
+        try:
+            checkpoint = Checkpoint.of(source_repo, destination_repo)
+            copied, failed = mirror(
+                source_repo, destination_repo, self.__temp_dir, checkpoint,
+                rescan=rescan
+            )
+        except NotImplementedError:
+            raise ShellError(
+                'Can not list the files of {} or {}'.format(*words)
+            )
+        except (IOError, OSError, ValueError) as e:
+            raise ShellError('Mirror failed: {}'.format(e))
+        if failed:
+            print(red('ERROR: {} files not copied'.format(failed)))
+
+    def complete_mirror(self, text, line, begidx, endidx):
+        return self.complete_repo_name(
+            text, line, begidx, endidx, suffix=':'
+        )
 
     def do_work_on(self, repo):
         '''
@@ -257,6 +540,23 @@ class PyreneCmd(BaseCmd):
             self.network.define_directory_repo(repo_name)
         self.network.active_repo = repo_name
 
+    def do_union_repo(self, repo):
+        '''
+        [Re]define REPO as union of other repos.
+
+        union_repo REPO
+
+        Set the members (in order of precedence) with
+        set repos=REPO1,REPO2,...
+        '''
+        self.abort_on_missing_effective_repo_name(repo, 'union_repo')
+        repo_name = self.get_effective_repo_name(repo)
+        try:
+            self.network.set(repo_name, REPO.TYPE, REPOTYPE.UNION)
+        except UnknownRepoError:
+            self.network.define_union_repo(repo_name)
+        self.network.active_repo = repo_name
+
     def do_import_pypirc(self, _empty):
         '''
         Import repositories defined in ~/.pypirc
@@ -424,15 +724,28 @@ class PyreneCmd(BaseCmd):
 
         self.network.setup_for_pip_local(effective_repo_name)
 
-    def do_serve(self, repo_name):
+    def do_serve(self, line):
         '''
         Serve a local directory over http as a package index (like pypi).
         Intended for quick package exchanges.
+
+        serve [REPO...]
+
+        Several repos are served from one process, on the first repo's
+        interface and port, each under /REPO/simple/
         '''
-        self.abort_on_nonexisting_effective_repo(repo_name, 'serve')
+        repo_names = line.split()
+        if len(repo_names) <= 1:
+            repo_name = line.strip()
+            self.abort_on_nonexisting_effective_repo(repo_name, 'serve')
 
-        repo = self.network.get_repo(repo_name)
-        repo.serve()
+            repo = self.network.get_repo(repo_name)
+            repo.serve()
+            return
+
+        for repo_name in repo_names:
+            self.abort_on_unknown_repository_name(repo_name, 'serve')
+        serve_repos([self.network.get_repo(name) for name in repo_names])
 
     def complete_repo_name(self, text, line, begidx, endidx, suffix=''):
         return sorted(
@@ -443,6 +756,7 @@ class PyreneCmd(BaseCmd):
 
     complete_http_repo = complete_repo_name
     complete_directory_repo = complete_repo_name
+    complete_union_repo = complete_repo_name
     complete_work_on = complete_repo_name
     complete_forget = complete_repo_name
     complete_show = complete_repo_name
@@ -0,0 +1,597 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Client side of the simple repository API (PEP 503, JSON: PEP 691)
+
+import codecs
+import hashlib
+import json
+import os
+import re
+
+try:
+    from HTMLParser import HTMLParser
+    from urllib2 import Request, urlopen, HTTPError
+    from urlparse import urljoin, urldefrag
+    from urllib import unquote
+except ImportError:
+    from html.parser import HTMLParser
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+    from urllib.parse import urljoin, urldefrag, unquote
+
+from .packages import normalize_name
+
+
+TIMEOUT = 60
+
+CHUNK_SIZE = 64 * 1024
+
+SIMPLE_JSON = 'application/vnd.pypi.simple.v1+json'
+SIMPLE_HTML = 'application/vnd.pypi.simple.v1+html'
+# JSON if the index has it
+ACCEPT = '{}, {}; q=0.1, text/html; q=0.01'.format(SIMPLE_JSON, SIMPLE_HTML)
+
+
+class Link(object):
+
+    '''A package file link on a project page'''
+
+    def __init__(self, url, requires_python=None, hashes=None):
+        self.url, fragment = urldefrag(url)
+        self.filename = unquote(self.url.rsplit('/', 1)[-1])
+        self.hashes = {}
+        hash_name, eq, hash_value = fragment.partition('=')
+        if eq and hash_name and hash_value:
+            self.hashes[hash_name] = hash_value
+        self.hashes.update(hashes or {})
+        self.requires_python = requires_python
+
+    def __repr__(self):
+        return 'Link({!r})'.format(self.url)
+
+
+class URLJoiner(object):
+
+    '''
+    urljoin for the many links of a page.
+
+    Absolute links are taken as they are, relative ones mostly share a few
+    directories, which are resolved once.
+    '''
+
+    MAX_DIRECTORIES = 1000
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        # relative directory -> absolute
+        self._directories = {}
+
+    def join(self, href):
+        if href.startswith(('https://', 'http://')):
+            return href
+        directory, slash, name = href.rpartition('/')
+        if not slash or name in ('.', '..') or '?' in directory:
+            return urljoin(self.base_url, href)
+        absolute = self._directories.get(directory)
+        if absolute is None:
+            absolute = urljoin(self.base_url, directory + '/')
+            if len(self._directories) < self.MAX_DIRECTORIES:
+                self._directories[directory] = absolute
+        return absolute + name
+
+
+class LinkParser(HTMLParser):
+
+    def __init__(self, base_url):
+        HTMLParser.__init__(self)
+        self.joiner = URLJoiner(base_url)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'base':
+            href = dict(attrs).get('href')
+            if href:
+                self.joiner = URLJoiner(urljoin(self.joiner.base_url, href))
+        if tag != 'a':
+            return
+        attrs = dict(attrs)
+        href = attrs.get('href')
+        if not href:
+            return
+        self.links.append(
+            Link(
+                self.joiner.join(href),
+                requires_python=attrs.get('data-requires-python'),
+            )
+        )
+
+    def pop_links(self):
+        links, self.links = self.links, []
+        return links
+
+
+def parse_links(html, base_url):
+    parser = LinkParser(base_url)
+    parser.feed(html)
+    parser.close()
+    return parser.links
+
+
+WHITESPACE = re.compile(r'\s*')
+
+
+class JSONFilesParser(object):
+
+    '''
+    Incremental parser of a JSON project page (PEP 691).
+
+    Entries of "files" are returned by feed() as soon as they are complete,
+    other top level values are decoded whole (they are small).
+    '''
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        # what is expected next
+        self.state = 'start'
+        self.key = None
+        self.meta = None
+
+    def _peek(self):
+        '''Next non whitespace character, None at the end of the buffer'''
+        self.position = WHITESPACE.match(self.buffer, self.position).end()
+        if self.position == len(self.buffer):
+            return None
+        return self.buffer[self.position]
+
+    def _expect(self, *chars):
+        char = self._peek()
+        if char is None:
+            raise IndexError
+        if char not in chars:
+            raise ValueError('Malformed project page near {!r}'.format(
+                self.buffer[self.position:self.position + 20]
+            ))
+        self.position += 1
+        return char
+
+    def _decode(self):
+        '''Next JSON value, IndexError if it is not complete yet'''
+        if self._peek() is None:
+            raise IndexError
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.position)
+        except ValueError:
+            raise IndexError
+        is_number = (
+            isinstance(value, (int, float)) and not isinstance(value, bool)
+        )
+        if is_number and end == len(self.buffer):
+            # might continue in the next chunk
+            raise IndexError
+        self.position = end
+        return value
+
+    def _step(self, entries):
+        if self.state == 'start':
+            self._expect('{')
+            self.state = 'key'
+        elif self.state == 'key':
+            if self._peek() == '}':
+                self.position += 1
+                self.state = 'end'
+                return
+            self.key = self._decode()
+            self.state = 'colon'
+        elif self.state == 'colon':
+            self._expect(':')
+            self.state = 'value'
+        elif self.state == 'value':
+            if self.key == 'files':
+                self._expect('[')
+                self.state = 'file'
+                return
+            value = self._decode()
+            if self.key == 'meta':
+                self.meta = value
+                check_api_version(value)
+            self.state = 'next key'
+        elif self.state == 'file':
+            if self._peek() == ']':
+                self.position += 1
+                self.state = 'next key'
+                return
+            entries.append(self._decode())
+            self.state = 'next file'
+        elif self.state == 'next file':
+            separator = self._expect(',', ']')
+            self.state = 'file' if separator == ',' else 'next key'
+        elif self.state == 'next key':
+            separator = self._expect(',', '}')
+            self.state = 'key' if separator == ',' else 'end'
+        else:
+            if self._peek() is not None:
+                raise ValueError('Data after the project page')
+            raise IndexError
+
+    def feed(self, text):
+        '''Entries of "files" completed by text'''
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+        entries = []
+        try:
+            while True:
+                self._step(entries)
+        except IndexError:
+            # incomplete, wait for more
+            pass
+        return entries
+
+    def close(self):
+        if self.state != 'end':
+            raise ValueError('Truncated project page')
+        if self.meta is None:
+            check_api_version({})
+
+
+def iter_links(chunks, base_url, is_json=False):
+    '''
+    Links of a project page as its body chunks (bytes) arrive.
+
+    Stopping early saves the parsing (and reading) of the rest.
+    Raises ValueError for malformed JSON.
+    '''
+    decoder = codecs.getincrementaldecoder('utf8')('replace')
+    if is_json:
+        parser = JSONFilesParser()
+        joiner = URLJoiner(base_url)
+        for chunk in chunks:
+            for entry in parser.feed(decoder.decode(chunk)):
+                yield json_link(entry, joiner)
+        for entry in parser.feed(decoder.decode(b'', final=True)):
+            yield json_link(entry, joiner)
+        parser.close()
+    else:
+        parser = LinkParser(base_url)
+        for chunk in chunks:
+            parser.feed(decoder.decode(chunk))
+            for link in parser.pop_links():
+                yield link
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+        for link in parser.pop_links():
+            yield link
+
+
+def iter_chunks(f, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_project_names(html, base_url):
+    '''Project names linked from a simple index page'''
+    return [
+        unquote(link.url.rstrip('/').rsplit('/', 1)[-1])
+        for link in parse_links(html, base_url)
+    ]
+
+
+def check_api_version(meta):
+    version = meta.get('api-version', '')
+    if version.split('.')[0] != '1':
+        raise ValueError('Unsupported API version: {}'.format(version))
+
+
+def parse_json(body):
+    '''Decoded JSON simple API response, ValueError if malformed'''
+    data = json.loads(body.decode('utf8'))
+    if not isinstance(data, dict):
+        raise ValueError('Not a simple API response')
+    check_api_version(data.get('meta', {}))
+    return data
+
+
+def json_link(entry, joiner):
+    try:
+        return Link(
+            joiner.join(entry['url']),
+            requires_python=entry.get('requires-python'),
+            hashes=entry.get('hashes'),
+        )
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError('Malformed file entry: {!r}'.format(e))
+
+
+def parse_json_links(body, base_url):
+    joiner = URLJoiner(base_url)
+    return [
+        json_link(entry, joiner)
+        for entry in parse_json(body).get('files', ())
+    ]
+
+
+def parse_json_project_names(body):
+    return [entry['name'] for entry in parse_json(body).get('projects', ())]
+
+
+def is_json(response):
+    content_type = response.headers.get('Content-Type', '')
+    return content_type.split(';')[0].strip().lower() == SIMPLE_JSON
+
+
+def parse_project_page(response, url):
+    '''
+    Package file links of a project page Response, either JSON or HTML.
+
+    Raises ValueError for malformed JSON.
+    '''
+    if is_json(response):
+        try:
+            return parse_json_links(response.body, url)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError('Malformed project page: {!r}'.format(e))
+    return parse_links(response.text, url)
+
+
+def parse_index_page(response, url):
+    '''Project names of an index page Response, either JSON or HTML'''
+    if is_json(response):
+        try:
+            return parse_json_project_names(response.body)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError('Malformed index page: {!r}'.format(e))
+    return parse_project_names(response.text, url)
+
+
+def project_url(index_url, project):
+    return urljoin(
+        index_url.rstrip('/') + '/', normalize_name(project) + '/'
+    )
+
+
+class Response(object):
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self):
+        return self.body.decode('utf8', 'replace')
+
+
+def get(url, headers=None, timeout=TIMEOUT):
+    '''
+    GET url, returning a Response for any HTTP status.
+
+    Network level errors (urllib's URLError, socket errors) are propagated.
+    '''
+    request = Request(url, headers=headers or {})
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        return Response(e.code, e.headers, e.read())
+    try:
+        return Response(response.getcode(), response.info(), response.read())
+    finally:
+        response.close()
+
+
+class StreamingResponse(object):
+
+    '''A response with its body read from fp as it arrives'''
+
+    def __init__(self, status, headers, fp):
+        self.status = status
+        self.headers = headers
+        self.fp = fp
+
+    def read(self, size=-1):
+        return self.fp.read(size)
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        return iter_chunks(self, chunk_size)
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_response(streaming_response):
+    '''Response with the whole body of streaming_response, closed'''
+    with streaming_response:
+        return Response(
+            streaming_response.status,
+            streaming_response.headers,
+            streaming_response.read(),
+        )
+
+
+def open_response(url, headers=None, timeout=TIMEOUT):
+    '''
+    GET url, returning a StreamingResponse for any HTTP status.
+
+    Network level errors (urllib's URLError, socket errors) are propagated.
+    '''
+    request = Request(url, headers=headers or {})
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        return StreamingResponse(e.code, e.headers, e)
+    return StreamingResponse(response.getcode(), response.info(), response)
+
+
+def open_stream(url, headers=None, timeout=TIMEOUT):
+    '''
+    Open url for streaming its content.
+
+    Raises HTTPError on non successful responses.
+    '''
+    return urlopen(Request(url, headers=headers or {}), timeout=timeout)
+
+
+HASH_ALGORITHMS = getattr(
+    hashlib, 'algorithms_guaranteed',
+    ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
+)
+
+
+class HashChecker(object):
+
+    '''
+    Hashes of data streamed through update, checked by check.
+
+    All of required ({name: digest}) must match, and of the allowed
+    ({name: set of digests}, e.g. from a lockfile) one for each name.
+    '''
+
+    def __init__(self, required=None, allowed=None):
+        self.required = {
+            name: digest.lower() for name, digest in (required or {}).items()
+            if name in HASH_ALGORITHMS
+        }
+        self.allowed = {
+            name: {digest.lower() for digest in digests}
+            for name, digests in (allowed or {}).items()
+        }
+        self.hashers = {
+            name: hashlib.new(name)
+            for name in set(self.required) | set(self.allowed)
+        }
+
+    def update(self, chunk):
+        for hasher in self.hashers.values():
+            hasher.update(chunk)
+
+    def check(self, source):
+        '''Raises IOError on mismatch'''
+        for name, hasher in self.hashers.items():
+            digest = hasher.hexdigest()
+            if name in self.required and digest != self.required[name]:
+                raise IOError('{}: {} hash mismatch'.format(source, name))
+            if name in self.allowed and digest not in self.allowed[name]:
+                raise IOError(
+                    '{}: {} hash not allowed'.format(source, name)
+                )
+
+
+def write_verified(chunks, path, checker, source):
+    '''
+    Write chunks to path, checking them with a HashChecker.
+
+    The file appears at path only when complete and verified.
+    '''
+    temp_path = path + '.part'
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                checker.update(chunk)
+        checker.check(source)
+        os.rename(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def download(link, path, open_stream=open_stream, allowed_hashes=None):
+    '''
+    Stream the file of link to path, checking the hashes of the link
+    and allowed_hashes (see HashChecker).
+
+    The file appears at path only when complete and verified.
+    Raises IOError on failures.
+    '''
+    checker = HashChecker(link.hashes, allowed_hashes)
+    stream = open_stream(link.url)
+    try:
+        write_verified(iter_chunks(stream), path, checker, link.url)
+    finally:
+        stream.close()
+
+
+class IndexReader(object):
+
+    '''
+    Projects and package file links of an index.
+
+    Pages are opened with `open_page` (e.g. a PageCache's), JSON preferred, and
+    project pages are parsed while they are read.
+    '''
+
+    def __init__(self, index_url, open_page=open_response):
+        self.index_url = index_url
+        self.open_page = open_page
+
+    def _open(self, url):
+        '''StreamingResponse of url, None if not found'''
+        response = self.open_page(url, {'Accept': ACCEPT})
+        if response.status == 200:
+            return response
+        if response.status == 404:
+            # read to the end, so that a caching open_page keeps it
+            try:
+                read_response(response)
+            except IOError:
+                pass
+            return None
+        response.close()
+        raise IOError('{}: HTTP {}'.format(url, response.status))
+
+    def get_project_names(self):
+        response = self._open(self.index_url)
+        if response is None:
+            raise IOError('{}: HTTP 404'.format(self.index_url))
+        return parse_index_page(read_response(response), self.index_url)
+
+    def _iter_links(self, response, url):
+        with response:
+            for link in iter_links(
+                    response.iter_chunks(), url, is_json(response)):
+                yield link
+
+    def iter_links(self, project):
+        '''
+        Package file links of project, as the page arrives.
+
+        Nothing for unknown projects; stop iterating to stop reading.
+        '''
+        url = project_url(self.index_url, project)
+        response = self._open(url)
+        if response is None:
+            return iter(())
+        return self._iter_links(response, url)
+
+    def get_links(self, project):
+        '''Package file links of project, None for unknown projects'''
+        url = project_url(self.index_url, project)
+        response = self._open(url)
+        if response is None:
+            return None
+        return list(self._iter_links(response, url))
+
+    def find_link(self, project, match):
+        '''First link of project for which match(link), read up to it'''
+        links = self.iter_links(project)
+        try:
+            for link in links:
+                if match(link):
+                    return link
+            return None
+        finally:
+            close = getattr(links, 'close', None)
+            if close:
+                close()
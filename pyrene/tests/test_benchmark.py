@@ -0,0 +1,93 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import pyrene.benchmark as m
+from pyrene.server import PackageServer
+from .test_server import start, url
+from .util import capture_stdout
+
+
+class Test_generate_repo(unittest.TestCase):
+
+    def test_projects_x_versions(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        m.generate_repo(directory, projects=3, versions=2, file_size=10)
+
+        filenames = sorted(os.listdir(directory))
+        self.assertEqual(6, len(filenames))
+        self.assertEqual('project0-1.0.tar.gz', filenames[0])
+        self.assertEqual(
+            10, os.path.getsize(os.path.join(directory, filenames[0]))
+        )
+
+
+class Test_percentile(unittest.TestCase):
+
+    def test(self):
+        values = list(range(101))
+
+        self.assertEqual(50, m.percentile(values, 0.5))
+        self.assertEqual(99, m.percentile(values, 0.99))
+
+    def test_empty(self):
+        self.assertEqual(0.0, m.percentile([], 0.5))
+
+
+class Test_LoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        m.generate_repo(self.directory, projects=3, versions=2, file_size=100)
+        server = PackageServer()
+        server.directory = self.directory
+        self.httpd = start(self, server)
+
+    def test_installs(self):
+        load_test = m.LoadTest(
+            url(self.httpd, '/simple/'), clients=3, requests=20,
+            index_ratio=0.5, seed=0
+        )
+
+        results = load_test.run()
+
+        self.assertEqual({}, results.errors)
+        self.assertEqual(20, len(results.latencies['project']))
+        self.assertEqual(20, len(results.latencies['file']))
+        self.assertIn('index', results.latencies)
+        self.assertGreaterEqual(results.bytes_received, 20 * 100)
+
+    def test_errors_are_counted(self):
+        load_test = m.LoadTest(url(self.httpd, '/simple/'), requests=5)
+        load_test.get_projects = lambda: ['missing']
+
+        results = load_test.run()
+
+        self.assertEqual({'project': 5}, results.errors)
+        self.assertIn(
+            'project: 5 requests, p50 0.0ms, p99 0.0ms, 5 errors (100.00%)',
+            results.report()
+        )
+
+
+class Test_main(unittest.TestCase):
+
+    def test_serves_generated_repo_and_reports(self):
+        with capture_stdout() as stdout:
+            m.main([
+                '--projects', '2', '--versions', '2', '--file-size', '10',
+                '--clients', '2', '--requests', '4', '--workers', '2',
+            ])
+            output = stdout.content
+
+        self.assertIn('Serving 2 projects x 2 versions', output)
+        self.assertIn('file: 4 requests', output)
+        self.assertIn('0 errors', output)
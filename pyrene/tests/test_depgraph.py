@@ -0,0 +1,205 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import json
+import os
+from temp_dir import within_temp_dir
+
+import pyrene.depgraph as m
+from pyrene.packages import Target
+from .util import make_wheel, make_sdist
+
+
+def make_package(filename, requires=(), requires_python=None):
+    pkg_info = b'Name: x\n'
+    if requires_python:
+        pkg_info += 'Requires-Python: {}\n'.format(requires_python).encode()
+    make_sdist(filename, {
+        'x.egg-info/PKG-INFO': pkg_info,
+        'x.egg-info/requires.txt': '\n'.join(requires).encode('utf8'),
+    })
+
+
+class Test_DependencyGraph(unittest.TestCase):
+
+    @within_temp_dir
+    def test_closure_follows_dependencies_of_highest_versions(self):
+        make_package('a-1.0.tar.gz', ['b'])
+        make_package('a-2.0.tar.gz', ['b<2', 'c>=1'])
+        make_package('b-1.5.tar.gz')
+        make_package('b-2.0.tar.gz')
+        make_wheel('c-1.0-py2.py3-none-any.whl', b'Name: c\n')
+        make_package('c-1.0.tar.gz')
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+
+        filenames, left = graph.closure(['a'])
+
+        self.assertEqual(
+            ['a-2.0.tar.gz', 'b-1.5.tar.gz', 'c-1.0.tar.gz'], filenames
+        )
+        self.assertEqual([], left)
+
+    @within_temp_dir
+    def test_closure_skips_pre_releases_unless_asked_for(self):
+        make_package('foo-1.9.tar.gz')
+        make_package('foo-2.0b1.tar.gz')
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+
+        self.assertEqual(['foo-1.9.tar.gz'], graph.closure(['foo'])[0])
+        self.assertEqual(['foo-1.9.tar.gz'], graph.closure(['foo>=1.0'])[0])
+        self.assertEqual(
+            ['foo-2.0b1.tar.gz'], graph.closure(['foo>=2.0b1'])[0]
+        )
+
+    @within_temp_dir
+    def test_what_can_not_be_resolved_is_left(self):
+        make_package('a-1.0.tar.gz', ['b', 'c[extra]', 'd>1', 'b>=2'])
+        make_package('b-1.0.tar.gz')
+        make_package('c-1.0.tar.gz')
+        make_package('d-1.0.tar.gz')
+        make_sdist('e-1.0.tar.gz', {'e-1.0/setup.py': b''})
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+
+        filenames, left = graph.closure(['a', 'e', 'missing'])
+
+        self.assertEqual(['a-1.0.tar.gz', 'b-1.0.tar.gz'], filenames)
+        self.assertEqual(['e', 'missing', 'c[extra]', 'd>1', 'b>=2'], left)
+
+    @within_temp_dir
+    def test_markers_are_evaluated(self):
+        make_package('a-1.0.tar.gz', [
+            'b; python_version < "1"', 'c; python_version > "1"'
+        ])
+        make_package('b-1.0.tar.gz')
+        make_package('c-1.0.tar.gz')
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+
+        filenames, left = graph.closure(['a'])
+
+        self.assertEqual(['a-1.0.tar.gz', 'c-1.0.tar.gz'], filenames)
+        self.assertEqual([], left)
+
+    @within_temp_dir
+    def test_markers_are_evaluated_in_environment(self):
+        make_package('a-1.0.tar.gz', [
+            'b; sys_platform == "win32"', 'c; sys_platform != "win32"'
+        ])
+        make_package('b-1.0.tar.gz')
+        make_package('c-1.0.tar.gz')
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+
+        filenames, _ = graph.closure(
+            ['a'], environment={'sys_platform': 'win32'}
+        )
+
+        self.assertEqual(['a-1.0.tar.gz', 'b-1.0.tar.gz'], filenames)
+
+    @within_temp_dir
+    def test_closure_skips_files_not_for_target_python(self):
+        make_package('a-1.0.tar.gz', requires_python='>=2.7')
+        make_package('a-2.0.tar.gz', requires_python='>=3.6')
+        make_package('b-1.0.tar.gz', requires_python='>=3')
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+
+        self.assertEqual(
+            (['a-1.0.tar.gz'], ['b']),
+            graph.closure(['a', 'b'], target=Target('2.7'))
+        )
+        self.assertEqual(
+            ['a-2.0.tar.gz', 'b-1.0.tar.gz'],
+            graph.closure(['a', 'b'], target=Target('3.9'))[0]
+        )
+
+    @within_temp_dir
+    def test_entries_without_requires_python_are_read_again(self):
+        make_package('a-1.0.tar.gz', requires_python='>=3')
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+        graph.files['a-1.0.tar.gz'] = graph.files['a-1.0.tar.gz'][:3]
+        graph.save()
+
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+
+        self.assertEqual('>=3', graph.get_requires_python('a-1.0.tar.gz'))
+
+    @within_temp_dir
+    def test_state_is_persisted(self):
+        make_package('a-1.0.tar.gz', ['b'])
+        m.DependencyGraph('.').refresh()
+
+        with open('.pyrene-metadata/dependencies.json') as f:
+            state = json.load(f)
+        self.assertEqual(['b'], state['a-1.0.tar.gz'][2])
+        self.assertEqual(['b'], m.DependencyGraph('.').get_requirements(
+            'a-1.0.tar.gz'
+        ))
+
+    @within_temp_dir
+    def test_refresh_reads_only_new_files_and_forgets_removed_ones(self):
+        make_package('a-1.0.tar.gz')
+        make_package('b-1.0.tar.gz')
+        m.DependencyGraph('.').refresh()
+        os.remove('b-1.0.tar.gz')
+        make_package('c-1.0.tar.gz')
+
+        read = []
+        graph = m.DependencyGraph('.')
+        original_read = graph._read
+        graph._read = lambda filename: (
+            read.append(filename) or original_read(filename)
+        )
+        graph.refresh()
+
+        self.assertEqual(['c-1.0.tar.gz'], read)
+        self.assertEqual(
+            ['a-1.0.tar.gz', 'c-1.0.tar.gz'], sorted(graph.files)
+        )
+
+    @within_temp_dir
+    def test_update_of_unchanged_files_is_a_noop(self):
+        make_package('a-1.0.tar.gz')
+        graph = m.DependencyGraph('.')
+
+        self.assertTrue(graph.update(['a-1.0.tar.gz']))
+        self.assertFalse(graph.update(['a-1.0.tar.gz']))
+
+    @within_temp_dir
+    def test_dependents(self):
+        make_package('a-1.0.tar.gz', ['b>=1'])
+        make_package('a-2.0.tar.gz', ['B (<3); python_version < "1"'])
+        make_package('c-1.0.tar.gz', ['d'])
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+
+        self.assertEqual(
+            [
+                ('a-1.0.tar.gz', 'b>=1'),
+                ('a-2.0.tar.gz', 'B (<3); python_version < "1"'),
+            ],
+            graph.get_dependents('B')
+        )
+        self.assertEqual([], graph.get_dependents('a'))
+
+    @within_temp_dir
+    def test_dependents_are_updated_incrementally(self):
+        make_package('a-1.0.tar.gz', ['b'])
+        make_package('c-1.0.tar.gz', ['b'])
+        graph = m.DependencyGraph('.')
+        graph.refresh()
+        graph.get_dependents('b')
+
+        os.remove('a-1.0.tar.gz')
+        make_package('d-1.0.tar.gz', ['b'])
+        graph.update(['a-1.0.tar.gz', 'd-1.0.tar.gz'])
+        graph.remove('c-1.0.tar.gz')
+
+        self.assertEqual([('d-1.0.tar.gz', 'b')], graph.get_dependents('b'))
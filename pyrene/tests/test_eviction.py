@@ -0,0 +1,185 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import os
+import time
+from temp_dir import within_temp_dir
+
+import pyrene.eviction as m
+from pyrene.util import write_file
+
+
+class Test_parse_size(unittest.TestCase):
+
+    def test_bytes(self):
+        self.assertEqual(12345, m.parse_size('12345'))
+
+    def test_units(self):
+        self.assertEqual(500 * 1024 ** 2, m.parse_size('500M'))
+        self.assertEqual(10 * 1024 ** 3, m.parse_size('10GB'))
+        self.assertEqual(1024 ** 4 // 2, m.parse_size('0.5TiB'))
+        self.assertEqual(2048, m.parse_size('2k'))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            m.parse_size('lots')
+
+
+def make_files(*names):
+    for i, name in enumerate(names):
+        path = os.path.join('repo', name)
+        write_file(path, b'x' * 100)
+        # arrival order
+        os.utime(path, (1000 + i, 1000 + i))
+
+
+class Test_Evictor(unittest.TestCase):
+
+    @within_temp_dir
+    def test_within_budget_nothing_is_removed(self):
+        make_files('a-1.zip', 'b-1.zip')
+
+        m.Evictor('repo', 200).evict()
+
+        self.assertEqual(
+            ['a-1.zip', 'b-1.zip'],
+            sorted(f for f in os.listdir('repo') if not f.startswith('.'))
+        )
+
+    @within_temp_dir
+    def test_lru_removes_least_recently_used(self):
+        make_files('a-1.zip', 'b-1.zip', 'c-1.zip')
+        evictor = m.Evictor('repo', 200)
+        evictor.touch('a-1.zip')
+
+        evictor.evict()
+
+        self.assertFalse(os.path.exists('repo/b-1.zip'))
+        self.assertTrue(os.path.exists('repo/a-1.zip'))
+        self.assertTrue(os.path.exists('repo/c-1.zip'))
+
+    @within_temp_dir
+    def test_lfu_removes_least_frequently_used(self):
+        make_files('a-1.zip', 'b-1.zip', 'c-1.zip')
+        evictor = m.Evictor('repo', 200, m.POLICY.LFU)
+        evictor.touch('a-1.zip')
+        evictor.touch('a-1.zip')
+        evictor.touch('b-1.zip')
+        evictor.touch('b-1.zip')
+        evictor.touch('c-1.zip')
+
+        evictor.evict()
+
+        self.assertFalse(os.path.exists('repo/c-1.zip'))
+        self.assertTrue(os.path.exists('repo/a-1.zip'))
+        self.assertTrue(os.path.exists('repo/b-1.zip'))
+
+    @within_temp_dir
+    def test_other_files_are_kept(self):
+        make_files('a-1.zip')
+        write_file('repo/README', b'x' * 1000)
+
+        m.Evictor('repo', 0).evict()
+
+        self.assertEqual(
+            ['README'],
+            [f for f in os.listdir('repo') if not f.startswith('.')]
+        )
+
+    @within_temp_dir
+    def test_evicts_in_batches(self):
+        make_files('a-1.zip', 'b-1.zip', 'c-1.zip')
+        evictor = m.Evictor('repo', 0, batch_size=2)
+
+        self.assertTrue(evictor.evict_some())
+        self.assertEqual(1, len(evictor.get_files()))
+
+    @within_temp_dir
+    def test_accesses_are_persisted(self):
+        make_files('a-1.zip', 'b-1.zip')
+        evictor = m.Evictor('repo', 200)
+        evictor.touch('a-1.zip')
+        evictor.save()
+
+        write_file('repo/c-1.zip', b'x' * 100)
+        m.Evictor('repo', 200).evict()
+
+        self.assertFalse(os.path.exists('repo/b-1.zip'))
+        self.assertTrue(os.path.exists('repo/a-1.zip'))
+
+    @within_temp_dir
+    def test_state_is_saved_apart_only_when_changed(self):
+        make_files('a-1.zip')
+        os.utime('repo', (1000, 1000))
+        evictor = m.Evictor('repo', 200)
+
+        evictor.save()
+        self.assertFalse(os.path.exists(evictor.state_path))
+
+        evictor.touch('a-1.zip')
+        evictor.save()
+        self.assertEqual(
+            os.path.join('repo', '.pyrene-metadata', 'access.json'),
+            evictor.state_path
+        )
+        self.assertTrue(os.path.exists(evictor.state_path))
+        mtime = os.stat('repo').st_mtime
+        saved_at = os.stat(evictor.state_path).st_mtime
+        os.utime(evictor.state_path, (saved_at - 10, saved_at - 10))
+
+        evictor.save()
+        evictor.evict()
+        self.assertEqual(saved_at - 10, os.stat(evictor.state_path).st_mtime)
+
+        evictor.touch('a-1.zip')
+        evictor.save()
+        self.assertEqual(mtime, os.stat('repo').st_mtime)
+
+    @within_temp_dir
+    def test_kept_files_are_not_removed(self):
+        make_files('a-1.zip', 'b-1.zip')
+        evictor = m.Evictor('repo', 0)
+
+        evictor.evict(keep=['a-1.zip'])
+
+        self.assertEqual(['a-1.zip'], [f for f, _, _ in evictor.get_files()])
+
+    @within_temp_dir
+    def test_take_over(self):
+        make_files('a-1.zip')
+        old = m.Evictor('repo', 200)
+        evictor = m.Evictor('repo', 200)
+        old.touch('a-1.zip')
+
+        evictor.take_over(old)
+        old.touch('a-1.zip')
+
+        self.assertEqual(2, evictor.access['a-1.zip'][1])
+
+    @within_temp_dir
+    def test_on_evict(self):
+        make_files('a-1.zip')
+        evicted = []
+        evictor = m.Evictor('repo', 0)
+        evictor.on_evict = evicted.append
+
+        evictor.evict()
+
+        self.assertEqual(['a-1.zip'], evicted)
+
+    @within_temp_dir
+    def test_background_eviction(self):
+        make_files('a-1.zip', 'b-1.zip')
+        evictor = m.Evictor('repo', 100, interval=60)
+        evictor.start()
+        try:
+            evictor.wake()
+            deadline = time.time() + 5
+            while len(evictor.get_files()) > 1 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            evictor.stop()
+
+        self.assertEqual(1, len(evictor.get_files()))
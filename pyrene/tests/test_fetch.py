@@ -0,0 +1,116 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import pyrene.fetch as m
+from pyrene.packages import normalize_name, parse_filename, Target
+from .util import capture_stdout, make_sdist
+
+
+class Test_PinnedDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repo)
+        self.destination = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.destination)
+        self.asked = []
+
+    def add_sdist(self, filename, requires=None):
+        members = {'PKG-INFO': b'Name: x\n'}
+        if requires is not None:
+            members['x.egg-info/PKG-INFO'] = b'Name: x\n'
+            members['x.egg-info/requires.txt'] = requires
+        make_sdist(os.path.join(self.repo, filename), members)
+
+    def get_files(self, project):
+        self.asked.append(project)
+        files = {
+            filename: m.LocalFile(os.path.join(self.repo, filename))
+            for filename in os.listdir(self.repo)
+            if normalize_name(parse_filename(filename)[0]) == project
+        }
+        return files or None
+
+    def run_download(self, *requirements):
+        with capture_stdout():
+            return m.download_pinned(
+                self.get_files, requirements, self.destination
+            )
+
+    @property
+    def downloaded(self):
+        return sorted(os.listdir(self.destination))
+
+    def test_pinned_dependencies_are_followed(self):
+        self.add_sdist('a-1.0.tar.gz', b'b==2.0\n')
+        self.add_sdist('b-2.0.tar.gz', b'')
+        self.add_sdist('b-3.0.tar.gz', b'')
+
+        left = self.run_download('a==1.0')
+
+        self.assertEqual([], left)
+        self.assertEqual(['a-1.0.tar.gz', 'b-2.0.tar.gz'], self.downloaded)
+
+    def test_unpinned_dependencies_are_left_for_pip(self):
+        self.add_sdist('a-1.0.tar.gz', b'b>=2.0\n')
+
+        left = self.run_download('a==1.0')
+
+        self.assertEqual(['b>=2.0'], left)
+        self.assertEqual(['a-1.0.tar.gz'], self.downloaded)
+
+    def test_unknown_dependencies_are_left_for_pip(self):
+        self.add_sdist('a-1.0.tar.gz')
+
+        self.assertEqual(['a==1.0'], self.run_download('a==1.0'))
+
+    def test_missing_release_is_left_for_pip(self):
+        self.assertEqual(['a==1.0'], self.run_download('a==1.0'))
+        self.assertEqual([], self.downloaded)
+
+    def test_files_requiring_other_python_are_skipped(self):
+        self.add_sdist('a-1.0.tar.gz', b'')
+        self.add_sdist('a-1.0.tgz', b'')
+        get_files = self.get_files
+
+        def get_files_with_requires_python(project):
+            files = get_files(project)
+            files['a-1.0.tar.gz'].requires_python = '>=3.10'
+            return files
+        with capture_stdout():
+            left = m.download_pinned(
+                get_files_with_requires_python, ['a==1.0'], self.destination,
+                target=Target('3.9')
+            )
+
+        self.assertEqual([], left)
+        self.assertEqual(['a-1.0.tgz'], self.downloaded)
+
+    def test_unpinned_requirement_is_not_looked_up(self):
+        self.assertEqual(['a>=1.0'], self.run_download('a>=1.0'))
+        self.assertEqual([], self.asked)
+
+    def test_shared_dependency_is_fetched_once(self):
+        self.add_sdist('a-1.0.tar.gz', b'c==1.0\n')
+        self.add_sdist('b-1.0.tar.gz', b'c==1.0\n')
+        self.add_sdist('c-1.0.tar.gz', b'')
+
+        left = self.run_download('a==1.0', 'b==1.0')
+
+        self.assertEqual([], left)
+        self.assertEqual(1, self.asked.count('c'))
+
+    def test_not_supported_by_repo(self):
+        def get_files(project):
+            raise NotImplementedError
+
+        self.assertEqual(
+            ['a==1.0'],
+            m.download_pinned(get_files, ['a==1.0'], self.destination)
+        )
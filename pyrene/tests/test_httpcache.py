@@ -0,0 +1,167 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import io
+import os
+import shutil
+import tempfile
+
+import pyrene.httpcache as m
+from pyrene.simple import IndexReader, Response, StreamingResponse
+
+
+URL = 'http://example.com/simple/a/'
+
+
+class FakeServer(object):
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    def open(self, url, headers=None):
+        self.requests.append((url, dict(headers or {})))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return StreamingResponse(
+            response.status, response.headers, io.BytesIO(response.body)
+        )
+
+
+def page(body=b'page', etag='"1"'):
+    return Response(
+        200,
+        {'Content-Type': 'text/html', 'ETag': etag, 'Server': 'x'},
+        body
+    )
+
+
+class Test_PageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.server = FakeServer()
+
+    def make_cache(self, ttl=600):
+        return m.PageCache(self.directory, ttl, self.server.open)
+
+    def age(self, seconds):
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            mtime = os.stat(path).st_mtime - seconds
+            os.utime(path, (mtime, mtime))
+
+    def test_fresh_page_is_not_requested(self):
+        self.server.responses = [page()]
+        self.make_cache().get(URL)
+
+        response = self.make_cache().get(URL)
+
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'page', response.body)
+        self.assertEqual('text/html', response.headers.get('Content-Type'))
+
+    def test_stale_page_is_revalidated(self):
+        self.server.responses = [page(), Response(304, {}, b'')]
+        self.make_cache().get(URL)
+        self.age(601)
+
+        cache = self.make_cache()
+        response = cache.get(URL)
+
+        self.assertEqual(b'page', response.body)
+        self.assertEqual('"1"', self.server.requests[1][1]['If-None-Match'])
+        self.assertEqual(
+            {('page', 'revalidated'): 1}, cache.cache.get_counts()
+        )
+        # fresh again
+        cache.get(URL)
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_changed_page_is_replaced(self):
+        self.server.responses = [page(), page(b'new', '"2"')]
+        self.make_cache(ttl=0).get(URL)
+
+        self.assertEqual(b'new', self.make_cache(ttl=0).get(URL).body)
+        self.server.responses = [Response(304, {}, b'')]
+        self.assertEqual(b'new', self.make_cache(ttl=0).get(URL).body)
+
+    def test_missing_project_is_cached(self):
+        self.server.responses = [Response(404, {}, b'')]
+        self.make_cache().get(URL)
+
+        self.assertEqual(404, self.make_cache().get(URL).status)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_missing_project_is_cached_through_index_reader(self):
+        self.server.responses = [Response(404, {}, b'Not Found')]
+        reader = IndexReader(
+            'http://example.com/simple/', self.make_cache().open
+        )
+
+        self.assertIsNone(reader.get_links('nope'))
+        self.assertIsNone(reader.get_links('nope'))
+
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_server_errors_are_not_cached(self):
+        self.server.responses = [Response(500, {}, b''), page()]
+        self.make_cache().get(URL)
+
+        self.assertEqual(200, self.make_cache().get(URL).status)
+
+    def test_representations_are_cached_separately(self):
+        self.server.responses = [page(b'html'), page(b'json')]
+        self.make_cache().get(URL, {'Accept': 'text/html'})
+
+        response = self.make_cache().get(URL, {'Accept': 'application/json'})
+
+        self.assertEqual(b'json', response.body)
+
+    def test_unreachable_server(self):
+        self.server.responses = [page(), IOError('down')]
+        self.make_cache(ttl=0).get(URL)
+
+        self.assertEqual(b'page', self.make_cache(ttl=0).get(URL).body)
+
+    def test_unreachable_server_without_cached_page(self):
+        self.server.responses = [IOError('down')]
+
+        with self.assertRaises(IOError):
+            self.make_cache().get(URL)
+
+    def test_damaged_entry_is_refetched(self):
+        self.server.responses = [page(), page(b'again')]
+        cache = self.make_cache()
+        cache.get(URL)
+        with open(cache.get_path(URL, {}), 'wb') as f:
+            f.write(b'garbage')
+
+        self.assertEqual(b'again', cache.get(URL).body)
+
+    def test_page_is_cached_while_streamed(self):
+        self.server.responses = [page(b'x' * 100)]
+
+        with self.make_cache().open(URL) as response:
+            chunks = list(response.iter_chunks(30))
+
+        self.assertEqual(b'x' * 100, b''.join(chunks))
+        self.assertEqual(b'x' * 100, self.make_cache().get(URL).body)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_partially_read_page_is_not_cached(self):
+        self.server.responses = [page(b'x' * 100), page(b'y')]
+
+        with self.make_cache().open(URL) as response:
+            response.read(10)
+
+        self.assertEqual(b'y', self.make_cache().get(URL).body)
+        self.assertEqual([], [
+            filename for filename in os.listdir(self.directory)
+            if filename.endswith('.part')
+        ])
@@ -0,0 +1,178 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import hashlib
+import os
+import shutil
+import tempfile
+from temp_dir import within_temp_dir
+
+import pyrene.lockfile as m
+from pyrene.fetch import LocalFile
+from pyrene.packages import Target
+from pyrene.simple import Link
+from pyrene.util import write_file
+from .util import capture_stdout
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+class Test_parse_lockfile(unittest.TestCase):
+
+    def test(self):
+        requirements = m.parse_lockfile('''\
+# generated
+--index-url https://pypi.example.com/simple/
+
+a==1.0 \\
+    --hash=sha256:AA \\
+    --hash=sha256:bb  # the wheel
+B_c[x]==2.0; python_version < "3" --hash=sha512:cc
+''')
+
+        self.assertEqual(['a==1.0', 'B-c==2.0'], list(map(str, requirements)))
+        self.assertEqual({'sha256': {'aa', 'bb'}}, requirements[0].hashes)
+        self.assertEqual(4, requirements[0].line)
+        self.assertFalse(requirements[1].applies())
+
+    def test_unpinned_requirement(self):
+        with self.assertRaises(ValueError) as cm:
+            m.parse_lockfile('a==1.0 --hash=sha256:aa\nb>=1 --hash=sha256:bb')
+        self.assertIn('line 2', str(cm.exception))
+
+    def test_requirement_without_hash(self):
+        with self.assertRaises(ValueError):
+            m.parse_lockfile('a==1.0')
+
+    def test_unknown_hash_algorithm(self):
+        with self.assertRaises(ValueError):
+            m.parse_lockfile('a==1.0 --hash=crc32:aa')
+
+
+class Test_read_requirements_file(unittest.TestCase):
+
+    @within_temp_dir
+    def test(self):
+        os.mkdir('reqs')
+        write_file('reqs/base.txt', b'a>=1.0\n-r reqs.txt\n')
+        write_file('reqs/reqs.txt', b'''\
+# comment
+--index-url http://example.com/simple/
+-r base.txt
+b[x] >= 2.0 ; python_version < "3"  # comment
+c==1.0 \\
+    --hash=sha256:aa
+''')
+
+        self.assertEqual(
+            ['a>=1.0', 'b[x] >= 2.0 ; python_version < "3"', 'c==1.0'],
+            m.read_requirements_file('reqs/reqs.txt')
+        )
+
+    def test_missing(self):
+        with self.assertRaises(IOError):
+            m.read_requirements_file('/nonexistent/requirements.txt')
+
+
+class Test_download_locked(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repo)
+        self.destination = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.destination)
+        self.files = {}
+
+    def add_file(self, filename, content):
+        path = os.path.join(self.repo, filename)
+        write_file(path, content)
+        self.files[filename] = LocalFile(path)
+
+    def get_files(self, project):
+        return {
+            filename: package_file
+            for filename, package_file in self.files.items()
+            if filename.startswith(project + '-')
+        }
+
+    def download(self, lockfile, **kwargs):
+        with capture_stdout():
+            return m.download_locked(
+                self.get_files, m.parse_lockfile(lockfile), self.destination,
+                **kwargs
+            )
+
+    @property
+    def downloaded(self):
+        return sorted(os.listdir(self.destination))
+
+    def test_files_are_verified(self):
+        self.add_file('a-1.0.tar.gz', b'a')
+        self.add_file('b-1.0.tar.gz', b'tampered')
+
+        failed = self.download(
+            'a==1.0 --hash=sha256:{}\nb==1.0 --hash=sha256:{}'
+            .format(sha256(b'a'), sha256(b'b'))
+        )
+
+        self.assertEqual(['b==1.0'], list(map(str, failed)))
+        self.assertEqual(['a-1.0.tar.gz'], self.downloaded)
+
+    def test_missing_file(self):
+        failed = self.download('a==1.0 --hash=sha256:aa')
+
+        self.assertEqual(['a==1.0'], list(map(str, failed)))
+
+    def test_requirements_not_for_target_are_skipped(self):
+        self.add_file('a-1.0.tar.gz', b'a')
+
+        failed = self.download(
+            'a==1.0; sys_platform == "win32" --hash=sha256:{}'
+            .format(sha256(b'a')),
+            target=Target('3.9', ['manylinux2014_x86_64'])
+        )
+
+        self.assertEqual([], failed)
+        self.assertEqual([], self.downloaded)
+
+    def test_wheel_if_only_wheels_are_locked(self):
+        self.add_file('a-1.0.tar.gz', b'sdist')
+        self.add_file('a-1.0-py3-none-any.whl', b'wheel')
+
+        failed = self.download(
+            'a==1.0 --hash=sha256:{}'.format(sha256(b'wheel')),
+            target=Target('3.9')
+        )
+
+        self.assertEqual([], failed)
+        self.assertEqual(['a-1.0-py3-none-any.whl'], self.downloaded)
+
+    def test_links_with_known_other_hash_are_not_fetched(self):
+        class RemoteFile(object):
+            requires_python = None
+
+            def __init__(self, filename, digest):
+                self.filename = filename
+                self.link = Link(
+                    'http://x/{}#sha256={}'.format(filename, digest)
+                )
+
+            def fetch(self, directory, allowed_hashes=None):
+                write_file(os.path.join(directory, self.filename), b'wheel')
+        self.files = {
+            'a-1.0.tar.gz': RemoteFile('a-1.0.tar.gz', sha256(b'sdist')),
+            'a-1.0-py3-none-any.whl':
+                RemoteFile('a-1.0-py3-none-any.whl', sha256(b'wheel')),
+        }
+
+        failed = self.download(
+            'a==1.0 --hash=sha256:{}'.format(sha256(b'wheel')),
+            target=Target('3.9')
+        )
+
+        self.assertEqual([], failed)
+        self.assertEqual(['a-1.0-py3-none-any.whl'], self.downloaded)
@@ -0,0 +1,170 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import mock
+import os
+from temp_dir import within_temp_dir
+
+import pyrene.manifest as m
+from pyrene.repos import DirectoryRepo, UnionRepo
+from pyrene.util import Directory, write_file
+from pyrene.constants import REPO, REPOTYPE
+from .util import capture_stdout
+
+
+def make_repo(name):
+    return DirectoryRepo(
+        name, {REPO.TYPE: REPOTYPE.DIRECTORY, REPO.DIRECTORY: name}
+    )
+
+
+class Test_Checkpoint(unittest.TestCase):
+
+    @within_temp_dir
+    def test_saved_and_loaded(self):
+        checkpoint = m.Checkpoint('state/checkpoint.json')
+        checkpoint.reset(['a-1.0.tar.gz'])
+        checkpoint.add(['b-1.0.tar.gz'])
+        checkpoint.save()
+
+        checkpoint = m.Checkpoint('state/checkpoint.json')
+        checkpoint.load()
+
+        self.assertEqual({'a-1.0.tar.gz', 'b-1.0.tar.gz'}, checkpoint.present)
+
+    @within_temp_dir
+    def test_missing_or_damaged_is_unknown(self):
+        checkpoint = m.Checkpoint('checkpoint.json')
+        checkpoint.load()
+        self.assertIsNone(checkpoint.present)
+
+        write_file('checkpoint.json', b'{"present"')
+        checkpoint.load()
+        self.assertIsNone(checkpoint.present)
+
+    @within_temp_dir
+    def test_of_repo_pair(self):
+        source, destination = make_repo('a'), make_repo('b')
+        path = m.Checkpoint.of(source, destination, 'state').path
+
+        self.assertEqual(
+            path, m.Checkpoint.of(make_repo('a'), destination, 'state').path
+        )
+        self.assertNotEqual(
+            path, m.Checkpoint.of(destination, source, 'state').path
+        )
+        moved = DirectoryRepo('a', dict(source.attributes, directory='c'))
+        self.assertNotEqual(
+            path, m.Checkpoint.of(moved, destination, 'state').path
+        )
+
+
+class Test_mirror(unittest.TestCase):
+
+    def setUp(self):
+        super(Test_mirror, self).setUp()
+        self.source = make_repo('source')
+        self.destination = make_repo('destination')
+
+    def run_mirror(self, rescan=False):
+        os.mkdir('temp')
+        try:
+            with capture_stdout() as stdout:
+                result = m.mirror(
+                    self.source, self.destination, Directory('temp'),
+                    self.checkpoint, rescan=rescan, batch_size=2
+                )
+                self.output = stdout.content
+        finally:
+            os.rmdir('temp')
+        return result
+
+    @property
+    def destination_files(self):
+        return sorted(self.destination.get_manifest())
+
+    def setup_repos(self, source_files, destination_files):
+        os.mkdir('source')
+        os.mkdir('destination')
+        for filename in source_files:
+            write_file('source/' + filename, filename.encode())
+        for filename in destination_files:
+            write_file('destination/' + filename, b'')
+        self.checkpoint = m.Checkpoint('checkpoint.json')
+
+    @within_temp_dir
+    def test_copies_missing_files(self):
+        self.setup_repos(
+            ['a-1.0.tar.gz', 'b-1.0.tar.gz', 'c-1.0.tar.gz', 'd-1.0.tar.gz'],
+            ['b-1.0.tar.gz']
+        )
+
+        self.assertEqual((3, 0), self.run_mirror())
+
+        self.assertEqual(
+            ['a-1.0.tar.gz', 'b-1.0.tar.gz', 'c-1.0.tar.gz', 'd-1.0.tar.gz'],
+            self.destination_files
+        )
+        self.assertEqual(b'', open('destination/b-1.0.tar.gz', 'rb').read())
+        self.assertIn('3 to copy', self.output)
+        checkpoint = m.Checkpoint('checkpoint.json')
+        checkpoint.load()
+        self.assertEqual(4, len(checkpoint.present))
+
+    @within_temp_dir
+    def test_later_runs_do_not_list_destination(self):
+        self.setup_repos(['a-1.0.tar.gz'], [])
+        self.run_mirror()
+        write_file('source/b-1.0.tar.gz', b'')
+
+        with mock.patch.object(
+                self.destination, 'get_manifest',
+                side_effect=AssertionError('listed')):
+            self.assertEqual((1, 0), self.run_mirror())
+
+        self.assertEqual(
+            ['a-1.0.tar.gz', 'b-1.0.tar.gz'],
+            self.destination_files
+        )
+
+    @within_temp_dir
+    def test_rescan(self):
+        self.setup_repos(['a-1.0.tar.gz'], [])
+        self.run_mirror()
+        os.remove('destination/a-1.0.tar.gz')
+
+        self.assertEqual((0, 0), self.run_mirror())
+        self.assertEqual((1, 0), self.run_mirror(rescan=True))
+
+        self.assertEqual(['a-1.0.tar.gz'], self.destination_files)
+
+    @within_temp_dir
+    def test_failed_files_are_retried(self):
+        self.setup_repos(['a-1.0.tar.gz', 'b-1.0.tar.gz'], [])
+        manifest = self.source.get_manifest()
+        manifest['b-1.0.tar.gz'].path = 'source/missing'
+
+        with mock.patch.object(
+                self.source, 'get_manifest', return_value=manifest):
+            self.assertEqual((1, 1), self.run_mirror())
+
+        self.assertEqual((1, 0), self.run_mirror())
+        self.assertEqual(
+            ['a-1.0.tar.gz', 'b-1.0.tar.gz'],
+            self.destination_files
+        )
+
+    @within_temp_dir
+    def test_refuses_destination_not_storing_uploads(self):
+        self.setup_repos(['a-1.0.tar.gz'], [])
+        self.destination = UnionRepo('union', {
+            REPO.TYPE: REPOTYPE.UNION, REPO.REPOS: 'destination'
+        })
+
+        with self.assertRaises(ValueError):
+            self.run_mirror()
+
+        self.assertIsNone(self.checkpoint.present)
+        self.assertFalse(os.path.exists('checkpoint.json'))
@@ -0,0 +1,107 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import pyrene.metrics as m
+
+
+class Test_Histogram(unittest.TestCase):
+
+    def test_quantile_is_upper_bound_of_bucket(self):
+        histogram = m.Histogram(buckets=(0.1, 1.0, float('inf')))
+        for value in (0.05,) * 98 + (0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(0.1, histogram.quantile(0.5))
+        self.assertEqual(1.0, histogram.quantile(0.99))
+        self.assertEqual(float('inf'), histogram.quantile(1))
+
+    def test_empty(self):
+        self.assertEqual(0.0, m.Histogram().quantile(0.99))
+
+    def test_cumulative_counts(self):
+        histogram = m.Histogram(buckets=(1.0, float('inf')))
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        self.assertEqual(
+            [(1.0, 1), (float('inf'), 2)],
+            list(histogram.cumulative_counts())
+        )
+        self.assertEqual(5.5, histogram.sum)
+
+
+class Test_Metrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = m.Metrics()
+        self.metrics.observe_request('repo', 'package', 200, 0.002, 1000)
+        self.metrics.observe_request('repo', 'package', 404, 0.001, 10)
+        self.metrics.observe_request('repo', 'index', 200, 0.2, 500)
+        cache = m.CacheCounter()
+        cache.count('file', 'hit')
+        cache.count('file', 'hit')
+        other_cache = m.CacheCounter()
+        other_cache.count('file', 'miss')
+        self.metrics.add_cache_counters('repo', [cache, other_cache])
+
+    def test_render(self):
+        text = self.metrics.render()
+
+        self.assertIn(
+            'pyrene_requests_total'
+            '{repo="repo",endpoint="package",status="404"} 1',
+            text
+        )
+        self.assertIn(
+            'pyrene_request_duration_seconds_bucket'
+            '{repo="repo",endpoint="package",le="0.0025"} 2',
+            text
+        )
+        self.assertIn(
+            'pyrene_request_duration_seconds_count'
+            '{repo="repo",endpoint="package"} 2',
+            text
+        )
+        self.assertIn(
+            'pyrene_response_bytes_total'
+            '{repo="repo",endpoint="package"} 1010',
+            text
+        )
+        self.assertIn(
+            'pyrene_cache_total{repo="repo",cache="file",result="hit"} 2',
+            text
+        )
+        self.assertIn(
+            'pyrene_cache_total{repo="repo",cache="file",result="miss"} 1',
+            text
+        )
+
+    def test_labels_are_escaped(self):
+        self.metrics.observe_request('a"b', 'index', 200, 0, 0)
+
+        self.assertIn('repo="a\\"b"', self.metrics.render())
+
+    def test_summary(self):
+        summary = '\n'.join(self.metrics.summary())
+
+        self.assertIn(
+            'repo package: 2 requests, 1 not found, 0 errors,'
+            ' p50 <= 1ms, p99 <= 2.5ms, 1010 bytes sent',
+            summary
+        )
+        self.assertIn('repo cache: file hit 2, file miss 1', summary)
+
+    def test_workers(self):
+        self.metrics.worker_started(0.003)
+        self.metrics.worker_started(0.003)
+        self.metrics.worker_finished()
+
+        self.assertEqual(1, self.metrics.busy_workers)
+        self.assertIn(
+            'workers: at most 2 busy, waited for a worker:'
+            ' p50 <= 5ms, p99 <= 5ms',
+            self.metrics.summary()
+        )
@@ -0,0 +1,216 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import io
+import threading
+import time
+
+import pyrene.mirrors as m
+from pyrene.simple import StreamingResponse
+
+
+MIRROR1 = 'http://mirror1/simple/'
+MIRROR2 = 'http://mirror2/simple/'
+MIRROR3 = 'http://mirror3/simple/'
+
+
+class FakeMirrors(object):
+
+    '''
+    Responses by mirror url: an HTTP status, an exception or an Event to
+    wait for before responding 200.
+    '''
+
+    def __init__(self, behaviours):
+        self.behaviours = behaviours
+        self.requests = []
+        self.closed = []
+        self.lock = threading.Lock()
+
+    def open(self, url, headers=None):
+        with self.lock:
+            self.requests.append(url)
+        for mirror, behaviour in self.behaviours.items():
+            if url.startswith(mirror):
+                break
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        status = 200
+        if isinstance(behaviour, threading.Event):
+            behaviour.wait()
+        else:
+            status = behaviour
+        response = StreamingResponse(status, {}, io.BytesIO(url.encode()))
+        close = response.close
+
+        def closing():
+            with self.lock:
+                self.closed.append(url)
+            close()
+        response.close = closing
+        return response
+
+
+class Test_split_urls(unittest.TestCase):
+
+    def test_whitespace_and_commas(self):
+        self.assertEqual(
+            [MIRROR1, MIRROR2, MIRROR3],
+            m.split_urls(' {}, {}\n {}'.format(MIRROR1, MIRROR2, MIRROR3))
+        )
+
+
+class Test_MirrorSet(unittest.TestCase):
+
+    def make_mirrors(self, behaviours, **kwargs):
+        self.server = FakeMirrors(behaviours)
+        mirrors = m.MirrorSet(
+            [MIRROR1, MIRROR2.rstrip('/'), MIRROR3],
+            open_page=self.server.open, open_stream=self.server.open,
+            **kwargs
+        )
+        return mirrors
+
+    def test_url_is_the_first_one(self):
+        mirrors = self.make_mirrors({})
+        self.assertEqual(MIRROR1, mirrors.url)
+
+    def test_probe_measures_latency(self):
+        times = iter([10.0, 10.25])
+        mirrors = self.make_mirrors({MIRROR1: 200}, clock=lambda: next(times))
+
+        self.assertEqual(0.25, mirrors.probe(MIRROR1))
+        self.assertEqual([MIRROR1], self.server.closed)
+
+    def test_probe_of_failing_mirror(self):
+        mirrors = self.make_mirrors({MIRROR1: 503, MIRROR2: IOError('down')})
+
+        self.assertIsNone(mirrors.probe(MIRROR1))
+        self.assertIsNone(mirrors.probe(MIRROR2))
+
+    def test_ranked_fastest_first_unreachable_last(self):
+        mirrors = self.make_mirrors({})
+        mirrors.latencies = {MIRROR1: None, MIRROR2: 0.5, MIRROR3: 0.1}
+
+        self.assertEqual([MIRROR3, MIRROR2, MIRROR1], mirrors.ranked())
+
+    def test_ranked_probes_unknown_mirrors(self):
+        mirrors = self.make_mirrors(
+            {MIRROR1: IOError('down'), MIRROR2: 200, MIRROR3: 200},
+            clock=lambda: 0.0
+        )
+
+        self.assertEqual([MIRROR2, MIRROR3, MIRROR1], mirrors.ranked())
+        self.assertEqual(
+            [MIRROR1, MIRROR2, MIRROR3], sorted(self.server.requests)
+        )
+
+    def test_alternatives(self):
+        mirrors = self.make_mirrors({})
+        mirrors.latencies = {MIRROR1: 0.5, MIRROR2: 0.1, MIRROR3: None}
+
+        self.assertEqual(
+            [MIRROR2 + 'a/', MIRROR1 + 'a/', MIRROR3 + 'a/'],
+            mirrors.alternatives(MIRROR3 + 'a/')
+        )
+        self.assertEqual(
+            ['http://files/a.tgz'], mirrors.alternatives('http://files/a.tgz')
+        )
+
+    def test_open_from_best_mirror(self):
+        mirrors = self.make_mirrors({MIRROR1: 200, MIRROR2: 200})
+        mirrors.latencies = {MIRROR1: 0.5, MIRROR2: 0.1, MIRROR3: 0.2}
+
+        response = mirrors.open(MIRROR1 + 'a/')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual([MIRROR2 + 'a/'], self.server.requests)
+
+    def test_open_fails_over_on_errors(self):
+        mirrors = self.make_mirrors({
+            MIRROR1: IOError('down'), MIRROR2: 502, MIRROR3: 404,
+        })
+        mirrors.latencies = {MIRROR1: 0.1, MIRROR2: 0.2, MIRROR3: 0.3}
+
+        response = mirrors.open(MIRROR1 + 'a/')
+
+        self.assertEqual(404, response.status)
+        self.assertEqual(
+            [MIRROR1 + 'a/', MIRROR2 + 'a/', MIRROR3 + 'a/'],
+            self.server.requests
+        )
+        self.assertEqual([MIRROR2 + 'a/'], self.server.closed)
+        # the failed ones are tried last next time
+        self.assertEqual(MIRROR3, mirrors.ranked()[0])
+
+    def test_open_fails_over_on_missing_page(self):
+        mirrors = self.make_mirrors(
+            {MIRROR1: 404, MIRROR2: 200}, clock=lambda: 0.0
+        )
+        mirrors.latencies = {MIRROR1: 0.1, MIRROR2: 0.2, MIRROR3: 0.3}
+
+        response = mirrors.open(MIRROR1 + 'foo/')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(MIRROR2 + 'foo/', response.read().decode())
+        self.assertEqual([MIRROR1 + 'foo/'], self.server.closed)
+        # a lagging mirror is still reachable
+        self.assertEqual(MIRROR1, mirrors.ranked()[0])
+
+    def test_open_missing_page_on_every_mirror(self):
+        mirrors = self.make_mirrors({MIRROR1: 404, MIRROR2: 404, MIRROR3: 404})
+        mirrors.latencies = {MIRROR1: 0.1, MIRROR2: 0.2, MIRROR3: 0.3}
+
+        response = mirrors.open(MIRROR1 + 'foo/')
+
+        self.assertEqual(404, response.status)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_open_raises_when_all_fail(self):
+        mirrors = self.make_mirrors({
+            MIRROR1: IOError('down'),
+            MIRROR2: IOError('down'),
+            MIRROR3: IOError('gone'),
+        })
+        mirrors.latencies = {MIRROR1: 0.1, MIRROR2: 0.2, MIRROR3: 0.3}
+
+        with self.assertRaises(IOError) as context:
+            mirrors.open(MIRROR1 + 'a/')
+        self.assertEqual('gone', str(context.exception))
+
+    def test_open_races_slow_mirror(self):
+        slow = threading.Event()
+        mirrors = self.make_mirrors(
+            {MIRROR1: slow, MIRROR2: 200, MIRROR3: 200}, hedge_delay=0.01
+        )
+        mirrors.latencies = {MIRROR1: 0.1, MIRROR2: 0.2, MIRROR3: 0.3}
+
+        response = mirrors.open(MIRROR1 + 'a/')
+
+        self.assertEqual(MIRROR2 + 'a/', response.read().decode())
+        slow.set()
+        for _ in range(100):
+            if self.server.closed:
+                break
+            time.sleep(0.01)
+        # the late response is not leaked
+        self.assertEqual([MIRROR1 + 'a/'], self.server.closed)
+
+    def test_open_url_not_on_a_mirror(self):
+        mirrors = self.make_mirrors({'http://files/': 200})
+
+        mirrors.open('http://files/a.tgz')
+
+        self.assertEqual(['http://files/a.tgz'], self.server.requests)
+
+    def test_open_stream_fails_over(self):
+        mirrors = self.make_mirrors({MIRROR1: IOError('down'), MIRROR2: 200})
+        mirrors.latencies = {MIRROR1: 0.1, MIRROR2: 0.2, MIRROR3: 0.3}
+
+        stream = mirrors.open_stream(MIRROR1 + '../packages/a.tgz')
+
+        self.assertEqual(
+            MIRROR2 + '../packages/a.tgz', stream.read().decode()
+        )
@@ -0,0 +1,102 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import io
+
+import pyrene.multipart as m
+
+
+CONTENT_TYPE = 'multipart/form-data; boundary="xXxXx"'
+
+
+def make_body(parts, preamble=b'', epilogue=b''):
+    '''parts: (headers, content) pairs'''
+    body = preamble
+    for headers, content in parts:
+        body += b'--xXxXx\r\n' + headers + b'\r\n\r\n' + content + b'\r\n'
+    return body + b'--xXxXx--' + epilogue
+
+
+FIELD = b'Content-Disposition: form-data; name=":action"', b'file_upload'
+FILE = (
+    b'Content-Disposition: form-data; name="content"; filename="a-1.zip"\r\n'
+    b'Content-Type: application/octet-stream',
+    b'--xXxX\r\n--xXx' * 1000
+)
+
+
+class Test_parse_form(unittest.TestCase):
+
+    def parse(self, body, chunk_size=m.CHUNK_SIZE):
+        files = {}
+
+        def open_file(name, filename):
+            files[name] = filename, io.BytesIO()
+            return files[name][1]
+
+        fp = io.BytesIO(body)
+        fields = m.parse_form(
+            fp, CONTENT_TYPE, len(body), open_file, chunk_size
+        )
+        self.rest = fp.read()
+        return fields, {
+            name: (filename, f.getvalue())
+            for name, (filename, f) in files.items()
+        }
+
+    def test_fields_and_files(self):
+        fields, files = self.parse(make_body([FIELD, FILE]))
+
+        self.assertEqual({':action': ['file_upload']}, fields)
+        self.assertEqual({'content': ('a-1.zip', FILE[1])}, files)
+
+    def test_delimiters_split_between_chunks(self):
+        for chunk_size in (1, 3, 7, 100):
+            _, files = self.parse(make_body([FIELD, FILE]), chunk_size)
+
+            self.assertEqual(FILE[1], files['content'][1])
+
+    def test_preamble_and_epilogue_are_skipped(self):
+        fields, _ = self.parse(
+            make_body([FIELD], preamble=b'ignored\r\n', epilogue=b'\r\nxx')
+        )
+
+        self.assertEqual({':action': ['file_upload']}, fields)
+        self.assertEqual(b'', self.rest)
+
+    def test_skipped_file(self):
+        body = make_body([FILE, FIELD])
+        fields = m.parse_form(
+            io.BytesIO(body), CONTENT_TYPE, len(body), lambda *args: None
+        )
+
+        self.assertEqual({':action': ['file_upload']}, fields)
+
+    def test_truncated(self):
+        body = make_body([FIELD, FILE])[:-20]
+
+        with self.assertRaises(m.MultipartError):
+            self.parse(body)
+
+    def test_field_too_large(self):
+        field = FIELD[0], b'x' * (m.MAX_FIELD_SIZE + 1)
+
+        with self.assertRaises(m.MultipartError):
+            self.parse(make_body([field]))
+
+    def test_not_multipart(self):
+        with self.assertRaises(m.MultipartError):
+            m.parse_form(io.BytesIO(b''), 'text/plain', 0, None)
+
+
+class Test_parse_header_params(unittest.TestCase):
+
+    def test(self):
+        self.assertEqual(
+            ('form-data', {'name': 'content', 'filename': 'a "b".zip'}),
+            m.parse_header_params(
+                'form-data; name="content"; filename="a \\"b\\".zip"'
+            )
+        )
@@ -61,6 +61,11 @@ class Test_Network(unittest.TestCase):
         repo = self.network.get_repo('r!')
         self.assertEqual('r!', repo.name)
 
+    def test_get_repo_sets_network(self):
+        self.network.define('repo')
+        repo = self.network.get_repo('repo')
+        self.assertIs(self.network, repo.network)
+
     def test_get_repo_with_empty_repo_name_returns_active_repo(self):
         self.network.define('activerepo')
         self.network.set('activerepo', 'type', 'http')
@@ -0,0 +1,503 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import hashlib
+import os
+import sys
+from temp_dir import within_temp_dir
+
+import pyrene.packages as m
+from pyrene.util import write_file
+from .util import make_wheel, make_sdist
+
+
+class Test_normalize_name(unittest.TestCase):
+
+    def test(self):
+        self.assertEqual('foo-bar-baz', m.normalize_name('Foo.Bar__baz'))
+
+
+class Test_parse_filename(unittest.TestCase):
+
+    def test_sdist(self):
+        self.assertEqual(
+            ('python-dateutil', '2.2'),
+            m.parse_filename('python-dateutil-2.2.tar.gz')
+        )
+
+    def test_zip_sdist(self):
+        self.assertEqual(
+            ('roman', '2.0.0'), m.parse_filename('roman-2.0.0.zip')
+        )
+
+    def test_wheel(self):
+        self.assertEqual(
+            ('temp_dir', '0.1.1'),
+            m.parse_filename('temp_dir-0.1.1-py2.py3-none-any.whl')
+        )
+
+    def test_not_a_package(self):
+        self.assertIsNone(m.parse_filename('README.txt'))
+        self.assertIsNone(m.parse_filename('noversion.tar.gz'))
+
+
+class Test_DirectoryIndex(unittest.TestCase):
+
+    @within_temp_dir
+    def test_groups_files_by_normalized_project(self):
+        write_file('repo/Foo_Bar-1.0.tar.gz', b'')
+        write_file('repo/foo.bar-1.1-py2.py3-none-any.whl', b'')
+        write_file('repo/baz-0.1.zip', b'')
+        write_file('repo/README', b'')
+
+        index = m.DirectoryIndex('repo')
+        index.refresh()
+
+        self.assertEqual(['baz', 'foo-bar'], index.project_names)
+        self.assertEqual(
+            ['Foo_Bar-1.0.tar.gz', 'foo.bar-1.1-py2.py3-none-any.whl'],
+            index.get_filenames('FOO-bar')
+        )
+
+    @within_temp_dir
+    def test_get_path_only_for_known_package_files(self):
+        write_file('repo/baz-0.1.zip', b'')
+        write_file('repo/README', b'')
+        index = m.DirectoryIndex('repo')
+        index.refresh()
+
+        self.assertEqual(
+            os.path.join('repo', 'baz-0.1.zip'),
+            index.get_path('baz-0.1.zip')
+        )
+        self.assertIsNone(index.get_path('README'))
+        self.assertIsNone(index.get_path('../repo/baz-0.1.zip'))
+
+    @within_temp_dir
+    def test_missing_directory_is_empty(self):
+        index = m.DirectoryIndex('missing')
+        index.refresh()
+
+        self.assertEqual([], index.project_names)
+
+    @within_temp_dir
+    def test_own_changes_do_not_trigger_rescan(self):
+        write_file('repo/a-1.0.zip', b'')
+        index = m.DirectoryIndex('repo')
+        index.refresh()
+
+        with index.changing():
+            write_file('repo/b-1.0.zip', b'')
+            os.utime('repo', (0, 12345))
+        index.add('b-1.0.zip')
+        generation = index.generation
+        index.refresh()
+
+        self.assertEqual(generation, index.generation)
+        self.assertEqual(['a', 'b'], index.project_names)
+
+    @within_temp_dir
+    def test_changes_of_stale_index_trigger_rescan(self):
+        write_file('repo/a-1.0.zip', b'')
+        index = m.DirectoryIndex('repo')
+        index.refresh()
+        write_file('repo/c-1.0.zip', b'')
+        os.utime('repo', (0, 1))
+
+        with index.changing():
+            write_file('repo/b-1.0.zip', b'')
+            os.utime('repo', (0, 2))
+        index.add('b-1.0.zip')
+        index.refresh()
+
+        self.assertEqual(['a', 'b', 'c'], index.project_names)
+
+
+class Test_MergedIndex(unittest.TestCase):
+
+    def make_index(self, directory, *filenames):
+        for filename in filenames:
+            write_file(os.path.join(directory, filename), b'')
+        return m.DirectoryIndex(directory)
+
+    @within_temp_dir
+    def test_first_index_having_the_project_wins(self):
+        first = self.make_index('first', 'a-1.0.zip')
+        second = self.make_index('second', 'a-2.0.zip', 'b-1.0.zip')
+        merged = m.MergedIndex([first, second])
+
+        merged.refresh()
+
+        self.assertEqual(['a', 'b'], merged.project_names)
+        self.assertEqual(['a-1.0.zip'], merged.get_filenames('a'))
+        self.assertEqual(['b-1.0.zip'], merged.get_filenames('b'))
+
+    @within_temp_dir
+    def test_get_path_of_shadowed_file(self):
+        first = self.make_index('first', 'a-1.0.zip')
+        second = self.make_index('second', 'a-2.0.zip', 'b-1.0.zip')
+        merged = m.MergedIndex([first, second])
+        merged.refresh()
+
+        self.assertIsNone(merged.get_path('a-2.0.zip'))
+        self.assertEqual(
+            os.path.join('second', 'b-1.0.zip'), merged.get_path('b-1.0.zip')
+        )
+
+    @within_temp_dir
+    def test_changes_are_merged(self):
+        first = self.make_index('first', 'a-1.0.zip')
+        merged = m.MergedIndex([first])
+        merged.refresh()
+        generation = merged.generation
+
+        write_file('first/c-1.0.zip', b'')
+        first.add('c-1.0.zip')
+        merged.refresh()
+
+        self.assertEqual(['a', 'c'], merged.project_names)
+        self.assertNotEqual(generation, merged.generation)
+
+
+METADATA = b'Metadata-Version: 2.1\nName: a\nVersion: 1.0\n'
+WHEEL = 'a-1.0-py3-none-any.whl'
+
+
+class Test_read_wheel_metadata(unittest.TestCase):
+
+    @within_temp_dir
+    def test_wheel(self):
+        make_wheel(WHEEL, METADATA)
+
+        self.assertEqual(METADATA, m.read_wheel_metadata(WHEEL))
+
+    @within_temp_dir
+    def test_not_a_zip(self):
+        write_file(WHEEL, b'not a zip')
+
+        self.assertIsNone(m.read_wheel_metadata(WHEEL))
+
+
+class Test_MetadataStore(unittest.TestCase):
+
+    def metadata_path(self):
+        return os.path.join('.pyrene-metadata', WHEEL + '.metadata')
+
+    @within_temp_dir
+    def test_metadata_file_is_made(self):
+        make_wheel(WHEEL, METADATA)
+        store = m.MetadataStore('.')
+
+        self.assertEqual(
+            hashlib.sha256(METADATA).hexdigest(), store.get_hash(WHEEL)
+        )
+        with open(self.metadata_path(), 'rb') as f:
+            self.assertEqual(METADATA, f.read())
+
+    @within_temp_dir
+    def test_existing_metadata_file_is_reused(self):
+        make_wheel(WHEEL, METADATA)
+        m.MetadataStore('.').get_hash(WHEEL)
+        write_file(self.metadata_path(), b'reused')
+
+        self.assertEqual(
+            hashlib.sha256(b'reused').hexdigest(),
+            m.MetadataStore('.').get_hash(WHEEL)
+        )
+
+    @within_temp_dir
+    def test_outdated_metadata_file_is_remade(self):
+        make_wheel(WHEEL, METADATA)
+        store = m.MetadataStore('.')
+        store.get_hash(WHEEL)
+        os.utime(self.metadata_path(), (0, 0))
+
+        make_wheel(WHEEL, b'Name: a\nVersion: 1.0\n')
+        digest = store.get_hash(WHEEL)
+
+        self.assertEqual(
+            hashlib.sha256(b'Name: a\nVersion: 1.0\n').hexdigest(), digest
+        )
+
+    @within_temp_dir
+    def test_no_metadata_for_sdist(self):
+        write_file('a-1.0.tar.gz', b'')
+
+        self.assertIsNone(m.MetadataStore('.').get_hash('a-1.0.tar.gz'))
+
+    @within_temp_dir
+    def test_update_and_remove(self):
+        make_wheel(WHEEL, METADATA)
+        write_file('a-1.0.tar.gz', b'')
+        store = m.MetadataStore('.')
+
+        store.update([WHEEL, 'a-1.0.tar.gz'])
+        self.assertTrue(os.path.exists(self.metadata_path()))
+
+        store.remove(WHEEL)
+        self.assertFalse(os.path.exists(self.metadata_path()))
+
+
+class Test_parse_pinned_requirement(unittest.TestCase):
+
+    def test_pinned(self):
+        self.assertEqual(
+            ('Foo.Bar', '1.0'), m.parse_pinned_requirement('Foo.Bar==1.0')
+        )
+        self.assertEqual(('a', '2.0'), m.parse_pinned_requirement('a === 2.0'))
+
+    def test_not_pinned(self):
+        for requirement in (
+                'a', 'a>=1.0', 'a==1.*', 'a[x]==1.0', 'a==1.0; os_name=="nt"'):
+            self.assertIsNone(m.parse_pinned_requirement(requirement))
+
+
+class Test_select_file(unittest.TestCase):
+
+    def test_sdist_of_version(self):
+        self.assertEqual(
+            'a-1.0.tar.gz',
+            m.select_file(
+                ['a-1.0.zip', 'a-1.0-py3-none-any.whl', 'a-1.0.tar.gz',
+                 'a-1.1.tar.gz'],
+                'A', '1.0.0'
+            )
+        )
+
+    def test_missing(self):
+        self.assertIsNone(
+            m.select_file(['a-1.0-py3-none-any.whl'], 'a', '1.0')
+        )
+
+    def test_wheel_with_most_preferred_tag(self):
+        tags = [('cp39', 'cp39', 'linux_x86_64'), ('py3', 'none', 'any')]
+        self.assertEqual(
+            'a-1.0-cp39-cp39-linux_x86_64.whl',
+            m.select_file(
+                ['a-1.0.tar.gz', 'a-1.0-py2.py3-none-any.whl',
+                 'a-1.0-cp39-cp39-linux_x86_64.whl'],
+                'a', '1.0', tags
+            )
+        )
+
+    def test_sdist_if_no_wheel_matches_tags(self):
+        self.assertEqual(
+            'a-1.0.tar.gz',
+            m.select_file(
+                ['a-1.0.tar.gz', 'a-1.0-cp27-cp27mu-linux_x86_64.whl'],
+                'a', '1.0', [('py3', 'none', 'any')]
+            )
+        )
+
+
+class Test_parse_wheel_tags(unittest.TestCase):
+
+    def test_compressed_tag_sets(self):
+        self.assertEqual(
+            {('py2', 'none', 'any'), ('py3', 'none', 'any')},
+            m.parse_wheel_tags('a-1.0-py2.py3-none-any.whl')
+        )
+
+    def test_build_tag(self):
+        self.assertEqual(
+            {('cp39', 'cp39', 'win_amd64')},
+            m.parse_wheel_tags('a-1.0-1-cp39-cp39-win_amd64.whl')
+        )
+
+    def test_not_a_wheel(self):
+        self.assertIsNone(m.parse_wheel_tags('a-1.0.tar.gz'))
+
+
+class Test_Target(unittest.TestCase):
+
+    FILENAMES = [
+        'a-1.0.tar.gz',
+        'a-1.0-cp39-cp39-manylinux1_x86_64.whl',
+        'a-1.0-cp39-cp39-win_amd64.whl',
+        'a-1.0-cp38-cp38-manylinux1_x86_64.whl',
+    ]
+
+    def select(self, target):
+        return m.select_file(self.FILENAMES, 'a', '1.0', target.tags)
+
+    def test_compatible_wheel(self):
+        target = m.Target('3.9', ['manylinux2014_x86_64'])
+        self.assertEqual(
+            'a-1.0-cp39-cp39-manylinux1_x86_64.whl', self.select(target)
+        )
+
+    def test_sdist_if_there_is_no_compatible_wheel(self):
+        target = m.Target('3.10', ['manylinux2014_x86_64'])
+        self.assertEqual('a-1.0.tar.gz', self.select(target))
+
+    def test_abi(self):
+        target = m.Target('3.9', ['win_amd64'], ['cp39'])
+        self.assertEqual('a-1.0-cp39-cp39-win_amd64.whl', self.select(target))
+        target = m.Target('3.9', ['win_amd64'], ['cp39d'])
+        self.assertEqual('a-1.0.tar.gz', self.select(target))
+
+    def test_pure_python_wheels_are_compatible(self):
+        target = m.Target('3.9', ['win_amd64'])
+        self.assertIn(('py3', 'none', 'any'), target.tags)
+
+    def test_python_version_without_dot(self):
+        target = m.Target('310')
+        self.assertEqual((3, 10), (target.major, target.minor))
+
+    def test_invalid_python_version(self):
+        with self.assertRaises(ValueError):
+            m.Target('three')
+
+    def test_environment(self):
+        self.assertEqual(
+            {
+                'python_version': '3.9',
+                'python_full_version': '3.9.0',
+                'sys_platform': 'win32',
+                'platform_system': 'Windows',
+                'platform_machine': 'AMD64',
+            },
+            m.Target('3.9', ['win_amd64']).environment
+        )
+
+    def test_allows_python(self):
+        target = m.Target('3.9')
+        self.assertTrue(target.allows_python(None))
+        self.assertTrue(target.allows_python('>=3.6, <4'))
+        self.assertFalse(target.allows_python('>=3.10'))
+
+    def test_pip_options(self):
+        self.assertEqual(
+            [
+                '--platform', 'win_amd64', '--python-version', '3.9',
+                '--only-binary=:all:',
+            ],
+            m.Target('3.9', ['win_amd64']).get_pip_options()
+        )
+        self.assertEqual([], m.Target().get_pip_options())
+
+
+class Test_expand_platform(unittest.TestCase):
+
+    def test_manylinux_includes_older_glibc_versions(self):
+        platforms = m.expand_platform('manylinux2014_x86_64')
+        self.assertEqual('manylinux2014_x86_64', platforms[0])
+        self.assertIn('manylinux_2_17_x86_64', platforms)
+        self.assertIn('manylinux2010_x86_64', platforms)
+        self.assertIn('manylinux1_x86_64', platforms)
+        self.assertNotIn('manylinux_2_24_x86_64', platforms)
+
+    def test_other_platform(self):
+        self.assertEqual(['win_amd64'], m.expand_platform('win_amd64'))
+
+
+class Test_get_supported_tags(unittest.TestCase):
+
+    def test_pure_python_wheels_are_supported(self):
+        self.assertIn(
+            ('py{}'.format(sys.version_info[0]), 'none', 'any'),
+            m.get_supported_tags()
+        )
+
+
+class Test_parse_requires_txt(unittest.TestCase):
+
+    def test(self):
+        text = '''\
+b>=1.0
+c
+
+[test]
+pytest
+
+[:python_version < "3"]
+futures
+'''
+        self.assertEqual(
+            ['b>=1.0', 'c', 'futures; python_version < "3"'],
+            m.parse_requires_txt(text)
+        )
+
+
+class Test_read_dependency_metadata(unittest.TestCase):
+
+    @within_temp_dir
+    def test_wheel(self):
+        make_wheel(
+            WHEEL, b'Name: a\nRequires-Python: >=3.6\nRequires-Dist: b\n'
+        )
+
+        self.assertEqual(
+            (['b'], '>=3.6'), m.read_dependency_metadata(WHEEL)
+        )
+
+    @within_temp_dir
+    def test_sdist(self):
+        make_sdist('a-1.0.tar.gz', {
+            'a-1.0/PKG-INFO': b'Name: a\nRequires-Python: >=3.6\n',
+            'a-1.0/a.egg-info/PKG-INFO': b'Name: a\n',
+            'a-1.0/a.egg-info/requires.txt': b'b\n',
+        })
+
+        self.assertEqual(
+            (['b'], '>=3.6'), m.read_dependency_metadata('a-1.0.tar.gz')
+        )
+
+    @within_temp_dir
+    def test_without_requires_python(self):
+        make_sdist('a-1.0.tar.gz', {'a-1.0/setup.py': b''})
+
+        self.assertEqual(
+            (None, None), m.read_dependency_metadata('a-1.0.tar.gz')
+        )
+
+
+class Test_read_requirements(unittest.TestCase):
+
+    @within_temp_dir
+    def test_wheel(self):
+        make_wheel(WHEEL, (
+            b'Name: a\nRequires-Dist: b==1.0\n'
+            b'Requires-Dist: pytest; extra == "test"\n'
+        ))
+
+        self.assertEqual(['b==1.0'], m.read_requirements(WHEEL))
+
+    @within_temp_dir
+    def test_sdist_with_requires_txt(self):
+        make_sdist('a-1.0.tar.gz', {
+            'PKG-INFO': b'Name: a\n',
+            'a.egg-info/PKG-INFO': b'Name: a\n',
+            'a.egg-info/requires.txt': b'b==1.0\n',
+        })
+
+        self.assertEqual(['b==1.0'], m.read_requirements('a-1.0.tar.gz'))
+
+    @within_temp_dir
+    def test_setuptools_sdist_without_requirements(self):
+        make_sdist('a-1.0.tar.gz', {
+            'PKG-INFO': b'Name: a\n',
+            'a.egg-info/PKG-INFO': b'Name: a\n',
+        })
+
+        self.assertEqual([], m.read_requirements('a-1.0.tar.gz'))
+
+    @within_temp_dir
+    def test_sdist_with_static_metadata(self):
+        make_sdist('a-1.0.tar.gz', {
+            'PKG-INFO': b'Metadata-Version: 2.2\nName: a\n',
+        })
+
+        self.assertEqual([], m.read_requirements('a-1.0.tar.gz'))
+
+    @within_temp_dir
+    def test_unknown(self):
+        make_sdist('a-1.0.tar.gz', {
+            'PKG-INFO': b'Metadata-Version: 1.0\nName: a\n',
+        })
+        write_file('b-1.0.tar.gz', b'not a tar')
+
+        self.assertIsNone(m.read_requirements('a-1.0.tar.gz'))
+        self.assertIsNone(m.read_requirements('b-1.0.tar.gz'))
@@ -8,8 +8,14 @@ import os
 from temp_dir import within_temp_dir
 
 import pyrene.repos as m
+from pyrene.util import write_file
 from pyrene.constants import REPO, REPOTYPE
-from .util import capture_stdout, Assertions
+from .util import capture_stdout, Assertions, make_wheel, make_sdist
+from pyrene.util import Directory
+from pyrene.simple import Link
+from pyrene.wheelhouse import WheelBuilder, build_wheel
+from pyrene.packages import Target
+from pyrene.eviction import Evictor
 
 
 class Test_BadRepo(unittest.TestCase):
@@ -23,6 +29,25 @@ class Test_BadRepo(unittest.TestCase):
     def test_upload_packages(self):
         self.repo.upload_packages(['a'])
 
+    def test_implements_abstract_methods(self):
+        # enforced by ABCMeta on python 2
+        abstract = [
+            name for name in dir(m.Repo)
+            if getattr(getattr(m.Repo, name), '__isabstractmethod__', False)
+        ]
+        self.assertIn('pip_download', abstract)
+        for name in abstract:
+            self.assertFalse(
+                getattr(getattr(m.BadRepo, name), '__isabstractmethod__', 0),
+                name
+            )
+
+    def test_pip_download(self):
+        with capture_stdout() as stdout:
+            self.repo.pip_download(['a'], '.')
+            output = stdout.content
+        self.assertIn('pretended', output)
+
 
 class Test_DirectoryRepo(Assertions, unittest.TestCase):
 
@@ -78,6 +103,417 @@ class Test_DirectoryRepo(Assertions, unittest.TestCase):
 
         self.assertTrue(os.path.isdir('missing'))
 
+    @within_temp_dir
+    def test_serve_with_cache_size(self):
+        repo = self.make_repo(
+            {
+                REPO.DIRECTORY: '.',
+                REPO.CACHE_SIZE: '1K',
+                REPO.CACHE_POLICY: 'LFU',
+            }
+        )
+        pypi = mock.Mock()
+
+        repo.serve(pypi)
+
+        self.assertEqual(1024, pypi.return_value.cache_size)
+        self.assertEqual('lfu', pypi.return_value.cache_policy)
+
+    def test_serve_persists_htpasswd_in_repo_directory(self):
+        repo = self.make_repo({REPO.DIRECTORY: '/path/to/repo'})
+        pypi = mock.Mock()
+
+        with mock.patch.object(m.DirectoryRepo, 'ensure_repo_directory'):
+            repo.serve(pypi)
+
+        self.assertEqual(
+            '/path/to/repo/.pyrene-htpasswd', pypi.return_value.htpasswd_path
+        )
+
+    @within_temp_dir
+    def test_serve_with_invalid_cache_size(self):
+        repo = self.make_repo(
+            {REPO.DIRECTORY: '.', REPO.CACHE_SIZE: 'unlimited'}
+        )
+        pypi = mock.Mock()
+
+        with capture_stdout() as stdout:
+            repo.serve(pypi)
+            output = stdout.content
+
+        self.assertIn('unlimited', output)
+        self.assertEqual(0, pypi.return_value.serve.call_count)
+
+    @within_temp_dir
+    def test_upload_packages_keeps_cache_size(self):
+        write_file('repo/old-1.0.zip', b'x' * 100)
+        write_file('new-1.0.zip', b'x' * 100)
+        repo = self.make_repo(
+            {REPO.DIRECTORY: 'repo', REPO.CACHE_SIZE: '100'}
+        )
+
+        with capture_stdout():
+            repo.upload_packages(['new-1.0.zip'])
+
+        self.assertTrue(os.path.exists('repo/new-1.0.zip'))
+        self.assertFalse(os.path.exists('repo/old-1.0.zip'))
+
+    @within_temp_dir
+    def test_upload_packages_keeps_uploaded_files_under_lfu(self):
+        write_file('repo/old-1.0.zip', b'x' * 100)
+        write_file('new-1.0.zip', b'x' * 100)
+        popular = Evictor('repo', 100)
+        for _ in range(5):
+            popular.touch('old-1.0.zip')
+        popular.save()
+        repo = self.make_repo({
+            REPO.DIRECTORY: 'repo',
+            REPO.CACHE_SIZE: '100',
+            REPO.CACHE_POLICY: 'lfu',
+        })
+
+        with capture_stdout():
+            repo.upload_packages(['new-1.0.zip'])
+
+        self.assertTrue(os.path.exists('repo/new-1.0.zip'))
+        self.assertFalse(os.path.exists('repo/old-1.0.zip'))
+
+    @within_temp_dir
+    def test_pinned_package_is_copied_without_pip(self):
+        os.mkdir('repo')
+        os.mkdir('tmp')
+        make_sdist('repo/a-1.0.tar.gz', {
+            'a.egg-info/PKG-INFO': b'Name: a\n',
+        })
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_packages('a==1.0', Directory('tmp'))
+
+        self.assertEqual(0, pip_install.call_count)
+        self.assertEqual(['a-1.0.tar.gz'], os.listdir('tmp'))
+
+    @within_temp_dir
+    def test_unpinned_package_is_downloaded_with_pip(self):
+        os.mkdir('tmp')
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_packages('a>=1.0', Directory('tmp'))
+
+        pip_install.assert_called_once_with(
+            '--no-use-wheel', '--find-links', 'repo', '--no-index',
+            '--download', 'tmp', 'a>=1.0'
+        )
+
+    @within_temp_dir
+    def test_dependency_closure_is_copied_without_pip(self):
+        os.mkdir('repo')
+        os.mkdir('tmp')
+        make_sdist('repo/a-1.0.tar.gz', {
+            'a.egg-info/PKG-INFO': b'Name: a\n',
+            'a.egg-info/requires.txt': b'b>=1\n',
+        })
+        make_sdist('repo/b-1.0.tar.gz', {
+            'b.egg-info/PKG-INFO': b'Name: b\n',
+        })
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_packages('a>=1.0', Directory('tmp'))
+
+        self.assertEqual(0, pip_install.call_count)
+        self.assertEqual(
+            ['a-1.0.tar.gz', 'b-1.0.tar.gz'], sorted(os.listdir('tmp'))
+        )
+
+    @within_temp_dir
+    def test_requirements_are_resolved_together(self):
+        os.mkdir('repo')
+        os.mkdir('tmp')
+        for name, requires in (('a', b'c\n'), ('b', b'c\nd>=1\n')):
+            make_sdist('repo/{}-1.0.tar.gz'.format(name), {
+                '{}.egg-info/PKG-INFO'.format(name): b'Name: x\n',
+                '{}.egg-info/requires.txt'.format(name): requires,
+            })
+        make_sdist('repo/c-1.0.tar.gz', {'c.egg-info/PKG-INFO': b'Name: c\n'})
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_requirements(
+                    ['a', 'b', 'a', 'e'], Directory('tmp')
+                )
+
+        self.assertEqual(
+            ['a-1.0.tar.gz', 'b-1.0.tar.gz', 'c-1.0.tar.gz'],
+            sorted(os.listdir('tmp'))
+        )
+        # a single pip run for the rest
+        pip_install.assert_called_once_with(
+            '--no-use-wheel', '--find-links', 'repo', '--no-index',
+            '--download', 'tmp', 'e', 'd>=1'
+        )
+
+    @within_temp_dir
+    def test_download_requirements_for_target_python(self):
+        os.mkdir('repo')
+        os.mkdir('tmp')
+        for version, requires_python in (('1.0', '>=2.7'), ('2.0', '>=3')):
+            make_sdist('repo/a-{}.tar.gz'.format(version), {
+                'a.egg-info/PKG-INFO': 'Name: a\nRequires-Python: {}\n'
+                .format(requires_python).encode('utf8'),
+            })
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_requirements(
+                    ['a'], Directory('tmp'), target=Target('2.7')
+                )
+
+        self.assertEqual(['a-1.0.tar.gz'], os.listdir('tmp'))
+        self.assertEqual(0, pip_install.call_count)
+
+    @within_temp_dir
+    def test_upload_packages_updates_dependency_graph(self):
+        make_sdist('a-1.0.tar.gz', {
+            'a.egg-info/PKG-INFO': b'Name: a\n',
+            'a.egg-info/requires.txt': b'b\n',
+        })
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with capture_stdout():
+            repo.upload_packages(['a-1.0.tar.gz'])
+
+        graph = m.DependencyGraph('repo')
+        self.assertEqual(['b'], graph.get_requirements('a-1.0.tar.gz'))
+
+    @within_temp_dir
+    def test_copy_prefers_wheels_if_repo_does(self):
+        os.mkdir('repo')
+        os.mkdir('tmp')
+        make_sdist('repo/a-1.0.tar.gz', {
+            'a.egg-info/PKG-INFO': b'Name: a\n',
+        })
+        make_wheel('repo/a-1.0-py2.py3-none-any.whl', b'Requires-Dist: b\n')
+        make_wheel('repo/b-1.0-py2.py3-none-any.whl', b'Name: b\n')
+        repo = self.make_repo(
+            {REPO.DIRECTORY: 'repo', REPO.PREFER_WHEELS: 'yes'}
+        )
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_packages('a', Directory('tmp'))
+
+        self.assertEqual(0, pip_install.call_count)
+        self.assertEqual(
+            ['a-1.0-py2.py3-none-any.whl', 'b-1.0-py2.py3-none-any.whl'],
+            sorted(os.listdir('tmp'))
+        )
+
+    @within_temp_dir
+    def test_copy_of_sdists_can_be_forced(self):
+        os.mkdir('repo')
+        os.mkdir('tmp')
+        make_sdist('repo/a-1.0.tar.gz', {
+            'a.egg-info/PKG-INFO': b'Name: a\n',
+        })
+        make_wheel('repo/a-1.0-py2.py3-none-any.whl', b'Name: a\n')
+        repo = self.make_repo(
+            {REPO.DIRECTORY: 'repo', REPO.PREFER_WHEELS: 'yes'}
+        )
+
+        with capture_stdout():
+            repo.download_packages('a==1.0', Directory('tmp'), wheels=False)
+
+        self.assertEqual(['a-1.0.tar.gz'], os.listdir('tmp'))
+
+    @within_temp_dir
+    def test_pip_is_allowed_wheels_if_preferred(self):
+        os.mkdir('tmp')
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_packages('a>=1.0', Directory('tmp'), wheels=True)
+
+        pip_install.assert_called_once_with(
+            '--find-links', 'repo', '--no-index',
+            '--download', 'tmp', 'a>=1.0'
+        )
+
+    @within_temp_dir
+    def test_upload_packages_builds_wheels_of_sdists(self):
+        make_sdist('a-1.0.tar.gz', {'a.egg-info/PKG-INFO': b'Name: a\n'})
+        repo = self.make_repo(
+            {REPO.DIRECTORY: 'repo', REPO.BUILD_WHEELS: 'yes'}
+        )
+
+        def build(sdist_path, directory):
+            make_wheel(
+                os.path.join(directory, 'a-1.0-py3-none-any.whl'),
+                b'Name: a\nRequires-Dist: b\n'
+            )
+            return 'a-1.0-py3-none-any.whl'
+
+        with mock.patch.object(
+                m, 'WheelBuilder',
+                lambda directory: WheelBuilder(directory, build=build)):
+            with capture_stdout():
+                repo.upload_packages(['a-1.0.tar.gz'])
+
+        self.assertEqual(
+            ['.pyrene-metadata', 'a-1.0-py3-none-any.whl', 'a-1.0.tar.gz'],
+            sorted(os.listdir('repo'))
+        )
+        # registered like uploaded files
+        graph = m.DependencyGraph('repo')
+        self.assertEqual(
+            ['b'], graph.get_requirements('a-1.0-py3-none-any.whl')
+        )
+
+    @within_temp_dir
+    def test_upload_packages_keeps_uploaded_wheel_of_sdist(self):
+        make_sdist('a-1.0.tar.gz', {'a.egg-info/PKG-INFO': b'Name: a\n'})
+        make_wheel('a-1.0-py3-none-any.whl', b'Name: a\n')
+        repo = self.make_repo(
+            {REPO.DIRECTORY: 'repo', REPO.BUILD_WHEELS: 'yes'}
+        )
+
+        def pip_wheel(*args):
+            make_wheel(
+                os.path.join(
+                    args[args.index('--wheel-dir') + 1],
+                    'a-1.0-py3-none-any.whl'
+                ),
+                b'Name: a\nRequires-Dist: built\n'
+            )
+            return 0, ''
+
+        def build(sdist_path, directory):
+            return build_wheel(sdist_path, directory, pip_wheel=pip_wheel)
+
+        with mock.patch.object(
+                m, 'WheelBuilder',
+                lambda directory: WheelBuilder(directory, build=build)):
+            with capture_stdout() as stdout:
+                repo.upload_packages(
+                    ['a-1.0.tar.gz', 'a-1.0-py3-none-any.whl']
+                )
+                output = stdout.content
+
+        self.assertNotIn('Built', output)
+        self.assertEqual(
+            open('a-1.0-py3-none-any.whl', 'rb').read(),
+            open('repo/a-1.0-py3-none-any.whl', 'rb').read()
+        )
+
+    @within_temp_dir
+    def test_copy_for_target(self):
+        os.mkdir('repo')
+        os.mkdir('tmp')
+        make_sdist('repo/a-1.0.tar.gz', {
+            'a.egg-info/PKG-INFO': b'Name: a\n',
+        })
+        for tags in ('cp39-cp39-manylinux1_x86_64', 'cp39-cp39-win_amd64'):
+            make_wheel(
+                'repo/a-1.0-{}.whl'.format(tags),
+                b'Requires-Dist: b; sys_platform == "win32"\n'
+            )
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+        target = Target('3.9', ['manylinux2014_x86_64'])
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_packages('a', Directory('tmp'), target=target)
+
+        self.assertEqual(0, pip_install.call_count)
+        self.assertEqual(
+            ['a-1.0-cp39-cp39-manylinux1_x86_64.whl'], os.listdir('tmp')
+        )
+
+    @within_temp_dir
+    def test_pip_downloads_for_target(self):
+        os.mkdir('tmp')
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            with capture_stdout():
+                repo.download_packages(
+                    'a>=1.0', Directory('tmp'), target=Target('3.9')
+                )
+
+        pip_install.assert_called_once_with(
+            '--python-version', '3.9', '--only-binary=:all:',
+            '--find-links', 'repo', '--no-index',
+            '--download', 'tmp', 'a>=1.0'
+        )
+
+    def test_copy_target_defaults_to_attributes(self):
+        repo = self.make_repo({
+            REPO.DIRECTORY: 'repo',
+            REPO.TARGET_PYTHON_VERSION: '3.8',
+            REPO.TARGET_PLATFORM: 'win_amd64, win32',
+        })
+
+        self.assertEqual(
+            Target('3.8', ['win_amd64', 'win32']), repo.get_copy_target()
+        )
+        self.assertEqual(
+            Target('3.9', ['win_amd64', 'win32'], ['cp39']),
+            repo.get_copy_target(python_version='3.9', abis=['cp39'])
+        )
+        self.assertFalse(
+            self.make_repo({REPO.DIRECTORY: 'repo'})
+            .get_copy_target().is_specific
+        )
+
+    @within_temp_dir
+    def test_get_dependents(self):
+        os.mkdir('repo')
+        make_wheel('repo/a-1.0-py3-none-any.whl', b'Requires-Dist: b\n')
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        self.assertEqual(
+            [('a-1.0-py3-none-any.whl', 'b')], repo.get_dependents('b')
+        )
+
+    @within_temp_dir
+    def test_get_manifest(self):
+        os.mkdir('repo')
+        write_file('repo/a-1.0.tar.gz', b'')
+        write_file('repo/b-2.0-py3-none-any.whl', b'')
+        write_file('repo/README', b'')
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        manifest = repo.get_manifest()
+
+        self.assertEqual(
+            ['a-1.0.tar.gz', 'b-2.0-py3-none-any.whl'], sorted(manifest)
+        )
+        self.assertEqual(
+            os.path.join('repo', 'a-1.0.tar.gz'),
+            manifest['a-1.0.tar.gz'].path
+        )
+
+    @within_temp_dir
+    def test_upload_packages_makes_wheel_metadata(self):
+        make_wheel('a-1.0-py3-none-any.whl', b'Name: a\n')
+        repo = self.make_repo({REPO.DIRECTORY: 'repo'})
+
+        with capture_stdout():
+            repo.upload_packages(['a-1.0-py3-none-any.whl'])
+
+        self.assertEqual(
+            b'Name: a\n',
+            open('repo/.pyrene-metadata/a-1.0-py3-none-any.whl.metadata',
+                 'rb').read()
+        )
+
     def test_print_attributes(self):
         with capture_stdout() as stdout:
             self.make_repo({}).print_attributes()
@@ -101,6 +537,34 @@ class Test_HttpRepo(Assertions, unittest.TestCase):
         self.assertEqual('http', repo.type)
         self.assertEqual('https://priv.repos.org/simple', repo.download_url)
 
+    def test_get_package_files(self):
+        repo = self.make_repo({REPO.DOWNLOAD_URL: 'https://priv/simple/'})
+        reader = mock.Mock()
+        reader.get_links.return_value = [
+            Link('https://priv/packages/a-1.0.tar.gz')
+        ]
+        repo.get_index_reader = lambda: reader
+
+        files = repo.get_package_files('a')
+
+        self.assertEqual(['a-1.0.tar.gz'], list(files))
+        self.assertEqual(
+            'https://priv/packages/a-1.0.tar.gz',
+            files['a-1.0.tar.gz'].link.url
+        )
+
+    def test_get_index_reader(self):
+        repo = self.make_repo({
+            REPO.DOWNLOAD_URL: 'https://priv.repos.org/simple/',
+            REPO.CACHE_TTL: '60',
+        })
+        page_cache = mock.Mock()
+
+        reader = repo.get_index_reader(page_cache)
+
+        page_cache.assert_called_once_with(ttl=60)
+        self.assertEqual('https://priv.repos.org/simple/', reader.index_url)
+
     def test_serve(self):
         repo = self.make_repo(
             {REPO.DOWNLOAD_URL: 'https://priv.repos.org/simple'}
@@ -130,6 +594,88 @@ class Test_HttpRepo(Assertions, unittest.TestCase):
         self.assertContainsInOrder(output, m.HttpRepo.ATTRIBUTES)
         self.assertNotIn(REPO.DIRECTORY, output)
 
+    def make_mirrored_repo(self):
+        repo = self.make_repo({
+            REPO.DOWNLOAD_URL: 'https://a/simple/, https://b/simple/',
+            REPO.CACHE_TTL: '60',
+        })
+        mirrors = repo.get_mirrors(mock.Mock(m.MirrorSet))
+        mirrors.url = 'https://a/simple/'
+        mirrors.ranked.return_value = [
+            'https://b/simple/', 'https://a/simple/'
+        ]
+        return repo, mirrors
+
+    def test_get_manifest(self):
+        repo = self.make_repo({REPO.DOWNLOAD_URL: 'https://priv/simple/'})
+        reader = mock.Mock()
+        reader.get_project_names.return_value = ['a', 'b', 'c']
+        links = {
+            'a': [Link('https://priv/p/a-1.0.tar.gz')],
+            'b': None,
+            'c': IOError('timeout'),
+        }
+
+        def get_links(project):
+            if isinstance(links[project], Exception):
+                raise links[project]
+            return links[project]
+        reader.get_links.side_effect = get_links
+        repo.get_index_reader = lambda: reader
+
+        with capture_stdout() as stdout:
+            manifest = repo.get_manifest()
+            output = stdout.content
+
+        self.assertEqual(['a-1.0.tar.gz'], list(manifest))
+        self.assertIn('c: timeout', output)
+
+    def test_single_download_url_has_no_mirrors(self):
+        repo = self.make_repo({REPO.DOWNLOAD_URL: 'https://a/simple/'})
+        self.assertIsNone(repo.get_mirrors())
+
+    def test_mirrors_are_kept(self):
+        repo, mirrors = self.make_mirrored_repo()
+        self.assertIs(mirrors, repo.get_mirrors())
+
+    def test_mirrored_get_as_pip_conf(self):
+        repo, _ = self.make_mirrored_repo()
+        self.assertIn(
+            'index-url = https://a/simple/\n', repo.get_as_pip_conf()
+        )
+
+    def test_mirrored_get_index_reader(self):
+        repo, mirrors = self.make_mirrored_repo()
+        page_cache = mock.Mock()
+
+        reader = repo.get_index_reader(page_cache)
+
+        page_cache.assert_called_once_with(ttl=60, open_page=mirrors.open)
+        self.assertEqual('https://a/simple/', reader.index_url)
+
+    def test_mirrored_package_files_fail_over(self):
+        repo, mirrors = self.make_mirrored_repo()
+        reader = mock.Mock()
+        reader.get_links.return_value = [Link('https://a/p/a-1.0.tar.gz')]
+        repo.get_index_reader = lambda: reader
+
+        files = repo.get_package_files('a')
+
+        self.assertEqual(
+            mirrors.open_stream, files['a-1.0.tar.gz'].open_stream
+        )
+
+    def test_mirrored_pip_download_uses_fastest_mirror(self):
+        repo, _ = self.make_mirrored_repo()
+
+        with mock.patch.object(m, 'pip_install') as pip_install:
+            repo.pip_download(['a'], Directory('tmp'))
+
+        pip_install.assert_called_once_with(
+            '--no-use-wheel', '--index-url', 'https://b/simple/',
+            '--download', 'tmp', 'a'
+        )
+
     def test_upload_continues_after_UploadError(self):
         repo = self.make_repo(
             {
@@ -158,3 +704,256 @@ class Test_HttpRepo(Assertions, unittest.TestCase):
             output,
             ['There was an error', 'upload', 'file'] * 3
         )
+
+
+class Test_HttpRepo_serve_with_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.network = mock.Mock()
+        self.network.repo_names = ['cache']
+        self.cache_repo = m.DirectoryRepo(
+            'cache',
+            {
+                REPO.TYPE: REPOTYPE.DIRECTORY,
+                REPO.DIRECTORY: 'cache-dir',
+                REPO.SERVE_PORT: '8081',
+            }
+        )
+        self.network.get_repo.return_value = self.cache_repo
+
+    def make_repo(self, cache_repo):
+        repo = m.HttpRepo(
+            'repo',
+            {
+                REPO.TYPE: REPOTYPE.HTTP,
+                REPO.DOWNLOAD_URL: 'https://priv.repos.org/simple/',
+                REPO.CACHE_REPO: cache_repo,
+            }
+        )
+        repo.network = self.network
+        return repo
+
+    @within_temp_dir
+    def test_serve_proxies_through_cache_repo(self):
+        proxy_server = mock.Mock()
+
+        self.make_repo('cache').serve(proxy_server)
+
+        server = proxy_server.return_value
+        self.assertEqual('https://priv.repos.org/simple/', server.upstream_url)
+        self.assertEqual('cache-dir', server.directory)
+        self.assertEqual('8081', server.port)
+        self.assertEqual(600, server.ttl)
+        server.serve.assert_called_once_with()
+        self.assertTrue(os.path.isdir('cache-dir'))
+
+    def test_serve_with_unknown_cache_repo(self):
+        proxy_server = mock.Mock()
+
+        with capture_stdout() as stdout:
+            self.make_repo('unknown').serve(proxy_server)
+            output = stdout.content
+
+        self.assertIn('unknown', output)
+        self.assertEqual(0, proxy_server.call_count)
+
+    def test_serve_with_non_directory_cache_repo(self):
+        proxy_server = mock.Mock()
+        self.network.get_repo.return_value = self.make_repo('cache')
+
+        with capture_stdout() as stdout:
+            self.make_repo('cache').serve(proxy_server)
+            output = stdout.content
+
+        self.assertIn('not a directory repo', output)
+        self.assertEqual(0, proxy_server.call_count)
+
+
+class Test_serve_repos(unittest.TestCase):
+
+    def make_repo(self, name, server):
+        repo = mock.Mock(spec=m.Repo)
+        repo.name = name
+        repo.make_server.return_value = server
+        return repo
+
+    def make_server(self, interface, port, workers):
+        server = mock.Mock()
+        server.interface = interface
+        server.port = port
+        server.workers = workers
+        return server
+
+    def test_serves_repos_under_their_names(self):
+        server1 = self.make_server('localhost', '8081', 4)
+        server2 = self.make_server('0.0.0.0', '8082', 32)
+        multi_server = mock.Mock()
+
+        m.serve_repos(
+            [
+                self.make_repo('repo1', server1),
+                self.make_repo('not-served', None),
+                self.make_repo('repo2', server2),
+            ],
+            multi_server
+        )
+
+        server = multi_server.return_value
+        self.assertEqual(
+            [mock.call('repo1', server1), mock.call('repo2', server2)],
+            server.add.mock_calls
+        )
+        self.assertEqual('localhost', server.interface)
+        self.assertEqual('8081', server.port)
+        self.assertEqual(32, server.workers)
+        server.serve.assert_called_once_with()
+
+    def test_nothing_to_serve(self):
+        multi_server = mock.Mock()
+
+        with capture_stdout():
+            m.serve_repos([self.make_repo('repo', None)], multi_server)
+
+        self.assertEqual(0, multi_server.return_value.serve.call_count)
+
+
+class Test_reload_from_config(unittest.TestCase):
+
+    def test_reload_rereads_configuration(self):
+        network = mock.Mock(filename='/home/user/.pyrene')
+        repo = m.DirectoryRepo('repo', {REPO.TYPE: REPOTYPE.DIRECTORY})
+        repo.network = network
+        server = mock.Mock()
+
+        m.reload_from_config(
+            server, [repo], lambda repos: repos[0].make_server()
+        )
+        reloaded_server = server.reload_server()
+
+        self.assertEqual('/home/user/.pyrene', server.config_file)
+        network.reload.assert_called_once_with()
+        network.get_repo.assert_called_once_with('repo')
+        self.assertIs(
+            network.get_repo.return_value.make_server.return_value,
+            reloaded_server
+        )
+
+    def test_without_network_nothing_is_reloaded(self):
+        repo = m.DirectoryRepo('repo', {REPO.TYPE: REPOTYPE.DIRECTORY})
+        server = mock.Mock(spec=['serve'])
+
+        m.reload_from_config(server, [repo], None)
+
+        self.assertFalse(hasattr(server, 'reload_server'))
+
+
+class Test_UnionRepo(unittest.TestCase):
+
+    def setUp(self):
+        self.repos = {
+            'dir': m.DirectoryRepo(
+                'dir',
+                {REPO.TYPE: REPOTYPE.DIRECTORY, REPO.DIRECTORY: 'dir'}
+            ),
+            'http': m.HttpRepo(
+                'http',
+                {REPO.TYPE: REPOTYPE.HTTP, REPO.DOWNLOAD_URL: 'http://x/'}
+            ),
+        }
+        self.network = mock.Mock()
+        self.network.repo_names = self.repos.keys()
+        self.network.get_repo.side_effect = self.get_repo
+
+    def get_repo(self, name):
+        repo = self.repos[name]
+        repo.network = self.network
+        return repo
+
+    def add_union(self, name, members, **attributes):
+        attributes.update({REPO.TYPE: REPOTYPE.UNION, REPO.REPOS: members})
+        self.repos[name] = m.UnionRepo(name, attributes)
+        self.network.repo_names = self.repos.keys()
+        return self.get_repo(name)
+
+    @within_temp_dir
+    def test_get_dependents_of_directory_members(self):
+        os.mkdir('dir')
+        make_wheel('dir/a-1.0-py3-none-any.whl', b'Requires-Dist: b\n')
+        repo = self.add_union('union', 'http,dir')
+
+        self.assertEqual(
+            [('a-1.0-py3-none-any.whl', 'b')], repo.get_dependents('b')
+        )
+
+    @within_temp_dir
+    def test_get_manifest_takes_projects_from_first_member(self):
+        os.mkdir('dir')
+        write_file('dir/a-1.0.tar.gz', b'')
+        write_file('dir/b-1.0.tar.gz', b'')
+        self.repos['http'].get_manifest = lambda: {
+            'a-2.0.tar.gz': 'http a', 'c-1.0.tar.gz': 'http c',
+        }
+        repo = self.add_union('union', 'http,dir')
+
+        self.assertEqual(
+            ['a-2.0.tar.gz', 'b-1.0.tar.gz', 'c-1.0.tar.gz'],
+            sorted(repo.get_manifest())
+        )
+
+    def test_get_dependents_without_directory_members(self):
+        repo = self.add_union('union', 'http')
+
+        with self.assertRaises(NotImplementedError):
+            repo.get_dependents('b')
+
+    def test_get_as_pip_conf(self):
+        repo = self.add_union('union', 'dir', port='9000')
+
+        self.assertIn(
+            'index-url = http://localhost:9000/simple/',
+            repo.get_as_pip_conf()
+        )
+
+    @within_temp_dir
+    def test_make_server_has_members_in_order(self):
+        repo = self.add_union('union', 'http, dir')
+
+        server = repo.make_server()
+
+        self.assertEqual(2, len(server.members))
+        self.assertEqual('http://x/', server.members[0].upstream_url)
+        self.assertIsNone(server.members[0].directory)
+        self.assertEqual('dir', server.members[1].directory)
+
+    @within_temp_dir
+    def test_unknown_member_is_skipped(self):
+        repo = self.add_union('union', 'unknown dir')
+
+        with capture_stdout() as stdout:
+            server = repo.make_server()
+            output = stdout.content
+
+        self.assertIn('unknown', output)
+        self.assertEqual(1, len(server.members))
+
+    @within_temp_dir
+    def test_union_can_not_contain_itself(self):
+        self.add_union('inner', 'dir outer')
+        repo = self.add_union('outer', 'inner')
+
+        with capture_stdout() as stdout:
+            server = repo.make_server()
+            output = stdout.content
+
+        self.assertIn('contain itself', output)
+        inner_server, = server.members
+        self.assertEqual(1, len(inner_server.members))
+
+    def test_upload_packages_is_refused(self):
+        repo = self.add_union('union', 'dir')
+
+        with capture_stdout() as stdout:
+            repo.upload_packages(['a-1.0.zip'])
+            output = stdout.content
+
+        self.assertIn('can not be uploaded', output)
@@ -0,0 +1,1253 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+try:
+    from httplib import HTTPConnection
+except ImportError:
+    from http.client import HTTPConnection
+
+import mock
+
+import pyrene.server as m
+from pyrene.depgraph import DependencyGraph
+from pyrene.eviction import Evictor
+from pyrene.util import write_file
+from .util import capture_stdout, make_wheel
+
+
+class Test_parse_range(unittest.TestCase):
+
+    def test_first_last(self):
+        self.assertEqual((0, 9), m.parse_range('bytes=0-9', 100))
+
+    def test_open_ended(self):
+        self.assertEqual((90, 99), m.parse_range('bytes=90-', 100))
+
+    def test_suffix(self):
+        self.assertEqual((80, 99), m.parse_range('bytes=-20', 100))
+
+    def test_last_is_clipped(self):
+        self.assertEqual((90, 99), m.parse_range('bytes=90-1000', 100))
+
+    def test_multiple_ranges_are_ignored(self):
+        self.assertIsNone(m.parse_range('bytes=0-1,5-6', 100))
+
+    def test_malformed_is_ignored(self):
+        self.assertIsNone(m.parse_range('bytes=a-b', 100))
+        self.assertIsNone(m.parse_range('lines=1-2', 100))
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(m.RangeNotSatisfiable):
+            m.parse_range('bytes=100-', 100)
+
+
+PACKAGE_CONTENT = b'0123456789' * 1000
+
+
+class ServerTestCase(unittest.TestCase):
+
+    volatile = False
+    users = {}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        write_file(
+            os.path.join(self.directory, 'Foo_Bar-1.0.tar.gz'),
+            PACKAGE_CONTENT
+        )
+        server = m.PackageServer()
+        server.directory = self.directory
+        server.volatile = self.volatile
+        for username, password in self.users.items():
+            server.add_user(username, password)
+        self.httpd = start(self, server)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def request(self, path, headers=None, method='GET', body=None):
+        return request(self.httpd, path, headers, method, body)
+
+
+def start(test_case, server):
+    '''Run server on a random localhost port until the end of the test'''
+    server.interface = '127.0.0.1'
+    server.port = '0'
+    httpd = server.make_httpd()
+    thread = threading.Thread(
+        target=httpd.serve_forever, kwargs={'poll_interval': 0.01}
+    )
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        httpd.shutdown()
+        httpd.server_close()
+    test_case.addCleanup(stop)
+    return httpd
+
+
+def url(httpd, path):
+    return 'http://{}:{}{}'.format(
+        httpd.server_address[0], httpd.server_address[1], path
+    )
+
+
+def request(httpd, path, headers=None, method='GET', body=None):
+    connection = HTTPConnection(*httpd.server_address[:2])
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+class Test_PackageServer_pages(ServerTestCase):
+
+    def test_index_lists_projects(self):
+        response, body = self.request('/simple/')
+
+        self.assertEqual(200, response.status)
+        self.assertIn(b'foo-bar/', body)
+
+    def test_project_page_links_files(self):
+        response, body = self.request('/simple/foo-bar/')
+
+        self.assertEqual(200, response.status)
+        self.assertIn(b'../../packages/Foo_Bar-1.0.tar.gz', body)
+
+    def test_unnormalized_project_name_is_redirected(self):
+        response, _ = self.request('/simple/Foo_Bar/')
+
+        self.assertEqual(301, response.status)
+        self.assertEqual('/simple/foo-bar/', response.getheader('Location'))
+
+    def test_unknown_project(self):
+        response, _ = self.request('/simple/unknown/')
+
+        self.assertEqual(404, response.status)
+
+    def test_new_file_shows_up(self):
+        self.request('/simple/')
+        write_file(os.path.join(self.directory, 'new-2.0.zip'), b'')
+        # directory mtime resolution might be coarse
+        self.httpd.site.index._mtime = None
+
+        _, body = self.request('/simple/')
+
+        self.assertIn(b'new/', body)
+
+    def test_precompressed_page(self):
+        response, body = self.request(
+            '/simple/foo-bar/', {'Accept-Encoding': 'gzip'}
+        )
+
+        self.assertEqual('gzip', response.getheader('Content-Encoding'))
+        uncompressed = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+        self.assertIn(b'Foo_Bar-1.0.tar.gz', uncompressed)
+
+    def test_page_revalidation(self):
+        response, _ = self.request('/simple/foo-bar/')
+        etag = response.getheader('ETag')
+
+        response, body = self.request(
+            '/simple/foo-bar/', {'If-None-Match': etag}
+        )
+
+        self.assertEqual(304, response.status)
+        self.assertEqual(b'', body)
+
+
+class Test_PackageServer_json(ServerTestCase):
+
+    def request_json(self, path):
+        response, body = self.request(path, {'Accept': m.SIMPLE_JSON})
+        self.assertEqual(200, response.status)
+        self.assertEqual(m.SIMPLE_JSON, response.getheader('Content-Type'))
+        return json.loads(body.decode('utf8'))
+
+    def test_index(self):
+        data = self.request_json('/simple/')
+
+        self.assertEqual({'api-version': '1.0'}, data['meta'])
+        self.assertEqual([{'name': 'foo-bar'}], data['projects'])
+
+    def test_project(self):
+        data = self.request_json('/simple/foo-bar/')
+
+        self.assertEqual('foo-bar', data['name'])
+        self.assertEqual(
+            [{
+                'filename': 'Foo_Bar-1.0.tar.gz',
+                'url': '../../packages/Foo_Bar-1.0.tar.gz',
+                'hashes': {},
+            }],
+            data['files']
+        )
+
+    def test_format_query_parameter(self):
+        response, _ = self.request(
+            '/simple/?format=' + m.SIMPLE_JSON.replace('+', '%2B')
+        )
+
+        self.assertEqual(m.SIMPLE_JSON, response.getheader('Content-Type'))
+
+    def test_html_by_default(self):
+        response, body = self.request('/simple/', {'Accept': '*/*'})
+
+        self.assertEqual(
+            'text/html; charset=utf-8', response.getheader('Content-Type')
+        )
+        self.assertIn(b'pypi:repository-version', body)
+        self.assertIn('Accept', response.getheader('Vary'))
+
+    def test_representations_have_distinct_etags(self):
+        html, _ = self.request('/simple/')
+        json_response, _ = self.request(
+            '/simple/', {'Accept': m.SIMPLE_JSON}
+        )
+
+        self.assertNotEqual(
+            html.getheader('ETag'), json_response.getheader('ETag')
+        )
+
+    def test_not_acceptable(self):
+        response, _ = self.request('/simple/', {'Accept': 'image/png'})
+
+        self.assertEqual(406, response.status)
+
+
+class Test_negotiate_content_type(unittest.TestCase):
+
+    def check(self, expected, accept):
+        self.assertEqual(expected, m.negotiate_content_type(accept))
+
+    def test_no_preference_is_html(self):
+        self.check(m.TEXT_HTML, '')
+        self.check(m.TEXT_HTML, '*/*')
+        self.check(m.TEXT_HTML, 'text/html')
+
+    def test_json_is_preferred_among_equals(self):
+        self.check(m.SIMPLE_JSON, m.SIMPLE_JSON + ', text/html')
+
+    def test_quality(self):
+        self.check(
+            m.SIMPLE_HTML,
+            m.SIMPLE_JSON + ';q=0.1, ' + m.SIMPLE_HTML + ';q=0.5'
+        )
+        self.check(m.TEXT_HTML, m.SIMPLE_JSON + ';q=0, */*')
+
+    def test_latest(self):
+        self.check(m.SIMPLE_JSON, 'application/vnd.pypi.simple.latest+json')
+
+    def test_pip(self):
+        self.check(
+            m.SIMPLE_JSON,
+            'application/vnd.pypi.simple.v1+json, '
+            'application/vnd.pypi.simple.v1+html; q=0.1, text/html; q=0.01'
+        )
+
+    def test_unsupported(self):
+        self.check(None, 'application/json')
+
+
+class Test_PackageServer_files(ServerTestCase):
+
+    PATH = '/packages/Foo_Bar-1.0.tar.gz'
+
+    def test_download(self):
+        response, body = self.request(self.PATH)
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(PACKAGE_CONTENT, body)
+        self.assertIn('immutable', response.getheader('Cache-Control'))
+        self.assertTrue(response.getheader('Last-Modified'))
+
+    def test_head(self):
+        response, body = self.request(self.PATH, method='HEAD')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(
+            str(len(PACKAGE_CONTENT)), response.getheader('Content-Length')
+        )
+
+    def test_unknown_file(self):
+        response, _ = self.request('/packages/unknown-1.0.tar.gz')
+
+        self.assertEqual(404, response.status)
+
+    def test_if_none_match(self):
+        response, _ = self.request(self.PATH)
+        etag = response.getheader('ETag')
+
+        response, body = self.request(self.PATH, {'If-None-Match': etag})
+
+        self.assertEqual(304, response.status)
+        self.assertEqual(b'', body)
+
+    def test_if_modified_since(self):
+        response, _ = self.request(self.PATH)
+        last_modified = response.getheader('Last-Modified')
+
+        response, _ = self.request(
+            self.PATH, {'If-Modified-Since': last_modified}
+        )
+
+        self.assertEqual(304, response.status)
+
+    def test_range(self):
+        response, body = self.request(self.PATH, {'Range': 'bytes=10-19'})
+
+        self.assertEqual(206, response.status)
+        self.assertEqual(PACKAGE_CONTENT[10:20], body)
+        self.assertEqual(
+            'bytes 10-19/{}'.format(len(PACKAGE_CONTENT)),
+            response.getheader('Content-Range')
+        )
+
+    def test_range_with_stale_if_range_sends_everything(self):
+        response, body = self.request(
+            self.PATH, {'Range': 'bytes=10-19', 'If-Range': '"stale"'}
+        )
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(PACKAGE_CONTENT, body)
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.request(self.PATH, {'Range': 'bytes=100000-'})
+
+        self.assertEqual(416, response.status)
+
+
+WHEEL_METADATA = b'Metadata-Version: 2.1\nName: Foo_Bar\nVersion: 2.0\n'
+
+
+class Test_PackageServer_metadata(ServerTestCase):
+
+    WHEEL = 'Foo_Bar-2.0-py3-none-any.whl'
+
+    def setUp(self):
+        super(Test_PackageServer_metadata, self).setUp()
+        make_wheel(os.path.join(self.directory, self.WHEEL), WHEEL_METADATA)
+        self.httpd.site.index._mtime = None
+
+    def test_project_page_advertises_metadata(self):
+        _, body = self.request('/simple/foo-bar/')
+
+        digest = hashlib.sha256(WHEEL_METADATA).hexdigest()
+        self.assertIn(
+            'data-dist-info-metadata="sha256={}"'.format(digest).encode(),
+            body
+        )
+        self.assertIn(
+            'data-core-metadata="sha256={}"'.format(digest).encode(), body
+        )
+        # only for the wheel
+        self.assertEqual(1, body.count(b'data-core-metadata'))
+
+    def test_metadata_file(self):
+        response, body = self.request(
+            '/packages/{}.metadata'.format(self.WHEEL)
+        )
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(WHEEL_METADATA, body)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.directory, '.pyrene-metadata', self.WHEEL + '.metadata'
+        )))
+
+    def test_no_metadata_for_sdist(self):
+        response, _ = self.request('/packages/Foo_Bar-1.0.tar.gz.metadata')
+
+        self.assertEqual(404, response.status)
+
+
+class Test_PackageServer_volatile(ServerTestCase):
+
+    volatile = True
+
+    def test_files_are_revalidated(self):
+        response, _ = self.request('/packages/Foo_Bar-1.0.tar.gz')
+
+        self.assertEqual('no-cache', response.getheader('Cache-Control'))
+
+    def test_concurrent_overwrites_are_atomic(self):
+        contents = [str(i).encode('ascii') * 200000 for i in range(5)]
+
+        def upload(content):
+            headers, body = make_upload('Foo_Bar-1.0.tar.gz', content)
+            self.assertEqual(
+                200, self.request('/', headers, 'POST', body)[0].status
+            )
+        threads = [
+            threading.Thread(target=upload, args=(content,))
+            for content in contents
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        _, body = self.request('/packages/Foo_Bar-1.0.tar.gz')
+        self.assertIn(body, contents)
+
+
+def make_upload(filename, content, boundary='xXxXx', fields=()):
+    lines = []
+    for name, value in ((':action', 'file_upload'),) + tuple(fields):
+        lines.extend([
+            '--' + boundary,
+            'Content-Disposition: form-data; name="{}"'.format(name),
+            '',
+            value,
+        ])
+    lines += [
+        '--' + boundary,
+        'Content-Disposition: form-data; name="content"; filename="{}"'
+        .format(filename),
+        'Content-Type: application/octet-stream',
+        '',
+    ]
+    body = (
+        '\r\n'.join(lines).encode('utf8') + b'\r\n' + content
+        + '\r\n--{}--\r\n'.format(boundary).encode('utf8')
+    )
+    headers = {
+        'Content-Type': 'multipart/form-data; boundary=' + boundary,
+        'Content-Length': str(len(body)),
+    }
+    return headers, body
+
+
+def basic_auth(username, password):
+    credentials = '{}:{}'.format(username, password).encode('utf8')
+    return 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+
+class Test_PackageServer_upload(ServerTestCase):
+
+    users = {'user': 'pass'}
+
+    def upload(self, filename, content, password='pass', fields=()):
+        headers, body = make_upload(filename, content, fields=fields)
+        headers['Authorization'] = basic_auth('user', password)
+        return self.request('/', headers, method='POST', body=body)
+
+    def concurrent_uploads(self, contents):
+        statuses = []
+
+        def upload(content):
+            statuses.append(self.upload('new-1.0.tar.gz', content)[0].status)
+        threads = [
+            threading.Thread(target=upload, args=(content,))
+            for content in contents
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assertNoTemporaryFiles(self):
+        self.assertEqual(
+            [],
+            os.listdir(os.path.join(self.directory, m.TEMP_DIRECTORY))
+        )
+
+    def test_uploaded_file_is_listed_without_rescan(self):
+        # the first upload makes the temporary directory
+        self.upload('first-1.0.tar.gz', b'')
+        self.request('/simple/')
+        listdir = os.listdir
+        scanned = []
+
+        def recording_listdir(path):
+            scanned.append(path)
+            return listdir(path)
+        with mock.patch.object(m.os, 'listdir', recording_listdir):
+            self.upload('new-1.0.tar.gz', b'new content')
+            _, body = self.request('/simple/new/')
+
+        self.assertIn(b'new-1.0.tar.gz', body)
+        self.assertNotIn(self.directory, scanned)
+
+    def test_digest_is_checked(self):
+        response, _ = self.upload(
+            'new-1.0.tar.gz', b'new content',
+            fields=[('sha256_digest', '0' * 64)]
+        )
+
+        self.assertEqual(400, response.status)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory, 'new-1.0.tar.gz'))
+        )
+        self.assertNoTemporaryFiles()
+
+    def test_matching_digest(self):
+        response, _ = self.upload(
+            'new-1.0.tar.gz', b'new content',
+            fields=[
+                ('sha256_digest', hashlib.sha256(b'new content').hexdigest())
+            ]
+        )
+
+        self.assertEqual(200, response.status)
+
+    def test_concurrent_uploads_of_same_file(self):
+        statuses = self.concurrent_uploads([b'1' * 100000, b'2' * 100000])
+
+        self.assertEqual([200, 409], statuses)
+        self.assertNoTemporaryFiles()
+
+    def test_upload(self):
+        response, _ = self.upload('new-1.0.tar.gz', b'new content')
+
+        self.assertEqual(200, response.status)
+        with open(os.path.join(self.directory, 'new-1.0.tar.gz'), 'rb') as f:
+            self.assertEqual(b'new content', f.read())
+
+    def test_upload_updates_dependency_graph(self):
+        wheel = os.path.join(self.directory, 'a-1.0-py3-none-any.whl')
+        make_wheel(wheel, b'Name: a\nRequires-Dist: b (>=1)\n')
+        with open(wheel, 'rb') as f:
+            content = f.read()
+        os.remove(wheel)
+
+        self.upload('a-1.0-py3-none-any.whl', content)
+
+        # without rescanning the directory
+        graph = DependencyGraph(self.directory)
+        self.assertEqual(
+            [('a-1.0-py3-none-any.whl', 'b (>=1)')],
+            graph.get_dependents('B')
+        )
+
+    def test_upload_requires_valid_password(self):
+        response, _ = self.upload('new-1.0.tar.gz', b'', password='bad')
+
+        self.assertEqual(401, response.status)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory, 'new-1.0.tar.gz'))
+        )
+
+    def test_overwrite_is_refused(self):
+        response, _ = self.upload('Foo_Bar-1.0.tar.gz', b'new content')
+
+        self.assertEqual(409, response.status)
+
+
+class Test_CredentialCache(unittest.TestCase):
+
+    def test_added_authorization_is_verified(self):
+        cache = m.CredentialCache()
+        cache.add('Basic abc')
+
+        self.assertIn('Basic abc', cache)
+        self.assertNotIn('Basic abd', cache)
+
+    def test_expiry(self):
+        cache = m.CredentialCache(ttl=-1)
+        cache.add('Basic abc')
+
+        self.assertNotIn('Basic abc', cache)
+
+    def test_size_is_bounded(self):
+        cache = m.CredentialCache(max_size=2)
+        for authorization in ('a', 'b', 'c'):
+            cache.add(authorization)
+
+        self.assertEqual(1, len(cache._verified))
+        self.assertIn('c', cache)
+
+
+class Test_RepoSite_auth(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.htpasswd_path = os.path.join(self.directory, '.pyrene-htpasswd')
+        self.site = m.RepoSite(
+            self.directory, users={'user': 'pass'},
+            htpasswd_path=self.htpasswd_path
+        )
+
+    def test_passwords_are_verified_once(self):
+        check_password = self.site.htpasswd.check_password = mock.Mock(
+            return_value=True
+        )
+
+        self.assertTrue(
+            self.site.check_authorization(basic_auth('user', 'pass'))
+        )
+        self.assertTrue(
+            self.site.check_authorization(basic_auth('user', 'pass'))
+        )
+        self.assertEqual(1, check_password.call_count)
+
+    def test_failed_verification_is_not_cached(self):
+        self.assertFalse(
+            self.site.check_authorization(basic_auth('user', 'bad'))
+        )
+        self.assertNotIn(basic_auth('user', 'bad'), self.site.credentials)
+
+    def test_not_basic(self):
+        self.assertFalse(self.site.check_authorization('Bearer xyz'))
+
+    def test_htpasswd_is_persisted(self):
+        self.assertTrue(os.path.exists(self.htpasswd_path))
+
+
+def assertMetric(test_case, httpd, line, headers=None):
+    '''Wait for line in /metrics - requests are counted after responding'''
+    deadline = time.time() + 5
+    while True:
+        _, body = request(httpd, '/metrics', headers)
+        if line.encode('utf8') in body.splitlines():
+            return
+        test_case.assertLess(time.time(), deadline, body)
+        time.sleep(0.01)
+
+
+class Test_PackageServer_metrics(ServerTestCase):
+
+    def test_requests_are_counted_per_endpoint_and_status(self):
+        self.request('/simple/')
+        self.request('/simple/foo-bar/')
+        self.request('/simple/unknown/')
+
+        assertMetric(
+            self, self.httpd,
+            'pyrene_requests_total{repo="",endpoint="index",status="200"} 1'
+        )
+        assertMetric(
+            self, self.httpd,
+            'pyrene_requests_total{repo="",endpoint="project",status="200"} 1'
+        )
+        assertMetric(
+            self, self.httpd,
+            'pyrene_requests_total{repo="",endpoint="project",status="404"} 1'
+        )
+
+    def test_bytes_sent(self):
+        self.request('/packages/Foo_Bar-1.0.tar.gz')
+
+        assertMetric(
+            self, self.httpd,
+            'pyrene_response_bytes_total{{repo="",endpoint="package"}} {}'
+            .format(len(PACKAGE_CONTENT))
+        )
+
+    def test_latency_histogram(self):
+        self.request('/packages/Foo_Bar-1.0.tar.gz')
+
+        assertMetric(
+            self, self.httpd,
+            'pyrene_request_duration_seconds_bucket'
+            '{repo="",endpoint="package",le="+Inf"} 1'
+        )
+
+    def test_rendered_pages_are_cached(self):
+        self.request('/simple/')
+        self.request('/simple/')
+
+        assertMetric(
+            self, self.httpd,
+            'pyrene_cache_total{repo="",cache="page",result="miss"} 1'
+        )
+        assertMetric(
+            self, self.httpd,
+            'pyrene_cache_total{repo="",cache="page",result="hit"} 1'
+        )
+
+    def test_summary_is_printed_on_shutdown(self):
+        server = m.PackageServer()
+        server.directory = self.directory
+        httpd = mock.Mock(server_address=('127.0.0.1', 8080))
+        httpd.serve_forever.side_effect = KeyboardInterrupt
+        httpd.metrics = m.Metrics()
+        httpd.metrics.observe_request('', 'index', 200, 0.001, 100)
+        server.make_httpd = lambda: httpd
+
+        with capture_stdout() as stdout:
+            server.serve()
+            output = stdout.content
+
+        self.assertIn('index: 1 requests', output)
+        httpd.server_close.assert_called_once_with()
+
+
+class Test_ProxySite(unittest.TestCase):
+
+    PATH = '/packages/Foo_Bar-1.0.tar.gz'
+
+    def setUp(self):
+        self.upstream_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upstream_directory)
+        write_file(
+            os.path.join(self.upstream_directory, 'Foo_Bar-1.0.tar.gz'),
+            PACKAGE_CONTENT
+        )
+        upstream = m.PackageServer()
+        upstream.directory = self.upstream_directory
+        self.upstream = start(self, upstream)
+
+        self.upstream_requests = []
+        upstream_site = self.upstream.site
+        get_package_path = upstream_site.get_package_path
+        get_project_page = upstream_site.get_project_page
+
+        def slow_get_package_path(filename):
+            self.upstream_requests.append(filename)
+            time.sleep(0.1)
+            return get_package_path(filename)
+
+        def counting_get_project_page(project):
+            self.upstream_requests.append(project)
+            return get_project_page(project)
+        upstream_site.get_package_path = slow_get_package_path
+        upstream_site.get_project_page = counting_get_project_page
+
+        self.cache_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_directory)
+        self.proxy = self.start_proxy(ttl=600)
+
+    def start_proxy(self, ttl):
+        proxy = m.ProxyServer()
+        proxy.directory = self.cache_directory
+        proxy.upstream_url = url(self.upstream, '/simple/')
+        proxy.ttl = ttl
+        return start(self, proxy)
+
+    def test_index_page(self):
+        response, body = request(self.proxy, '/simple/')
+
+        self.assertEqual(200, response.status)
+        self.assertIn(b'"foo-bar/"', body)
+
+    def test_project_page_links_to_local_files(self):
+        response, body = request(self.proxy, '/simple/foo-bar/')
+
+        self.assertEqual(200, response.status)
+        self.assertIn(b'"../../packages/Foo_Bar-1.0.tar.gz"', body)
+
+    def test_upstream_json_is_preferred(self):
+        accepts = []
+
+        class Handler(m.PackageRequestHandler):
+            def send_page(self, page, send_body):
+                accepts.append(self.headers.get('Accept'))
+                return m.PackageRequestHandler.send_page(
+                    self, page, send_body
+                )
+        self.upstream.RequestHandlerClass = Handler
+
+        _, body = request(self.proxy, '/simple/foo-bar/')
+
+        self.assertIn(m.SIMPLE_JSON, accepts[0])
+        self.assertIn(b'"../../packages/Foo_Bar-1.0.tar.gz"', body)
+
+    def test_unknown_project(self):
+        response, _ = request(self.proxy, '/simple/unknown/')
+
+        self.assertEqual(404, response.status)
+
+    def test_project_page_is_cached(self):
+        request(self.proxy, '/simple/foo-bar/')
+        request(self.proxy, '/simple/foo-bar/')
+
+        self.assertEqual(['foo-bar'], self.upstream_requests)
+
+    def test_stale_project_page_is_revalidated(self):
+        proxy = self.start_proxy(ttl=0)
+        request(proxy, '/simple/foo-bar/')
+        write_file(
+            os.path.join(self.upstream_directory, 'foo-bar-2.0.tar.gz'), b''
+        )
+        self.upstream.site.index._mtime = None
+
+        _, body = request(proxy, '/simple/foo-bar/')
+
+        self.assertIn(b'foo-bar-2.0.tar.gz', body)
+
+    def test_file_is_fetched_once(self):
+        response1, body1 = request(self.proxy, self.PATH)
+        response2, body2 = request(self.proxy, self.PATH)
+
+        self.assertEqual(PACKAGE_CONTENT, body1)
+        self.assertEqual(PACKAGE_CONTENT, body2)
+        self.assertEqual(
+            1, self.upstream_requests.count('Foo_Bar-1.0.tar.gz')
+        )
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.cache_directory, 'Foo_Bar-1.0.tar.gz')
+            )
+        )
+
+    def test_concurrent_requests_are_coalesced(self):
+        bodies = []
+
+        def download():
+            bodies.append(request(self.proxy, self.PATH)[1])
+        threads = [threading.Thread(target=download) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([PACKAGE_CONTENT] * 5, bodies)
+        self.assertEqual(
+            1, self.upstream_requests.count('Foo_Bar-1.0.tar.gz')
+        )
+
+    def test_file_downloaded_after_index_miss_is_not_fetched_again(self):
+        request(self.proxy, self.PATH)
+        site = self.proxy.site
+
+        # as if the index was checked just before the download finished
+        path = site._download(site._links['Foo_Bar-1.0.tar.gz'])
+
+        self.assertEqual(
+            os.path.join(self.cache_directory, 'Foo_Bar-1.0.tar.gz'), path
+        )
+        self.assertEqual(
+            1, self.upstream_requests.count('Foo_Bar-1.0.tar.gz')
+        )
+
+    def test_unknown_file(self):
+        response, _ = request(self.proxy, '/packages/unknown-1.0.tar.gz')
+
+        self.assertEqual(404, response.status)
+
+    def test_file_cache_hits_and_misses_are_counted(self):
+        request(self.proxy, self.PATH)
+        request(self.proxy, self.PATH)
+
+        assertMetric(
+            self, self.proxy,
+            'pyrene_cache_total{repo="",cache="file",result="miss"} 1'
+        )
+        assertMetric(
+            self, self.proxy,
+            'pyrene_cache_total{repo="",cache="file",result="hit"} 1'
+        )
+
+    def test_cached_files_are_listed_when_upstream_is_down(self):
+        request(self.proxy, self.PATH)
+        proxy = self.start_proxy(ttl=0)
+        self.upstream.shutdown()
+        self.upstream.server_close()
+
+        response, body = request(proxy, '/simple/foo-bar/')
+
+        self.assertEqual(200, response.status)
+        self.assertIn(b'Foo_Bar-1.0.tar.gz', body)
+
+
+class Test_PackageServer_cache_size(unittest.TestCase):
+
+    def test_evicts_and_drops_files_from_index(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name in ('a-1.zip', 'b-1.zip'):
+            write_file(os.path.join(directory, name), b'x' * 100)
+        server = m.PackageServer()
+        server.directory = directory
+        server.cache_size = 100
+        httpd = start(self, server)
+        request(httpd, '/packages/b-1.zip')
+
+        httpd.site.evictor.wake()
+        deadline = time.time() + 5
+        while os.path.exists(os.path.join(directory, 'a-1.zip')):
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+
+        self.assertEqual(404, request(httpd, '/packages/a-1.zip')[0].status)
+        self.assertEqual(200, request(httpd, '/packages/b-1.zip')[0].status)
+
+
+class Test_MultiServer(unittest.TestCase):
+
+    def make_server(self, filename, users=None):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        write_file(os.path.join(directory, filename), PACKAGE_CONTENT)
+        server = m.PackageServer()
+        server.directory = directory
+        for username, password in (users or {}).items():
+            server.add_user(username, password)
+        return server
+
+    def setUp(self):
+        multi_server = m.MultiServer()
+        multi_server.workers = 2
+        multi_server.add('repo1', self.make_server('a-1.0.zip'))
+        multi_server.add('repo2', self.make_server('b-1.0.zip', {'u': 'p'}))
+        self.httpd = start(self, multi_server)
+
+    def test_repos_are_served_under_their_names(self):
+        _, body1 = request(self.httpd, '/repo1/simple/')
+        _, body2 = request(self.httpd, '/repo2/simple/')
+
+        self.assertIn(b'"a/"', body1)
+        self.assertNotIn(b'"b/"', body1)
+        self.assertIn(b'"b/"', body2)
+
+    def test_package_file(self):
+        response, body = request(self.httpd, '/repo2/packages/b-1.0.zip')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(PACKAGE_CONTENT, body)
+
+    def test_package_files_are_not_shared(self):
+        response, _ = request(self.httpd, '/repo1/packages/b-1.0.zip')
+
+        self.assertEqual(404, response.status)
+
+    def test_redirects_stay_within_repo(self):
+        response, _ = request(self.httpd, '/repo1/simple/A/')
+
+        self.assertEqual(301, response.status)
+        self.assertEqual('/repo1/simple/a/', response.getheader('Location'))
+
+    def test_root_lists_repos(self):
+        _, body = request(self.httpd, '/')
+
+        self.assertIn(b'repo1/simple/', body)
+        self.assertIn(b'repo2/simple/', body)
+
+    def test_unknown_repo(self):
+        response, _ = request(self.httpd, '/unknown/simple/')
+
+        self.assertEqual(404, response.status)
+
+    def test_auth_is_per_repo(self):
+        headers, body = make_upload('new-1.0.zip', b'')
+        headers['Authorization'] = basic_auth('u', 'p')
+
+        response1, _ = request(self.httpd, '/repo1/', headers, 'POST', body)
+        response2, _ = request(self.httpd, '/repo2/', headers, 'POST', body)
+
+        self.assertEqual(200, response1.status)
+        self.assertEqual(200, response2.status)
+
+    def test_auth_is_required_where_configured(self):
+        headers, body = make_upload('new-1.0.zip', b'')
+
+        response, _ = request(self.httpd, '/repo2/', headers, 'POST', body)
+
+        self.assertEqual(401, response.status)
+
+    def test_metrics_are_served_at_root_per_repo(self):
+        request(self.httpd, '/repo1/packages/a-1.0.zip')
+
+        assertMetric(
+            self, self.httpd,
+            'pyrene_requests_total'
+            '{repo="repo1",endpoint="package",status="200"} 1',
+            {'Authorization': basic_auth('u', 'p')}
+        )
+
+    def test_metrics_require_auth_where_configured(self):
+        response, _ = request(self.httpd, '/metrics')
+        wrong, _ = request(
+            self.httpd, '/metrics', {'Authorization': basic_auth('u', 'x')}
+        )
+
+        self.assertEqual(401, response.status)
+        self.assertEqual(401, wrong.status)
+
+    def test_more_clients_than_workers(self):
+        statuses = []
+
+        def download():
+            statuses.append(
+                request(self.httpd, '/repo1/packages/a-1.0.zip')[0].status
+            )
+        threads = [threading.Thread(target=download) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([200] * 10, statuses)
+
+    def test_idle_keep_alive_clients_do_not_hold_workers(self):
+        idle = []
+        for _ in range(2):
+            connection = HTTPConnection(*self.httpd.server_address[:2])
+            self.addCleanup(connection.close)
+            connection.request('GET', '/repo1/simple/')
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(200, response.status)
+            idle.append(connection)
+
+        started = time.time()
+        response, _ = request(self.httpd, '/repo1/simple/')
+
+        self.assertEqual(200, response.status)
+        self.assertLess(time.time() - started, 2)
+
+    def test_pipelined_requests_are_answered(self):
+        connection = socket.create_connection(self.httpd.server_address[:2])
+        self.addCleanup(connection.close)
+        connection.sendall(
+            b'GET /repo1/simple/ HTTP/1.1\r\nHost: x\r\n\r\n'
+            b'GET /repo1/simple/ HTTP/1.1\r\nHost: x\r\n'
+            b'Connection: close\r\n\r\n'
+        )
+        received = b''
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                break
+            received += data
+
+        self.assertEqual(2, received.count(b'HTTP/1.1 200'))
+
+
+class Test_Reloader(unittest.TestCase):
+
+    def make_server(self, filename):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        write_file(os.path.join(directory, filename), PACKAGE_CONTENT)
+        server = m.PackageServer()
+        server.directory = directory
+        return server
+
+    def setUp(self):
+        self.server = self.make_server('old-1.0.zip')
+        self.httpd = start(self, self.server)
+        self.reloader = m.Reloader(self.server, self.httpd, 'http://x')
+
+    def reload(self):
+        with capture_stdout() as stdout:
+            result = self.reloader.reload()
+            self.output = stdout.content
+        return result
+
+    def test_new_sites_are_served(self):
+        new_server = self.make_server('new-1.0.zip')
+        self.server.reload_server = lambda: new_server
+
+        self.assertTrue(self.reload())
+
+        _, body = request(self.httpd, '/simple/')
+        self.assertIn(b'"new/"', body)
+        self.assertNotIn(b'"old/"', body)
+        self.assertIn('Reloaded', self.output)
+
+    def test_requests_in_progress_finish_on_old_site(self):
+        old_site = self.httpd.site
+        get_package_path = old_site.get_package_path
+        started = threading.Event()
+
+        def slow_get_package_path(filename):
+            started.set()
+            time.sleep(0.2)
+            return get_package_path(filename)
+        old_site.get_package_path = slow_get_package_path
+        responses = []
+        thread = threading.Thread(
+            target=lambda: responses.append(
+                request(self.httpd, '/packages/old-1.0.zip')
+            )
+        )
+        thread.start()
+        started.wait(5)
+
+        new_server = self.make_server('new-1.0.zip')
+        self.server.reload_server = lambda: new_server
+        self.reload()
+        thread.join()
+
+        response, body = responses[0]
+        self.assertEqual(200, response.status)
+        self.assertEqual(PACKAGE_CONTENT, body)
+
+    def test_cache_counts_add_up_across_reloads(self):
+        request(self.httpd, '/simple/')
+        request(self.httpd, '/simple/')
+        new_server = self.make_server('new-1.0.zip')
+        self.server.reload_server = lambda: new_server
+
+        self.reload()
+        request(self.httpd, '/simple/')
+
+        assertMetric(
+            self, self.httpd,
+            'pyrene_cache_total{repo="",cache="page",result="miss"} 2'
+        )
+        assertMetric(
+            self, self.httpd,
+            'pyrene_cache_total{repo="",cache="page",result="hit"} 1'
+        )
+
+    def test_evictor_accesses_are_taken_over(self):
+        self.server.cache_size = 10 ** 6
+        self.server.reload_server = lambda: self.server
+        self.reload()
+        old_evictor = self.httpd.site.evictor
+        old_evictor.touch('old-1.0.zip')
+
+        self.reload()
+        evictor = self.httpd.site.evictor
+        evictor.touch('old-1.0.zip')
+
+        self.assertIsNot(old_evictor, evictor)
+        self.assertIsNone(old_evictor._thread)
+        self.assertEqual(2, evictor.access['old-1.0.zip'][1])
+        self.httpd.site.close()
+        self.assertEqual(
+            2, Evictor(self.server.directory, 0).access['old-1.0.zip'][1]
+        )
+
+    def test_failed_reload_keeps_serving(self):
+        self.server.reload_server = lambda: None
+        site = self.httpd.site
+
+        self.assertFalse(self.reload())
+
+        self.assertIs(site, self.httpd.site)
+        self.assertIn('Reload failed', self.output)
+
+    def test_reload_error_keeps_serving(self):
+        def reload_server():
+            raise NameError('repo')
+        self.server.reload_server = reload_server
+        site = self.httpd.site
+
+        self.assertFalse(self.reload())
+
+        self.assertIs(site, self.httpd.site)
+        self.assertIn('Reload failed', self.output)
+
+    def test_config_change_triggers_reload(self):
+        config_file = os.path.join(self.server.directory, 'config')
+        write_file(config_file, b'')
+        self.server.config_file = config_file
+        reloaded = threading.Event()
+        reloader = m.Reloader(self.server, self.httpd, 'http://x', 0.01)
+        reloader.reload = reloaded.set
+        reloader.start()
+        self.addCleanup(reloader.stop)
+
+        stat = os.stat(config_file)
+        os.utime(config_file, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertTrue(reloaded.wait(5))
+
+    @unittest.skipUnless(hasattr(m.signal, 'SIGHUP'), 'needs SIGHUP')
+    def test_sighup_requests_reload(self):
+        reloader = mock.Mock()
+
+        with m.reload_on_sighup(reloader):
+            os.kill(os.getpid(), m.signal.SIGHUP)
+            time.sleep(0.01)
+
+        reloader.request.assert_called_once_with()
+
+
+class Test_PackageServer_proxy_upload(Test_ProxySite):
+
+    def test_upload_is_refused(self):
+        headers, body = make_upload('new-1.0.zip', b'')
+
+        response, _ = request(self.proxy, '/', headers, 'POST', body)
+
+        self.assertEqual(405, response.status)
+
+
+class Test_UnionSite(unittest.TestCase):
+
+    def make_directory(self, *filenames):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for filename in filenames:
+            write_file(os.path.join(directory, filename), filename.encode())
+        return directory
+
+    def make_server(self, *filenames):
+        server = m.PackageServer()
+        server.directory = self.make_directory(*filenames)
+        return server
+
+    def setUp(self):
+        upstream = self.make_server('b-3.0.zip', 'c-1.0.zip')
+        self.upstream = start(self, upstream)
+        uncached_upstream = m.ProxyServer()
+        uncached_upstream.directory = None
+        uncached_upstream.upstream_url = url(self.upstream, '/simple/')
+
+        union = m.UnionServer()
+        union.members = [
+            self.make_server('a-1.0.zip'),
+            uncached_upstream,
+            self.make_server('a-2.0.zip', 'b-1.0.zip', 'd-1.0.zip'),
+        ]
+        self.httpd = start(self, union)
+
+    def test_index_lists_projects_of_directories(self):
+        _, body = request(self.httpd, '/simple/')
+
+        self.assertIn(b'"a/"', body)
+        self.assertIn(b'"d/"', body)
+
+    def test_project_from_first_member(self):
+        _, body = request(self.httpd, '/simple/a/')
+
+        self.assertIn(b'a-1.0.zip', body)
+        self.assertNotIn(b'a-2.0.zip', body)
+
+    def test_project_from_http_member(self):
+        _, body = request(self.httpd, '/simple/b/')
+
+        self.assertIn(url(self.upstream, '/packages/b-3.0.zip').encode(), body)
+        self.assertNotIn(b'b-1.0.zip', body)
+
+    def test_project_from_last_member(self):
+        _, body = request(self.httpd, '/simple/d/')
+
+        self.assertIn(b'../../packages/d-1.0.zip', body)
+
+    def test_unknown_project(self):
+        response, _ = request(self.httpd, '/simple/unknown/')
+
+        self.assertEqual(404, response.status)
+
+    def test_package_file_from_owner(self):
+        response, body = request(self.httpd, '/packages/d-1.0.zip')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'd-1.0.zip', body)
+
+    def test_shadowed_package_file(self):
+        response, _ = request(self.httpd, '/packages/a-2.0.zip')
+
+        self.assertEqual(404, response.status)
+
+    def test_unavailable_http_member_does_not_hide_others(self):
+        self.upstream.shutdown()
+        self.upstream.server_close()
+
+        response, body = request(self.httpd, '/simple/d/')
+
+        self.assertEqual(200, response.status)
+        self.assertIn(b'd-1.0.zip', body)
@@ -9,11 +9,14 @@ import unittest
 import mock
 from temp_dir import within_temp_dir
 import tempfile
+import threading
 
 import pyrene.shell as m
 from pyrene.util import Directory
-from pyrene.repos import Repo
-from pyrene.constants import REPOTYPE
+from pyrene.repos import Repo, HttpRepo, TwineUploader
+import pyrene.repos
+from pyrene.packages import Target
+from pyrene.constants import REPO, REPOTYPE
 from .util import capture_stdout, fake_stdin, Assertions, record_calls
 
 write_file = m.write_file
@@ -77,6 +80,8 @@ class Test_PyreneCmd(Assertions, fixtures.TestWithFixtures):
         self.repo1 = mock.Mock(spec_set=Repo)
         self.repo2 = mock.Mock(spec_set=Repo)
         self.somerepo = mock.Mock(spec_set=Repo)
+        for repo in (self.repo1, self.repo2, self.somerepo):
+            repo.get_copy_target.configure_mock(return_value=Target())
 
         self.home_dir = fixtures.TempHomeDir()
         self.useFixture(self.home_dir)
@@ -217,6 +222,238 @@ class Test_PyreneCmd(Assertions, fixtures.TestWithFixtures):
         )
         self.repo2.upload_packages.assert_called_once_with(list(package_files))
 
+    def test_copy_with_wheels(self):
+        self.define_repos('repo1', 'repo2')
+
+        self.cmd.onecmd('copy --wheels repo1:roman==2.0.0 repo2:')
+
+        self.repo1.download_packages.assert_called_once_with(
+            'roman==2.0.0',
+            self.directory,
+            wheels=True
+        )
+
+    def test_copy_with_sdists(self):
+        self.define_repos('repo1', 'repo2')
+
+        self.cmd.onecmd('copy repo1:roman==2.0.0 repo2: --sdists')
+
+        self.repo1.download_packages.assert_called_once_with(
+            'roman==2.0.0',
+            self.directory,
+            wheels=False
+        )
+
+    def test_copy_for_target(self):
+        self.define_repos('repo1', 'repo2')
+        target = Target('3.9', ['win_amd64'])
+        self.repo2.get_copy_target.configure_mock(return_value=target)
+
+        self.cmd.onecmd(
+            'copy --python-version=3.9 --platform win_amd64 repo1:a repo2:'
+        )
+
+        self.repo2.get_copy_target.assert_called_once_with(
+            python_version='3.9', platforms=['win_amd64']
+        )
+        self.repo1.download_packages.assert_called_once_with(
+            'a', self.directory, target=target
+        )
+
+    def test_copy_with_invalid_target(self):
+        self.define_repos('repo1', 'repo2')
+        self.repo2.get_copy_target.configure_mock(
+            side_effect=ValueError('Invalid python version x')
+        )
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('copy --python-version x repo1:a repo2:')
+            output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'Invalid python'))
+        self.assertEqual(0, self.repo1.download_packages.call_count)
+
+    @within_temp_dir
+    def test_copy_lockfile(self):
+        self.define_repos('repo1', 'repo2')
+        write_file('requirements.txt', b'a==1.0 --hash=sha256:aa\n')
+        self.repo1.download_locked.configure_mock(return_value=[])
+        self.directory.files = ['a-1.0.tar.gz']
+
+        self.cmd.onecmd('copy --wheels repo1:@requirements.txt repo2:')
+
+        (requirements, directory), kwargs = (
+            self.repo1.download_locked.call_args
+        )
+        self.assertEqual(['a==1.0'], list(map(str, requirements)))
+        self.assertEqual({'wheels': True}, kwargs)
+        self.assertEqual(0, self.repo1.download_packages.call_count)
+        self.repo2.upload_packages.assert_called_once_with(['a-1.0.tar.gz'])
+
+    @within_temp_dir
+    def test_copy_lockfile_without_hashes(self):
+        self.define_repos('repo1', 'repo2')
+        write_file('requirements.txt', b'a==1.0\n')
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('copy repo1:@requirements.txt repo2:')
+            output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'requirements.txt'))
+        self.assertEqual(0, self.repo1.download_locked.call_count)
+
+    def test_copy_with_unknown_option(self):
+        self.define_repos('repo1', 'repo2')
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('copy --eggs repo1:roman==2.0.0 repo2:')
+            output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', '--eggs'))
+        self.assertEqual(0, self.repo1.download_packages.call_count)
+
+    def test_copy_to_several_destinations(self):
+        self.define_repos('repo1', 'repo2', 'somerepo')
+        self.directory.files = ['a-1.0.tar.gz']
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('copy repo1:a repo2: somerepo:')
+            output = stdout.content
+
+        self.repo1.download_packages.assert_called_once_with(
+            'a', self.directory
+        )
+        self.repo2.upload_packages.assert_called_once_with(['a-1.0.tar.gz'])
+        self.somerepo.upload_packages.assert_called_once_with(
+            ['a-1.0.tar.gz']
+        )
+        self.assertIn('repo2: done', output)
+        self.assertIn('somerepo: done', output)
+
+    def test_copy_failing_destination_does_not_stop_others(self):
+        self.define_repos('repo1', 'repo2', 'somerepo')
+        self.directory.files = ['a-1.0.tar.gz']
+        self.repo2.upload_packages.side_effect = IOError('disk full')
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('copy repo1:a repo2: somerepo:')
+            output = stdout.content
+
+        self.somerepo.upload_packages.assert_called_once_with(
+            ['a-1.0.tar.gz']
+        )
+        self.assertContainsInOrder(output, ('ERROR: repo2: disk full',))
+        self.assertIn('somerepo: done', output)
+        self.directory.clear.assert_called_once_with()
+
+    @within_temp_dir
+    def test_copy_to_several_http_destinations(self):
+        destinations = []
+        for name in ('staging', 'prod'):
+            repo = HttpRepo(name, {
+                REPO.TYPE: REPOTYPE.HTTP,
+                REPO.UPLOAD_URL: 'https://{}/'.format(name),
+                REPO.USERNAME: 'user',
+                REPO.PASSWORD: 'password',
+            })
+            destinations.append(('{}:'.format(name), repo))
+        home = os.environ.get('HOME')
+        uploading = []
+        both_uploading = threading.Event()
+        pypircs = {}
+
+        def twine_upload(cmd, stdout, stderr, env):
+            # both uploads are in progress at the same time
+            uploading.append(cmd[2])
+            if len(uploading) == 2:
+                both_uploading.set()
+            both_uploading.wait(5)
+            with open(os.path.join(env['HOME'], '.pypirc')) as f:
+                pypircs[cmd[2]] = f.read()
+            return 0
+
+        with mock.patch.object(TwineUploader, 'HOME', os.getcwd()):
+            with mock.patch.object(
+                    pyrene.repos.subprocess, 'call',
+                    side_effect=twine_upload):
+                with capture_stdout() as stdout:
+                    self.cmd.upload_to_all(destinations, ['a-1.0.tar.gz'])
+                    output = stdout.content
+
+        self.assertNotIn('ERROR', output)
+        self.assertIn('https://staging/', pypircs['staging'])
+        self.assertIn('https://prod/', pypircs['prod'])
+        self.assertEqual(home, os.environ.get('HOME'))
+        # temporary HOMEs are removed
+        self.assertEqual([], os.listdir('.'))
+
+    def test_copy_requirements_file_to_several_destinations(self):
+        self.define_repos('repo1', 'repo2', 'somerepo')
+
+        with mock.patch.object(
+                m, 'read_requirements_file', return_value=['a', 'b']):
+            with capture_stdout():
+                self.cmd.onecmd('copy -r r.txt repo1: repo2: somerepo:')
+
+        self.repo1.download_requirements.assert_called_once_with(
+            ['a', 'b'], self.directory
+        )
+        self.assertEqual(1, self.somerepo.upload_packages.call_count)
+
+    def test_copy_to_destinations_with_different_targets(self):
+        self.define_repos('repo1', 'repo2', 'somerepo')
+        self.somerepo.get_copy_target.configure_mock(
+            return_value=Target('3.9')
+        )
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('copy repo1:a repo2: somerepo:')
+            output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'different targets'))
+        self.assertEqual(0, self.repo1.download_packages.call_count)
+
+    def test_copy_several_specs(self):
+        self.define_repos('repo1', 'repo2')
+        self.directory.files = ['a-1.0.tar.gz', 'b-1.0.tar.gz']
+
+        self.cmd.onecmd('copy repo1:a repo1:b>=1.0 repo2:')
+
+        self.repo1.download_requirements.assert_called_once_with(
+            ['a', 'b>=1.0'], self.directory
+        )
+        self.repo2.upload_packages.assert_called_once_with(
+            ['a-1.0.tar.gz', 'b-1.0.tar.gz']
+        )
+
+    @within_temp_dir
+    def test_copy_requirements_file(self):
+        self.define_repos('repo1', 'repo2')
+        write_file('requirements.txt', b'a\nb>=1.0\n')
+
+        self.cmd.onecmd('copy -r requirements.txt repo1: repo2:')
+
+        self.repo1.download_requirements.assert_called_once_with(
+            ['a', 'b>=1.0'], self.directory
+        )
+
+    def test_copy_from_several_repos(self):
+        self.define_repos('repo1', 'repo2', 'somerepo')
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('copy repo1:a repo2:b somerepo:')
+            output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'same repository'))
+        self.assertEqual(0, self.somerepo.upload_packages.call_count)
+
+    def test_copy_without_destination(self):
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('copy repo1:a')
+            output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'DESTINATION'))
+
     def test_copy_uploads_files(self):
         self.define_repos('somerepo')
         self.cmd.onecmd('copy /a/file somerepo:')
@@ -250,6 +487,91 @@ class Test_PyreneCmd(Assertions, fixtures.TestWithFixtures):
         self.assertContainsInOrder(output, ('ERROR:', 'unknown'))
         self.assertEqual(0, self.somerepo.upload_packages.call_count)
 
+    def test_dependents(self):
+        self.define_repos('repo1')
+        self.repo1.get_dependents.configure_mock(
+            return_value=[('a-1.0.tar.gz', 'b>=1')]
+        )
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('dependents repo1:b')
+            output = stdout.content
+
+        self.repo1.get_dependents.assert_called_once_with('b')
+        self.assertIn('a-1.0.tar.gz: b>=1', output)
+
+    def test_dependents_of_repo_not_knowing_them(self):
+        self.define_repos('repo1')
+        self.repo1.get_dependents.configure_mock(
+            side_effect=NotImplementedError
+        )
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('dependents repo1:b')
+            output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'repo1'))
+
+    def test_dependents_requires_project(self):
+        self.define_repos('repo1')
+
+        with capture_stdout() as stdout:
+            self.cmd.onecmd('dependents repo1')
+            output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'REPO:PROJECT'))
+        self.assertEqual(0, self.repo1.get_dependents.call_count)
+
+    def test_mirror(self):
+        self.define_repos('repo1', 'repo2')
+
+        with mock.patch.object(m, 'Checkpoint') as checkpoint:
+            with mock.patch.object(
+                    m, 'mirror', return_value=(3, 0)) as mirror:
+                self.cmd.onecmd('mirror repo1: repo2:')
+
+        checkpoint.of.assert_called_once_with(self.repo1, self.repo2)
+        mirror.assert_called_once_with(
+            self.repo1, self.repo2, self.directory,
+            checkpoint.of.return_value, rescan=False
+        )
+
+    def test_mirror_rescan_and_failures(self):
+        self.define_repos('repo1', 'repo2')
+
+        with mock.patch.object(m, 'Checkpoint'):
+            with mock.patch.object(
+                    m, 'mirror', return_value=(3, 2)) as mirror:
+                with capture_stdout() as stdout:
+                    self.cmd.onecmd('mirror --rescan repo1: repo2:')
+                    output = stdout.content
+
+        self.assertTrue(mirror.call_args[1]['rescan'])
+        self.assertContainsInOrder(output, ('ERROR:', '2 files not copied'))
+
+    def test_mirror_requires_two_repos(self):
+        self.define_repos('repo1', 'repo2')
+
+        with mock.patch.object(m, 'mirror') as mirror:
+            with capture_stdout() as stdout:
+                self.cmd.onecmd('mirror repo1:a repo2:')
+                output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'DESTINATION:'))
+        self.assertEqual(0, mirror.call_count)
+
+    def test_mirror_of_repo_not_listing_files(self):
+        self.define_repos('repo1', 'repo2')
+
+        with mock.patch.object(m, 'Checkpoint'):
+            with mock.patch.object(
+                    m, 'mirror', side_effect=NotImplementedError):
+                with capture_stdout() as stdout:
+                    self.cmd.onecmd('mirror repo1: repo2:')
+                    output = stdout.content
+
+        self.assertContainsInOrder(output, ('ERROR:', 'repo1:'))
+
     def test_get_destination_repo_on_repo1(self):
         self.define_repos('repo1')
         repo = self.cmd._get_destination_repo('repo1:')
@@ -347,6 +669,19 @@ class Test_PyreneCmd(Assertions, fixtures.TestWithFixtures):
         self.assertEqual(REPOTYPE.DIRECTORY, repo.type)
         self.assertEqual('somevalue', repo.attr)
 
+    def test_union_repo_defines_new_repo(self):
+        run_script(
+            self.cmd,
+            '''
+            union_repo new-repo
+            set repos=a,b
+            '''
+        )
+
+        repo = self.network.get_repo('new-repo')
+        self.assertEqual(REPOTYPE.UNION, repo.type)
+        self.assertEqual('a,b', repo.repos)
+
     def test_forget(self):
         self.network.define('somerepo')
 
@@ -542,6 +877,23 @@ class Test_PyreneCmd(Assertions, fixtures.TestWithFixtures):
 
         self.repo1.serve.assert_called_once_with()
 
+    def test_serve_several_repos(self):
+        self.define_repos('repo1', 'repo2')
+
+        with mock.patch.object(m, 'serve_repos') as serve_repos:
+            self.cmd.onecmd('serve repo1 repo2')
+
+        serve_repos.assert_called_once_with([self.repo1, self.repo2])
+
+    def test_serve_several_repos_with_unknown_repo(self):
+        self.define_repos('repo1')
+
+        with mock.patch.object(m, 'serve_repos') as serve_repos:
+            output = run_script(self.cmd, 'serve repo1 unknown')
+
+        self.assertContainsInOrder(output, ('ERROR:', 'unknown'))
+        self.assertEqual(0, serve_repos.call_count)
+
     def test_network_reload_called_before_every_command_in_the_loop(self):
         calls = []
         self.network.reload = record_calls(calls, self.network.reload)
@@ -0,0 +1,260 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import pyrene.simple as m
+
+
+URL = 'http://example.com/simple/a/'
+
+HTML = b'''\
+<a href="../../packages/a-1.0.tar.gz#sha256=abc"
+   data-requires-python="&gt;=3">a-1.0.tar.gz</a>
+'''
+
+JSON = b'''\
+{"meta": {"api-version": "1.1"}, "name": "a", "files": [
+ {"filename": "a-1.0.tar.gz", "url": "../../packages/a-1.0.tar.gz",
+  "hashes": {"sha256": "abc"}, "requires-python": ">=3"}
+]}
+'''
+
+
+def response(body, content_type):
+    return m.Response(200, {'Content-Type': content_type}, body)
+
+
+class Test_parse_project_page(unittest.TestCase):
+
+    def check(self, links):
+        self.assertEqual(1, len(links))
+        link = links[0]
+        self.assertEqual(
+            'http://example.com/packages/a-1.0.tar.gz', link.url
+        )
+        self.assertEqual('a-1.0.tar.gz', link.filename)
+        self.assertEqual({'sha256': 'abc'}, link.hashes)
+        self.assertEqual('>=3', link.requires_python)
+
+    def test_json(self):
+        self.check(m.parse_project_page(response(JSON, m.SIMPLE_JSON), URL))
+
+    def test_html(self):
+        self.check(
+            m.parse_project_page(response(HTML, 'text/html'), URL)
+        )
+
+    def test_malformed_json(self):
+        with self.assertRaises(ValueError):
+            m.parse_project_page(response(b'{"files": 1', m.SIMPLE_JSON), URL)
+
+    def test_unsupported_api_version(self):
+        body = b'{"meta": {"api-version": "2.0"}, "files": []}'
+
+        with self.assertRaises(ValueError):
+            m.parse_project_page(response(body, m.SIMPLE_JSON), URL)
+
+
+class Test_parse_index_page(unittest.TestCase):
+
+    def test_json(self):
+        body = b'{"meta": {"api-version": "1.0"}, "projects": [{"name": "A"}]}'
+
+        self.assertEqual(
+            ['A'],
+            m.parse_index_page(response(body, m.SIMPLE_JSON), URL)
+        )
+
+    def test_html(self):
+        body = b'<a href="a/">a</a>'
+
+        self.assertEqual(
+            ['a'], m.parse_index_page(response(body, 'text/html'), URL)
+        )
+
+
+def chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class Test_iter_links(unittest.TestCase):
+
+    def check(self, body, is_json):
+        for size in (1, 7, 1000):
+            links = list(m.iter_links(chunked(body, size), URL, is_json))
+
+            self.assertEqual(
+                ['a-1.0.tar.gz'], [link.filename for link in links]
+            )
+            self.assertEqual({'sha256': 'abc'}, links[0].hashes)
+            self.assertEqual('>=3', links[0].requires_python)
+
+    def test_json(self):
+        self.check(JSON, is_json=True)
+
+    def test_html(self):
+        self.check(HTML, is_json=False)
+
+    def test_links_are_yielded_as_chunks_arrive(self):
+        data = {
+            'meta': {'api-version': '1.0'},
+            'files': [
+                {'filename': name, 'url': name, 'hashes': {}}
+                for name in ('a-1.0.tar.gz', 'a-2.0.tar.gz')
+            ],
+        }
+        body = json.dumps(data).encode('utf8')
+        fed = []
+
+        def chunks():
+            for chunk in chunked(body, 10):
+                fed.append(chunk)
+                yield chunk
+        links = m.iter_links(chunks(), URL, is_json=True)
+
+        self.assertEqual('a-1.0.tar.gz', next(links).filename)
+        self.assertLess(len(b''.join(fed)), len(body))
+
+    def test_empty_json_page(self):
+        body = b'{"files": [], "meta": {"api-version": "1.0"}, "x": 12}'
+
+        self.assertEqual([], list(m.iter_links(chunked(body, 1), URL, True)))
+
+    def test_truncated_json(self):
+        with self.assertRaises(ValueError):
+            list(m.iter_links([JSON[:-5]], URL, is_json=True))
+
+    def test_malformed_json(self):
+        with self.assertRaises(ValueError):
+            list(m.iter_links([b'{"files": {}}'], URL, is_json=True))
+
+
+class Test_URLJoiner(unittest.TestCase):
+
+    def test_same_as_urljoin(self):
+        joiner = m.URLJoiner(URL)
+        for href in (
+                '../../packages/a.tar.gz#sha256=1', 'a.tar.gz', '/p/a.whl',
+                '//host/a.whl', 'https://host/a.whl', '..', 'x/./a', '?q'):
+            self.assertEqual(m.urljoin(URL, href), joiner.join(href))
+
+
+class Test_IndexReader(unittest.TestCase):
+
+    def setUp(self):
+        self.responses = {}
+        self.reads = []
+        self.reader = m.IndexReader(
+            'http://example.com/simple/', self.open
+        )
+
+    def open(self, url, headers):
+        self.assertEqual(m.ACCEPT, headers['Accept'])
+        response = self.responses.get(url, m.Response(404, {}, b''))
+        reads = self.reads
+
+        class Body(io.BytesIO):
+            def read(self, size=-1):
+                data = io.BytesIO.read(self, min(size, 50))
+                reads.append(data)
+                return data
+        return m.StreamingResponse(
+            response.status, response.headers, Body(response.body)
+        )
+
+    def test_get_links(self):
+        self.responses[URL] = response(JSON, m.SIMPLE_JSON)
+
+        links = self.reader.get_links('A')
+
+        self.assertEqual(['a-1.0.tar.gz'], [link.filename for link in links])
+
+    def test_unknown_project(self):
+        self.assertIsNone(self.reader.get_links('unknown'))
+        self.assertEqual([], list(self.reader.iter_links('unknown')))
+
+    def test_server_error(self):
+        self.responses[URL] = m.Response(500, {}, b'')
+
+        with self.assertRaises(IOError):
+            self.reader.get_links('a')
+
+    def test_find_link_stops_reading(self):
+        body = b''.join(
+            '<a href="a-{}.tar.gz">x</a>\n'.format(i).encode('utf8')
+            for i in range(100)
+        )
+        self.responses[URL] = response(body, 'text/html')
+
+        link = self.reader.find_link(
+            'a', lambda link: link.filename == 'a-3.tar.gz'
+        )
+
+        self.assertEqual('a-3.tar.gz', link.filename)
+        self.assertLess(len(b''.join(self.reads)), len(body))
+
+    def test_get_project_names(self):
+        self.responses['http://example.com/simple/'] = response(
+            b'<a href="a/">a</a>', 'text/html'
+        )
+
+        self.assertEqual(['a'], self.reader.get_project_names())
+
+
+class Test_download(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'a-1.0.tar.gz')
+
+    def download(self, digest):
+        link = m.Link(
+            'http://example.com/a-1.0.tar.gz#sha256=' + digest
+        )
+        m.download(link, self.path, lambda url: io.BytesIO(b'content'))
+
+    def test_verified(self):
+        self.download(hashlib.sha256(b'content').hexdigest())
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(b'content', f.read())
+
+    def test_hash_mismatch(self):
+        with self.assertRaises(IOError):
+            self.download(hashlib.sha256(b'other').hexdigest())
+
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_allowed_hashes(self):
+        link = m.Link('http://example.com/a-1.0.tar.gz')
+        digests = {
+            hashlib.sha256(content).hexdigest()
+            for content in (b'content', b'other')
+        }
+
+        m.download(
+            link, self.path, lambda url: io.BytesIO(b'content'),
+            allowed_hashes={'sha256': digests}
+        )
+
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_hash_not_allowed(self):
+        link = m.Link('http://example.com/a-1.0.tar.gz')
+
+        with self.assertRaises(IOError):
+            m.download(
+                link, self.path, lambda url: io.BytesIO(b'content'),
+                allowed_hashes={'sha256': {'0' * 64}}
+            )
+
+        self.assertEqual([], os.listdir(self.directory))
@@ -6,6 +6,8 @@ import pyrene.util as m
 from .util import capture_stdout
 import unittest
 
+import binascii
+import hashlib
 import os
 import subprocess
 import mock
@@ -151,6 +153,90 @@ class Test_PyPI(unittest.TestCase):
         self.server.serve()
         self.assertNotIn('--passwords', self.executed_cmd)
 
+    @within_temp_dir
+    def test_serve_with_persisted_htpasswd(self):
+        self.server.add_user('u', 'p')
+        self.server.htpasswd_path = 'htpasswd'
+        self.server.serve()
+        self.assertIn('htpasswd', self.executed_cmd)
+        self.assertTrue(HtpasswdFile('htpasswd').check_password('u', 'p'))
+
+
+class Test_make_htpasswd(unittest.TestCase):
+
+    USERS = {'user': 'secret'}
+
+    @within_temp_dir
+    def test_passwords_are_hashed(self):
+        ht = m.make_htpasswd('htpasswd', self.USERS)
+
+        self.assertTrue(ht.check_password('user', 'secret'))
+        self.assertTrue(
+            HtpasswdFile('htpasswd').check_password('user', 'secret')
+        )
+        self.assertNotIn('secret', m.read_file('htpasswd'))
+        self.assertEqual(0o600, os.stat('htpasswd').st_mode & 0o777)
+
+    @within_temp_dir
+    def test_file_is_reused_for_same_users(self):
+        m.make_htpasswd('htpasswd', self.USERS)
+        content = m.read_file('htpasswd')
+
+        with mock.patch.object(m.HtpasswdFile, 'set_password') as hashing:
+            ht = m.make_htpasswd('htpasswd', self.USERS)
+
+        self.assertFalse(hashing.called)
+        self.assertEqual(content, m.read_file('htpasswd'))
+        self.assertTrue(ht.check_password('user', 'secret'))
+
+    @within_temp_dir
+    def test_file_is_remade_for_changed_password(self):
+        m.make_htpasswd('htpasswd', self.USERS)
+
+        ht = m.make_htpasswd('htpasswd', {'user': 'changed'})
+
+        self.assertTrue(ht.check_password('user', 'changed'))
+        self.assertFalse(ht.check_password('user', 'secret'))
+
+    def test_fingerprint_is_a_slow_hash(self):
+        fingerprint = m.users_fingerprint(self.USERS, 'salt')
+
+        salt, _, digest = fingerprint.partition('$')
+        self.assertEqual('salt', salt)
+        self.assertEqual(
+            hashlib.pbkdf2_hmac(
+                'sha256', b'\0user\0secret', b'salt',
+                m.FINGERPRINT_ITERATIONS
+            ),
+            binascii.unhexlify(digest)
+        )
+        self.assertGreaterEqual(m.FINGERPRINT_ITERATIONS, 100000)
+
+    @within_temp_dir
+    def test_file_with_fast_hash_fingerprint_is_remade(self):
+        m.make_htpasswd('htpasswd', {'user': 'other'})
+        fast = hashlib.sha256(b'salt\0user\0secret').hexdigest()
+        lines = m.read_file('htpasswd').splitlines(True)
+        m.write_file(
+            'htpasswd',
+            (m.HTPASSWD_FINGERPRINT + 'salt$' + fast + '\n').encode('utf8')
+            + ''.join(lines[1:]).encode('utf8')
+        )
+
+        ht = m.make_htpasswd('htpasswd', self.USERS)
+
+        self.assertTrue(ht.check_password('user', 'secret'))
+
+    @within_temp_dir
+    def test_file_without_fingerprint_is_remade(self):
+        ht = HtpasswdFile('htpasswd', new=True)
+        ht.set_password('user', 'other')
+        ht.save()
+
+        ht = m.make_htpasswd('htpasswd', self.USERS)
+
+        self.assertTrue(ht.check_password('user', 'secret'))
+
 
 class Test_create_md5_backup(unittest.TestCase):
 
@@ -0,0 +1,108 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+import os
+from temp_dir import within_temp_dir
+
+import pyrene.wheelhouse as m
+from pyrene.util import write_file
+
+
+def fake_pip_wheel(*args):
+    wheel_dir = args[args.index('--wheel-dir') + 1]
+    name, _, version = os.path.basename(args[-1]).partition('-')
+    version = version[:-len('.tar.gz')]
+    wheel = '{}-{}-py3-none-any.whl'.format(name, version)
+    write_file(os.path.join(wheel_dir, wheel), b'wheel')
+    return 0, 'built'
+
+
+def failing_pip_wheel(*args):
+    return 1, 'error: no compiler'
+
+
+class Test_build_wheel(unittest.TestCase):
+
+    @within_temp_dir
+    def test_wheel_is_put_into_directory(self):
+        os.mkdir('repo')
+
+        filename = m.build_wheel(
+            'a-1.0.tar.gz', 'repo', pip_wheel=fake_pip_wheel
+        )
+
+        self.assertEqual('a-1.0-py3-none-any.whl', filename)
+        self.assertEqual(['a-1.0-py3-none-any.whl'], os.listdir('repo'))
+
+    @within_temp_dir
+    def test_existing_wheel_is_not_replaced(self):
+        os.mkdir('repo')
+        write_file('repo/a-1.0-py3-none-any.whl', b'uploaded')
+
+        filename = m.build_wheel(
+            'a-1.0.tar.gz', 'repo', pip_wheel=fake_pip_wheel
+        )
+
+        self.assertIsNone(filename)
+        self.assertEqual(
+            b'uploaded', open('repo/a-1.0-py3-none-any.whl', 'rb').read()
+        )
+        self.assertEqual(['a-1.0-py3-none-any.whl'], os.listdir('repo'))
+
+    @within_temp_dir
+    def test_failure(self):
+        os.mkdir('repo')
+
+        with self.assertRaises(m.BuildError) as cm:
+            m.build_wheel('a-1.0.tar.gz', 'repo', pip_wheel=failing_pip_wheel)
+
+        self.assertIn('no compiler', str(cm.exception))
+        self.assertEqual([], os.listdir('repo'))
+
+
+class Test_WheelBuilder(unittest.TestCase):
+
+    def build(self, sdist_path, directory):
+        self.built.append(os.path.basename(sdist_path))
+        if 'bad' in sdist_path:
+            raise m.BuildError(os.path.basename(sdist_path), 'failed')
+        return m.build_wheel(sdist_path, directory, pip_wheel=fake_pip_wheel)
+
+    @within_temp_dir
+    def test_sdists_are_built(self):
+        self.built = []
+        os.mkdir('repo')
+        write_file('repo/b-2.0-py3-none-any.whl', b'')
+        builder = m.WheelBuilder('repo', workers=2, build=self.build)
+
+        for filename in (
+                'a-1.0.tar.gz', 'b-2.0.tar.gz', 'c-1.0-py3-none-any.whl',
+                'bad-1.0.tar.gz'):
+            builder.add(os.path.join('repo', filename))
+        wheels, errors = builder.wait()
+
+        self.assertEqual(
+            ['a-1.0.tar.gz', 'bad-1.0.tar.gz'], sorted(self.built)
+        )
+        self.assertEqual(['a-1.0-py3-none-any.whl'], wheels)
+        self.assertEqual(['bad-1.0.tar.gz'], [e.sdist for e in errors])
+        self.assertTrue(os.path.exists('repo/a-1.0-py3-none-any.whl'))
+
+    @within_temp_dir
+    def test_wheels_uploaded_later_are_seen(self):
+        self.built = []
+        os.mkdir('repo')
+        builder = m.WheelBuilder('repo', workers=1, build=self.build)
+
+        builder.add('repo/a-1.0.tar.gz')
+        write_file('repo/b-2.0-py3-none-any.whl', b'')
+        builder.add('repo/b-2.0.tar.gz')
+        wheels, errors = builder.wait()
+
+        self.assertEqual(['a-1.0.tar.gz'], self.built)
+        self.assertEqual(['a-1.0-py3-none-any.whl'], wheels)
+
+    def test_nothing_to_wait_for(self):
+        self.assertEqual(([], []), m.WheelBuilder('repo').wait())
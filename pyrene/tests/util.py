@@ -1,4 +1,8 @@
+import io
+import os
+import tarfile
 import tempfile
+import zipfile
 import sys
 import contextlib
 from io import StringIO
@@ -94,3 +98,23 @@ class Assertions(object):
                 )
             )
             raise AssertionError(msg)
+
+
+def make_wheel(path, metadata):
+    '''Write a minimal wheel with the given METADATA content (bytes)'''
+    name, version = os.path.basename(path).split('-')[:2]
+    dist_info = '{}-{}.dist-info/'.format(name, version)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as wheel:
+        wheel.writestr(name + '/__init__.py', b'')
+        wheel.writestr(dist_info + 'METADATA', metadata)
+        wheel.writestr(dist_info + 'RECORD', b'')
+
+
+def make_sdist(path, members):
+    '''Write a .tar.gz with members: {name within the top directory: bytes}'''
+    top = os.path.basename(path)[:-len('.tar.gz')]
+    with tarfile.open(path, 'w:gz') as sdist:
+        for name, content in sorted(members.items()):
+            info = tarfile.TarInfo('{}/{}'.format(top, name))
+            info.size = len(content)
+            sdist.addfile(info, io.BytesIO(content))
@@ -2,8 +2,10 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import binascii
 import hashlib
 import shutil
+import tempfile
 import os
 import sys
 import subprocess
@@ -59,6 +61,84 @@ def pip_install(*args):
         subprocess.call(cmd, stdout=sys.stdout, stderr=sys.stderr)
 
 
+def pip_wheel(*args):
+    '''
+    Run pip wheel ... with its output captured, so that several can run.
+
+    Explicitly ignores user's config. Returns (exit status, output).
+    '''
+    pip_cmd = os.path.join(os.path.dirname(sys.executable), 'pip')
+    env = dict(os.environ, PIP_CONFIG_FILE=os.devnull)
+    process = subprocess.Popen(
+        [pip_cmd, 'wheel'] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env
+    )
+    output, _ = process.communicate()
+    return process.returncode, output.decode('utf8', 'replace')
+
+
+HTPASSWD_FILE = '.pyrene-htpasswd'
+HTPASSWD_FINGERPRINT = '# pyrene users: '
+# the fingerprint is stored in the clear, so it is as slow to brute-force
+# as the password hashes themselves
+FINGERPRINT_ITERATIONS = 200000
+
+
+def users_fingerprint(users, salt):
+    secret = ''.join(
+        '\0{}\0{}'.format(username, password)
+        for username, password in sorted(users.items())
+    )
+    digest = hashlib.pbkdf2_hmac(
+        'sha256', secret.encode('utf8'), salt.encode('utf8'),
+        FINGERPRINT_ITERATIONS
+    )
+    return '{}${}'.format(salt, binascii.hexlify(digest).decode('ascii'))
+
+
+def make_htpasswd(path, users):
+    '''
+    Write an htpasswd file of users (username -> password) to path.
+
+    Hashing passwords is slow by design, so an existing file is reused
+    when it was made for the same users (see the fingerprint comment in
+    its first line).
+    Returns the HtpasswdFile.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            first_line = f.readline().decode('utf8').rstrip('\n')
+    except IOError:
+        first_line = ''
+    if first_line.startswith(HTPASSWD_FINGERPRINT):
+        fingerprint = first_line[len(HTPASSWD_FINGERPRINT):]
+        salt = fingerprint.partition('$')[0]
+        if fingerprint == users_fingerprint(users, salt):
+            return HtpasswdFile(path=path)
+
+    ht = HtpasswdFile()
+    for username, password in users.items():
+        ht.set_password(username, password)
+    header = HTPASSWD_FINGERPRINT + users_fingerprint(
+        users, hashlib.sha1(os.urandom(16)).hexdigest()[:16]
+    ) + '\n'
+    content = header.encode('utf8') + ht.to_string()
+
+    # replace atomically, readable only by the owner
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path)
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        os.remove(temp_path)
+        raise
+    return HtpasswdFile(path=path)
+
+
 class PyPI(object):
 
     def __init__(self):
@@ -67,34 +147,39 @@ class PyPI(object):
         self.interface = '0.0.0.0'
         self.port = '8080'
         self.users = {}
+        # persisted htpasswd file, a temporary one is used if None
+        self.htpasswd_path = None
 
     def add_user(self, username, password):
         self.users[username] = password
 
     def make_htpasswd(self, filename):
-        ht = HtpasswdFile(path=filename, new=True)
-        for username, password in self.users.items():
-            ht.set_password(username, password)
-        ht.save()
+        make_htpasswd(filename, self.users)
 
     def serve(self):
+        if self.htpasswd_path:
+            self.make_htpasswd(self.htpasswd_path)
+            self.run(self.htpasswd_path)
+        else:
+            with NamedTemporaryFile() as password_file:
+                self.make_htpasswd(password_file.name)
+                self.run(password_file.name)
+
+    def run(self, password_file):
         pypi_srv = os.path.join(os.path.dirname(sys.executable), 'pypi-server')
-        with NamedTemporaryFile() as password_file:
-            self.make_htpasswd(password_file.name)
-
-            cmd = [
-                pypi_srv,
-                '--interface', self.interface,
-                '--port', self.port,
-            ] + (
-                ['--passwords', password_file.name] if self.users else []
-            ) + [
-                '--disable-fallback',
-            ] + (
-                ['--overwrite'] if self.volatile else []
-            ) + [self.directory]
-
-            self.execute(cmd)
+        cmd = [
+            pypi_srv,
+            '--interface', self.interface,
+            '--port', self.port,
+        ] + (
+            ['--passwords', password_file] if self.users else []
+        ) + [
+            '--disable-fallback',
+        ] + (
+            ['--overwrite'] if self.volatile else []
+        ) + [self.directory]
+
+        self.execute(cmd)
 
     def execute(self, cmd):
         print_command(cmd)
@@ -0,0 +1,150 @@
+# Py3 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Building wheels of the sdists copied into a directory repo.
+#
+# Every sdist is built by its own `pip wheel` process as soon as it is
+# uploaded, several at a time, and the wheels are stored next to the sdists,
+# so installs from the repo are mere unpacks. The work is done by the pip
+# processes, so they are driven from a thread pool, not a process pool.
+
+import errno
+import multiprocessing
+import os
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from .packages import parse_filename, normalize_name, versions_equal
+from .packages import SDIST_EXTENSIONS, WHEEL_EXTENSION
+from .util import pip_wheel
+
+
+def default_workers():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 2
+
+
+class BuildError(Exception):
+
+    def __init__(self, sdist, output):
+        super(BuildError, self).__init__(sdist, output)
+        self.sdist = sdist
+        self.output = output
+
+    def __str__(self):
+        return 'Could not build a wheel of {}:\n{}'.format(
+            self.sdist, self.output
+        )
+
+
+def build_wheel(sdist_path, directory, pip_wheel=pip_wheel):
+    '''
+    Build the wheel of sdist_path into directory.
+
+    The wheel appears there only when complete, and never replaces a file
+    already there (e.g. an uploaded wheel). Returns its filename, None if
+    it was already there, raises BuildError.
+    '''
+    build_directory = tempfile.mkdtemp(prefix='.pyrene-wheel-', dir=directory)
+    try:
+        status, output = pip_wheel(
+            '--no-deps', '--wheel-dir', build_directory, sdist_path
+        )
+        wheels = [
+            filename for filename in os.listdir(build_directory)
+            if filename.endswith(WHEEL_EXTENSION)
+        ]
+        if status != 0 or len(wheels) != 1:
+            raise BuildError(os.path.basename(sdist_path), output)
+        try:
+            os.link(
+                os.path.join(build_directory, wheels[0]),
+                os.path.join(directory, wheels[0])
+            )
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            return None
+        return wheels[0]
+    finally:
+        shutil.rmtree(build_directory, ignore_errors=True)
+
+
+class WheelBuilder(object):
+
+    '''
+    Builds wheels of sdists put into directory, in the background.
+
+    Sdists of releases having a wheel in directory when their build starts
+    are skipped.
+    '''
+
+    def __init__(self, directory, workers=None, build=build_wheel):
+        self.directory = directory
+        self.workers = workers or default_workers()
+        self.build = build
+        self.pool = None
+        self.pending = []
+
+    def has_wheel(self, name, version):
+        # listed every time: wheels may be uploaded while building others
+        releases = [
+            parse_filename(filename)
+            for filename in os.listdir(self.directory)
+            if filename.lower().endswith(WHEEL_EXTENSION)
+        ]
+        return any(
+            normalize_name(wheel_name) == normalize_name(name)
+            and versions_equal(wheel_version, version)
+            for wheel_name, wheel_version in filter(None, releases)
+        )
+
+    def _build(self, sdist_path, name, version):
+        '''Filename of the wheel built, None if the release has one'''
+        if self.has_wheel(name, version):
+            return None
+        return self.build(sdist_path, self.directory)
+
+    def add(self, sdist_path):
+        '''Start building the wheel of sdist_path if it is an sdist'''
+        filename = os.path.basename(sdist_path)
+        if not filename.lower().endswith(SDIST_EXTENSIONS):
+            return
+        parsed = parse_filename(filename)
+        if not parsed:
+            return
+        if self.pool is None:
+            self.pool = ThreadPool(self.workers)
+        self.pending.append(
+            (filename, self.pool.apply_async(
+                self._build, (sdist_path,) + tuple(parsed)
+            ))
+        )
+
+    def wait(self):
+        '''
+        Wait for the builds.
+
+        Returns (filenames of the built wheels, BuildErrors).
+        '''
+        wheels = []
+        errors = []
+        for filename, result in self.pending:
+            try:
+                wheel = result.get()
+                if wheel is not None:
+                    wheels.append(wheel)
+            except BuildError as e:
+                errors.append(e)
+            except (IOError, OSError) as e:
+                errors.append(BuildError(filename, str(e)))
+        self.pending = []
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        return wheels, errors